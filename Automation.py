@@ -2,13 +2,16 @@ import imapclient
 import pyzmail
 from datetime import date
 import time
-import threading
+import asyncio
 import json
 import os
 from bs4 import BeautifulSoup
 from ai_part import AiChat
 from Live2DViewerEX import L2DVEX
 from message_utils import MessageUtils
+from resource_governor import GOVERNOR
+from priority_scheduler import SCHEDULER, BACKGROUND
+from job_scheduler import JOBS, Job
 from control import WindowsControl
 
 
@@ -225,12 +228,15 @@ class EmailUtils:
         self.uids_seen.clear()  # 清空已处理的邮件记录
 
 
-class EmailMonitorThread(threading.Thread):
-    """邮箱监听线程类"""
+class EmailMonitor:
+    """邮箱监听（作为周期任务运行在异步调度核心上，阻塞的IMAP调用在其线程池中执行）"""
+
+    # 检查各邮箱是否到期的间隔（秒）
+    POLL_INTERVAL = 30
     
     def __init__(self, email_data_file: str, check_interval: int, app=None, vector_db=None):
         """
-        初始化邮箱监听线程
+        初始化邮箱监听
         
         Args:
             email_data_file: 邮箱配置文件路径
@@ -238,11 +244,11 @@ class EmailMonitorThread(threading.Thread):
             app: 主应用程序实例
             vector_db: 向量数据库实例
         """
-        super().__init__(daemon=True)
         self.email_data_file = email_data_file
         self.check_interval = check_interval
         self.email_monitors = []
-        self.running = True
+        self.core = None
+        self._registered = False
         self.app = app
         self.vector_db = vector_db        #读取config.json
         try:
@@ -311,8 +317,6 @@ class EmailMonitorThread(threading.Thread):
         if not emails:
             return
         
-        print(f"[info]邮箱 {email_account} 收到 {len(emails)} 封新邮件")
-        
         # 这里可以添加更多的邮件处理逻辑
         for email in emails:
             sender = email['from'][0][1] if email['from'] else "未知发件人"
@@ -336,7 +340,7 @@ class EmailMonitorThread(threading.Thread):
                 # 使用修复后的general_summary方法
                 from ai_part import AiChat
                 ai_chat = AiChat()
-                summary = ai_chat.general_summary(summary_prompt)
+                summary = ai_chat.general_summary(summary_prompt, feature="email_summary")
                 print(f"[info]邮件摘要生成成功")
                 
             except Exception as ai_error:
@@ -353,7 +357,11 @@ class EmailMonitorThread(threading.Thread):
             if self.vector_db:
                 try:
                     mu = MessageUtils(self.vector_db, self.app)
-                    mu.save_message("assistant", email_summary_content)
+                    # 邮件批量到达时按后台任务限制嵌入计算的线程数
+                    with GOVERNOR.background():
+                        # 邮件摘要在记忆检索中的权重低于对话
+                        mu.save_message("assistant", email_summary_content,
+                                        importance=mu.config.get("memory_importance_email", 0.6))
                     print(f"[info]邮件摘要已保存到消息历史和向量数据库")
                 except Exception as e:
                     print(f"[error]保存邮件摘要失败: {e}")
@@ -406,59 +414,60 @@ class EmailMonitorThread(threading.Thread):
             # 添加到聊天窗口（如果聊天窗口存在）
             if self.app and hasattr(self.app, 'chat_window') and self.app.chat_window:
                 try:
-                    # 使用Qt的信号槽机制安全地在主线程中更新UI
-                    from PyQt5.QtCore import QTimer
-                    
-                    def add_to_chat():
+                    def add_to_chat(content=email_summary_content):
                         if self.app.chat_window.isVisible():
-                            self.app.chat_window.add_message(email_summary_content, is_user=False)
+                            self.app.chat_window.add_message(content, is_user=False)
                     
                     # 在主线程中执行UI更新
-                    QTimer.singleShot(0, add_to_chat)
+                    self.core.call_in_ui(add_to_chat)
                     print(f"[info]邮件摘要已添加到聊天窗口")
                 except Exception as e:
                     print(f"[error]添加邮件摘要到聊天窗口失败: {e}")
 
 
-    def run(self):
-        """邮箱监听主循环"""
-        print("[info]邮箱监听线程启动")
-        
-        # 加载邮箱配置
+    def start(self, core):
+        """加载邮箱配置并注册周期检查任务（用户正在对话时跳过本次检查）"""
+        self.core = core
         self.email_monitors = self.load_email_configs()
         
         if not self.email_monitors:
-            print("[warning]没有可用的邮箱配置，邮箱监听线程退出")
-            return
+            print("[warning]没有可用的邮箱配置，邮箱监听未启动")
+            return False
         
         print(f"[info]开始监听 {len(self.email_monitors)} 个邮箱账户")
-        
-        while self.running:
-            try:
-                current_time = time.time()
-                
-                for monitor in self.email_monitors:
-                    # 检查是否到了检查时间
-                    if current_time - monitor['last_check'] >= self.check_interval:
-                        try:
-                            emails = monitor['utils'].get_today_unread_emails()
-                            if emails:
-                                self.handle_new_emails(emails, monitor['email'])
-                            monitor['last_check'] = current_time
-                        except Exception as e:
-                            print(f"[error]检查邮箱 {monitor['email']} 失败: {e}")
-                
-                # 短暂休眠，避免CPU占用过高
-                time.sleep(30)  # 每30秒检查一次是否有邮箱需要更新
-                
-            except Exception as e:
-                print(f"[error]邮箱监听过程中发生错误: {e}")
-                time.sleep(60)  # 出错后等待1分钟再重试
+        JOBS.add(Job("email_poll", self.poll_once, interval=self.POLL_INTERVAL, when_busy="skip", run_at_start=True))
+        self._registered = True
+        return True
+
+    async def poll_once(self):
+        """检查到期的邮箱（各邮箱并发检查，单个邮箱出错不影响其他邮箱）"""
+        current_time = time.time()
+        due = [m for m in self.email_monitors if current_time - m['last_check'] >= self.check_interval]
+        if due:
+            await asyncio.gather(*(self._check(monitor, current_time) for monitor in due))
+
+    async def _check(self, monitor, current_time):
+        try:
+            emails = await self.core.run_sync(monitor['utils'].get_today_unread_emails, limit="io")
+            if emails:
+                print(f"[info]邮箱 {monitor['email']} 收到 {len(emails)} 封新邮件")
+                # 逐封以后台优先级处理，每封之间先让出资源给进行中的对话
+                for email in emails:
+                    await SCHEDULER.ayield_to_interactive()
+                    await self.core.run_sync(self.handle_new_emails, [email], monitor['email'],
+                                             limit="llm", priority=BACKGROUND)
+            monitor['last_check'] = current_time
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[error]检查邮箱 {monitor['email']} 失败: {e}")
     
     def stop(self):
         """停止邮箱监听"""
-        self.running = False
-        print("[info]邮箱监听线程正在停止...")
+        if self._registered:
+            JOBS.remove("email_poll")
+            self._registered = False
+        print("[info]邮箱监听已停止")
     
     def get_email_summary(self):
         """
@@ -1,5 +1,6 @@
 import json
 from websocket import create_connection
+from perf_stats import STATS
 
 class L2DVEX:
     def __init__(self, uri: str):
@@ -22,7 +23,8 @@ class L2DVEX:
 
         # 尝试发出json消息
         try:
-            ws = create_connection(uri)
-            ws.send(json.dumps(data))
+            with STATS.span("live2d_send"):
+                ws = create_connection(uri)
+                ws.send(json.dumps(data))
         except Exception as e:
             print("[error]L2D错误：", str(e))
\ No newline at end of file
@@ -1,5 +1,9 @@
 import json
-from openai import OpenAI
+import time
+import asyncio
+from llm_client import AsyncLLMClient, run_cancellable, run_and_close_clients
+from response_cache import RESPONSE_CACHE, cache_key
+from usage_stats import USAGE, BudgetExceededError, usage_tokens
 
 class AiChat:
     def __init__(self):
@@ -28,36 +32,84 @@ class AiChat:
         self.model = self.config.get('api_model', 'gpt-4o')
         self.temperature = self.config.get('temperature', 0.7)
 
-        # 初始化 client
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.api_url,
-        )
+        # 初始化 client（截止时间、重试与对冲请求由 AsyncLLMClient 处理）
+        self.llm_client = AsyncLLMClient(self.config)
+        RESPONSE_CACHE.configure(self.config)
+        USAGE.configure(self.config)
         
         # 系统消息和对话记录
         self.system_message = [{"role": "system", "content": self.preset}]
 
-    def get_message(self, message: list) -> str:
-        """发送请求并返回 AI 回复"""
+    def get_message(self, message: list, raise_on_error: bool = False, cancel_event=None, on_delta=None,
+                    use_cache: bool = False, feature: str = "chat") -> str:
+        """
+        发送请求并返回 AI 回复
+
+        Args:
+            message: 消息列表
+            raise_on_error: 为True时向上抛出异常而不是返回默认回复
+            cancel_event: threading.Event，置位时中断请求并返回None
+            on_delta: 可选回调，以流式请求并逐段接收回复文本
+            use_cache: 为True时相同请求直接返回缓存的回复（对话请求不使用）
+            feature: 用量统计中的调用场景（chat、email_summary、summary等）
+
+        Raises:
+            BudgetExceededError: 今日用量已达到预算（无论 raise_on_error 是否为True）
+        """
+        request = self.aget_message(message, raise_on_error, on_delta, use_cache, feature)
+        if cancel_event is not None:
+            request = run_cancellable(request, cancel_event)
+        # asyncio.run 每次创建新的事件循环，结束前关闭其中的HTTP客户端
+        return asyncio.run(run_and_close_clients(request))
+
+    async def aget_message(self, message: list, raise_on_error: bool = False, on_delta=None,
+                           use_cache: bool = False, feature: str = "chat") -> str:
+        """get_message 的异步版本"""
+        key = cache_key(self.model, self.temperature, message) if use_cache else None
+        if key is not None:
+            cached = RESPONSE_CACHE.get(key)
+            if cached is not None:
+                print("[info]命中响应缓存，跳过API调用")
+                return cached
+        # 预算不足时由调用方决定降级方式（邮件摘要改用邮件信息、对话提示用户）
+        USAGE.check_budget()
+        start_time = time.perf_counter()
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=message,
-                temperature=self.temperature,
-            )
+            response = await self.llm_client.complete(message, self.temperature, on_delta=on_delta)
             
+            USAGE.record(feature, getattr(response, 'usage', None), (time.perf_counter() - start_time) * 1000)
+            self._report_usage(response)
             result = response.choices[0].message.content
+            if key is not None:
+                RESPONSE_CACHE.put(key, result)
             return result
             
         except Exception as e:
+            USAGE.record_error(feature)
+            if raise_on_error:
+                raise
             print(f"[error]AI API调用失败: {e}")
             import traceback
             print(f"[error]错误堆栈: {traceback.format_exc()}")
             return "抱歉，我现在无法回复您的消息，请稍后再试。"
         
+    def _report_usage(self, response):
+        """输出token用量，API返回时同时报告前缀缓存命中的token数"""
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return
+        prompt_tokens, completion_tokens, cached_tokens = usage_tokens(usage)
+
+        if getattr(usage, 'estimated', False):
+            print(f"[info]token用量(估算): 输入{prompt_tokens} 输出{completion_tokens}")
+        elif cached_tokens:
+            print(f"[info]token用量: 输入{prompt_tokens}(缓存命中{cached_tokens}) 输出{completion_tokens}")
+        else:
+            print(f"[info]token用量: 输入{prompt_tokens} 输出{completion_tokens}")
+
     # 处理通用ai询问
-    def general_summary(self, input: str) -> str:
-        """生成通用摘要"""
+    def general_summary(self, input: str, feature: str = "general") -> str:
+        """生成通用摘要（预算不足时抛出 BudgetExceededError）"""
         try:
             if not input or not input.strip():
                 return "抱歉，输入内容为空，无法生成摘要。"
@@ -76,8 +128,11 @@ class AiChat:
             })
             
             print(f"[info]发送给AI的消息数量: {len(messages)}")
-            return self.get_message(messages)
+            # 相同输入（如重启后再次处理的同一封邮件）直接使用缓存的摘要
+            return self.get_message(messages, use_cache=True, feature=feature)
             
+        except BudgetExceededError:
+            raise
         except Exception as e:
             print(f"[error]general_summary 方法执行失败: {e}")
             return "抱歉，摘要生成失败，请稍后再试。"
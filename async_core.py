@@ -0,0 +1,192 @@
+"""
+异步调度核心
+在一个专用线程中运行唯一的asyncio事件循环，统一承载LLM请求、邮件I/O、定期清理和Live2D发送：
+- submit: 从任意线程提交协程，可选在界面线程中回调结果
+- run_sync: 在有界并发的线程池中执行阻塞调用（文件读写、IMAP、WebSocket等）
+- limit: 按名称限制并发，由优先级调度器分配名额（交互任务优先于后台任务）
+- every: 周期任务
+- shutdown: 取消全部任务并按顺序关闭，退出过程确定
+与界面的衔接通过 set_dispatcher 注册的投递函数完成（Qt中为跨线程信号），本模块不依赖Qt
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from priority_scheduler import SCHEDULER, current_priority, at_priority
+
+# 各类任务的默认并发上限
+DEFAULT_LIMITS = {
+    "llm": 2,       # 同时进行的LLM请求
+    "io": 4,        # 文件读写、IMAP等阻塞I/O
+    "live2d": 1,    # Live2D发送保持顺序
+}
+
+
+class AsyncCore:
+    """单一事件循环 + 有界线程池"""
+
+    def __init__(self, limits: dict = None, max_workers: int = 8):
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.reserved = {}
+        self.max_workers = max_workers
+        self.loop = None
+        self._thread = None
+        self._executor = None
+        self._tasks = set()
+        self._dispatcher = None
+        self._ready = threading.Event()
+        self._closing = False
+
+    # ---------- 生命周期 ----------
+
+    def start(self, limits: dict = None, reserved: dict = None):
+        """
+        启动事件循环线程（重复调用无效果）
+
+        Args:
+            limits: 覆盖各类任务的并发上限
+            reserved: 各类任务中预留给交互任务的名额
+        """
+        if self._thread is not None:
+            return self
+        self.limits.update(limits or {})
+        self.reserved.update(reserved or {})
+        SCHEDULER.configure(self.limits, self.reserved)
+        self._closing = False
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="async-core")
+        self._thread = threading.Thread(target=self._run_loop, name="async-core", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        print("[info]异步调度核心已启动")
+        return self
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.set_default_executor(self._executor)
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and not self._closing
+
+    def set_dispatcher(self, dispatcher):
+        """设置回调投递函数 dispatcher(callable)，用于把结果送回界面线程"""
+        self._dispatcher = dispatcher
+
+    def call_in_ui(self, func):
+        """在界面线程中执行 func（未设置dispatcher时直接执行）"""
+        if self._dispatcher is not None:
+            self._dispatcher(func)
+        else:
+            func()
+
+    def shutdown(self, timeout: float = 5.0):
+        """
+        确定性关闭：停止接收新任务 → 取消全部任务并等待其结束 → 关闭线程池 → 停止事件循环
+        """
+        if self._thread is None:
+            return
+        self._closing = True
+        start_time = time.time()
+        try:
+            future = asyncio.run_coroutine_threadsafe(self._cancel_all(), self.loop)
+            future.result(timeout=timeout)
+        except Exception as e:
+            print(f"[warning]等待异步任务结束超时或失败: {e}")
+        # 正在执行的阻塞调用无法中断，不再等待它们
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=max(0.1, timeout - (time.time() - start_time)))
+        self._thread = None
+        self._ready.clear()
+        print("[info]异步调度核心已关闭")
+
+    async def _cancel_all(self):
+        tasks = [t for t in self._tasks if not t.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # ---------- 任务提交 ----------
+
+    def submit(self, coro, callback=None, error_callback=None):
+        """
+        从任意线程提交协程
+
+        Args:
+            coro: 协程对象
+            callback: 成功时以结果调用（设置了dispatcher时在界面线程中执行）
+            error_callback: 出错时以异常调用；被取消时两个回调都不会执行
+
+        Returns:
+            concurrent.futures.Future: 调用 cancel() 即可取消任务（会中断其中的await）
+        """
+        if not self.is_running():
+            coro.close()
+            raise RuntimeError("异步调度核心未启动或正在关闭")
+        future = asyncio.run_coroutine_threadsafe(self._track(coro), self.loop)
+        if callback is not None or error_callback is not None:
+            future.add_done_callback(lambda f: self._deliver(f, callback, error_callback))
+        return future
+
+    async def _track(self, coro):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            return await coro
+        finally:
+            self._tasks.discard(task)
+
+    def _deliver(self, future, callback, error_callback):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            if error_callback is None:
+                print(f"[error]异步任务失败: {error}")
+                return
+            target = lambda: error_callback(error)
+        elif callback is not None:
+            target = lambda: callback(future.result())
+        else:
+            return
+        self.call_in_ui(target)
+
+    def run_coroutine(self, coro, timeout: float = None):
+        """从其他线程提交协程并阻塞等待结果"""
+        return self.submit(coro).result(timeout=timeout)
+
+    # ---------- 协程内使用的工具 ----------
+
+    @asynccontextmanager
+    async def limit(self, name: str, priority: int = None):
+        """按名称限制并发：async with core.limit("llm"): ...（priority 默认取当前上下文的优先级）"""
+        async with SCHEDULER.aslot(name, priority):
+            yield
+
+    async def run_sync(self, func, *args, limit: str = "io", priority: int = None):
+        """
+        在线程池中执行阻塞函数（受 limit 对应的并发上限约束）
+
+        优先级会传入执行线程，函数内部再占用其他资源（如嵌入计算）时沿用同一优先级
+        """
+        level = current_priority() if priority is None else priority
+
+        def call():
+            with at_priority(level):
+                return func(*args)
+
+        async with self.limit(limit, level):
+            return await self.loop.run_in_executor(None, call)
+
+
+# 进程内共享的调度核心
+ASYNC_CORE = AsyncCore()
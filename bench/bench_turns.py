@@ -0,0 +1,157 @@
+"""
+端到端对话轮次基准测试（无界面、无网络）
+在临时目录中生成不同规模的聊天记录与向量库，启动本地模拟服务，
+通过 MessageUtils.save_message / generate_response 执行 N 轮合成对话，
+输出吞吐量、各阶段延迟与内存占用
+
+用法:
+    python bench/bench_turns.py --sizes 1k,10k,100k --turns 20
+    python bench/bench_turns.py --sizes 10k --stream --latency-ms 300 --tokens-per-sec 40 --json result.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from common import HashEmbedder, parse_sizes, populate, synthetic_messages, synthetic_text, write_workspace
+from mock_openai_server import MockOptions, start_server
+
+from faiss_utils import VectorDatabase
+from message_utils import MessageUtils
+from perf_stats import STATS, Histogram
+
+
+def run_turns(mu: MessageUtils, count: int, rng: random.Random) -> list[float]:
+    """执行 count 轮对话，返回每轮耗时（毫秒）"""
+    durations = []
+    for _ in range(count):
+        text = synthetic_text(rng)
+        start = time.perf_counter()
+        mu.save_message("user", text)
+        response = mu.generate_response(text)
+        mu.save_message("assistant", response)
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def bench_size(size: int, args, base_url: str) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"liveagent-bench-{size}-")
+    cwd = os.getcwd()
+    try:
+        os.chdir(workdir)
+        messages = synthetic_messages(size, seed=size)
+        write_workspace(workdir, {
+            "api_baseurl": base_url,
+            "apikey": "bench",
+            "api_model": "mock",
+            "api_stream": args.stream,
+            "summary_enabled": False,
+            "rerank_model": "",
+        }, messages)
+
+        setup_start = time.perf_counter()
+        vector_db = VectorDatabase(index_dir="vector_db", model=HashEmbedder(args.dimension))
+        populate(vector_db, messages)
+        setup_s = time.perf_counter() - setup_start
+
+        app = SimpleNamespace(vector_db=vector_db, prefetcher=None)
+        mu = MessageUtils(vector_db, app)
+        rng = random.Random(args.seed)
+
+        # 预热（首次导入/连接的开销不计入结果）
+        run_turns(mu, args.warmup, rng)
+
+        STATS.reset()
+        start = time.perf_counter()
+        durations = run_turns(mu, args.turns, rng)
+        elapsed = time.perf_counter() - start
+        stages = STATS.snapshot()
+
+        # 内存单独测量：tracemalloc 本身会明显拖慢执行，不与计时混在一起
+        tracemalloc.start()
+        run_turns(mu, args.memory_turns, rng)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        turn_hist = Histogram()
+        for ms in durations:
+            turn_hist.record(ms)
+
+        return {
+            "history_size": size,
+            "turns": args.turns,
+            "setup_s": round(setup_s, 3),
+            "throughput_turns_per_s": round(args.turns / elapsed, 3) if elapsed > 0 else 0.0,
+            "turn": turn_hist.summary(),
+            "stages": stages,
+            "peak_traced_mb": round(peak / 1024 / 1024, 2),
+            "history_file_mb": round(os.path.getsize("chat_history.json") / 1024 / 1024, 2),
+        }
+    finally:
+        os.chdir(cwd)
+        if args.keep_workspace:
+            print(f"[info]保留工作目录: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_result(result: dict):
+    turn = result["turn"]
+    print(f"\n=== 历史规模 {result['history_size']} ===")
+    print(f"准备耗时: {result['setup_s']}s  吞吐量: {result['throughput_turns_per_s']} 轮/秒  "
+          f"历史文件: {result['history_file_mb']}MB  峰值内存(tracemalloc): {result['peak_traced_mb']}MB")
+    print(f"每轮耗时: p50 {turn['p50_ms']:.1f}ms  p95 {turn['p95_ms']:.1f}ms  p99 {turn['p99_ms']:.1f}ms  max {turn['max_ms']:.1f}ms")
+    print(f"{'stage':<16}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for name, s in result["stages"].items():
+        print(f"{name:<16}{s['count']:>7}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端对话轮次基准测试")
+    parser.add_argument("--sizes", default="1k,10k,100k", help="历史记录规模，逗号分隔，支持k/m后缀")
+    parser.add_argument("--turns", type=int, default=20, help="每个规模计时的对话轮数")
+    parser.add_argument("--warmup", type=int, default=2, help="预热轮数")
+    parser.add_argument("--memory-turns", type=int, default=3, help="测量内存时执行的轮数")
+    parser.add_argument("--stream", action="store_true", help="使用流式请求（可统计首token延迟）")
+    parser.add_argument("--latency-ms", type=float, default=50, help="模拟服务首token延迟")
+    parser.add_argument("--tokens-per-sec", type=float, default=0, help="模拟服务输出速率，0为不限速")
+    parser.add_argument("--reply-tokens", type=int, default=32, help="模拟回复的token数")
+    parser.add_argument("--base-url", default="", help="使用已启动的模拟服务，而不是进程内启动")
+    parser.add_argument("--dimension", type=int, default=384, help="哈希嵌入维度")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default="", help="将结果写入JSON文件")
+    parser.add_argument("--keep-workspace", action="store_true", help="保留临时工作目录")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        options = MockOptions(args.latency_ms, args.tokens_per_sec, args.reply_tokens)
+        server, base_url = start_server(options=options)
+        print(f"[info]模拟服务: {base_url}")
+
+    output_path = os.path.abspath(args.json) if args.json else ""
+    results = []
+    try:
+        for size in parse_sizes(args.sizes):
+            result = bench_size(size, args, base_url)
+            print_result(result)
+            results.append(result)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n[info]结果已写入: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
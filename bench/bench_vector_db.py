@@ -0,0 +1,178 @@
+"""
+VectorDatabase 操作基准测试
+在不同规模的合成多语言消息上测量 add_message、批量重建、search（不同k/阈值）、
+save、冷启动加载和 clear 的耗时，结果写入JSON便于对比索引、持久化与缓存方面的改动
+
+用法:
+    python bench/bench_vector_db.py --sizes 1k,10k,100k,1m --output vector_db.json
+    python bench/bench_vector_db.py --sizes 10k --real-model   # 使用配置中的真实嵌入模型
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from common import ROOT_DIR, HashEmbedder, load_real_model, parse_sizes, populate, synthetic_messages, synthetic_text, write_workspace
+
+import faiss
+import numpy as np
+
+from faiss_utils import VectorDatabase
+from perf_stats import Histogram
+
+DEFAULT_K_VALUES = "1,5,10,20"
+DEFAULT_THRESHOLDS = "0.0,0.4,0.6"
+
+
+def timed(func, *args, **kwargs):
+    """执行一次并返回 (结果, 耗时毫秒)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def file_mb(path: str) -> float:
+    return round(os.path.getsize(path) / 1024 / 1024, 3) if os.path.exists(path) else 0.0
+
+
+def rebuild(vector_db: VectorDatabase, messages: list):
+    """按聊天记录重建：清空后批量嵌入写入"""
+    vector_db.clear()
+    vector_db.add_messages(messages)
+    vector_db.save()
+
+
+def bench_size(size: int, args, embedder) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"liveagent-vdb-{size}-")
+    cwd = os.getcwd()
+    rng = random.Random(args.seed)
+    result = {"rows": size}
+    try:
+        os.chdir(workdir)
+        write_workspace(workdir, {"rerank_model": "", "memory_scoring": args.scoring})
+        messages = synthetic_messages(size, seed=size)
+
+        vector_db = VectorDatabase(index_dir="vector_db", model=embedder)
+        _, ms = timed(populate, vector_db, messages)
+        result["populate_ms"] = round(ms, 3)
+
+        # 逐条写入（与在线保存消息的路径一致）
+        hist = Histogram()
+        for i in range(args.add_ops):
+            text = synthetic_text(rng)
+            _, ms = timed(vector_db.add_message, f"bench_{i}", "user", text, messages[-1]["timestamp"])
+            hist.record(ms)
+        result["add_message"] = hist.summary()
+
+        # 检索：不同k与阈值组合
+        queries = [synthetic_text(rng) for _ in range(args.queries)]
+        search_results = []
+        for k in [int(v) for v in args.k.split(",")]:
+            for threshold in [float(v) for v in args.thresholds.split(",")]:
+                hist = Histogram()
+                hits = 0
+                for query in queries:
+                    found, ms = timed(vector_db.search, query, k=k, threshold=threshold)
+                    hist.record(ms)
+                    hits += len(found)
+                entry = {"k": k, "threshold": threshold, "avg_results": round(hits / len(queries), 2)}
+                entry.update(hist.summary())
+                search_results.append(entry)
+        result["search"] = search_results
+
+        # 持久化
+        _, ms = timed(vector_db.save)
+        result["save_ms"] = round(ms, 3)
+        result["index_file_mb"] = file_mb(vector_db.index_path)
+        result["metadata_file_mb"] = file_mb(vector_db.metadata_path)
+
+        # 冷启动加载（重新读取索引与元数据）
+        loaded, ms = timed(VectorDatabase, index_dir="vector_db", model=embedder)
+        result["cold_load_ms"] = round(ms, 3)
+        result["cold_load_rows"] = loaded.size()
+        del loaded
+
+        # 批量重建（逐条嵌入，规模过大时跳过）
+        if size <= args.rebuild_max:
+            _, ms = timed(rebuild, vector_db, messages)
+            result["rebuild_ms"] = round(ms, 3)
+        else:
+            result["rebuild_ms"] = None
+            result["rebuild_skipped"] = f"rows > --rebuild-max ({args.rebuild_max})"
+
+        _, ms = timed(vector_db.clear)
+        result["clear_ms"] = round(ms, 3)
+        return result
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_result(result: dict):
+    rebuild = "跳过" if result["rebuild_ms"] is None else f"{result['rebuild_ms']:.1f}ms"
+    print(f"\n=== {result['rows']} 条记录 ===")
+    print(f"populate {result['populate_ms']:.1f}ms  save {result['save_ms']:.1f}ms  "
+          f"cold_load {result['cold_load_ms']:.1f}ms  clear {result['clear_ms']:.1f}ms  rebuild {rebuild}")
+    add = result["add_message"]
+    print(f"add_message p50 {add['p50_ms']:.3f}ms  p95 {add['p95_ms']:.3f}ms")
+    print(f"{'k':>4}{'threshold':>11}{'results':>9}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for s in result["search"]:
+        print(f"{s['k']:>4}{s['threshold']:>11.2f}{s['avg_results']:>9.1f}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VectorDatabase 操作基准测试")
+    parser.add_argument("--sizes", default="1k,10k,100k,1m", help="记录数，逗号分隔，支持k/m后缀")
+    parser.add_argument("--k", default=DEFAULT_K_VALUES, help="检索的k值，逗号分隔")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS, help="相似度阈值，逗号分隔")
+    parser.add_argument("--queries", type=int, default=50, help="每种检索参数的查询次数")
+    parser.add_argument("--add-ops", type=int, default=200, help="逐条 add_message 的次数")
+    parser.add_argument("--rebuild-max", type=int, default=100000, help="超过该规模时跳过批量重建")
+    parser.add_argument("--scoring", default="decay", choices=("decay", "similarity"), help="检索打分方式")
+    parser.add_argument("--real-model", action="store_true", help="使用 default.json 中配置的真实嵌入模型")
+    parser.add_argument("--dimension", type=int, default=384, help="哈希嵌入维度")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_vector_db.json", help="结果JSON文件")
+    args = parser.parse_args()
+
+    if args.real_model:
+        with open(os.path.join(ROOT_DIR, "default.json"), "r", encoding="utf-8") as f:
+            model_name = json.load(f).get("model")
+        embedder = load_real_model(model_name)
+        embedder_name = model_name
+    else:
+        embedder = HashEmbedder(args.dimension)
+        embedder_name = f"hash-{args.dimension}"
+
+    output_path = os.path.abspath(args.output)
+    results = []
+    for size in parse_sizes(args.sizes):
+        result = bench_size(size, args, embedder)
+        print_result(result)
+        results.append(result)
+
+    data = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "faiss": getattr(faiss, "__version__", "unknown"),
+            "embedder": embedder_name,
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"\n[info]结果已写入: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+基准测试公共工具
+确定性的哈希嵌入模型、合成聊天记录以及临时工作目录的生成
+"""
+
+import os
+import sys
+import json
+import random
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# 让基准脚本可以直接导入项目根目录下的模块
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 合成消息使用的词汇
+WORDS = (
+    "今天", "明天", "天气", "会议", "邮件", "项目", "进度", "报告", "晚饭", "电影", "周末", "计划",
+    "提醒", "文件", "代码", "测试", "部署", "服务器", "咖啡", "朋友", "生日", "礼物", "旅行", "机票",
+    "python", "faiss", "live2d", "deadline", "review", "release", "bug", "feature",
+)
+QUESTIONS = (
+    "帮我看看{}和{}的安排", "{}的{}怎么样了", "记得我们聊过{}吗，还有{}", "那第二个{}呢", "把{}加到{}里",
+)
+
+
+class HashEmbedder:
+    """
+    确定性哈希嵌入（字符二元组哈希到固定维度后归一化）
+
+    接口与 SentenceTransformer 的 encode / get_sentence_embedding_dimension 一致，
+    不需要下载模型，适合测量除嵌入计算以外的流水线开销
+    """
+
+    tokenizer = None
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts, **kwargs):
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            text = text or " "
+            for i in range(max(1, len(text) - 1)):
+                h = zlib.crc32(text[i:i + 2].encode("utf-8"))
+                vectors[row, h % self.dimension] += 1.0 if (h >> 16) & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.maximum(norms, 1e-6)
+        return vectors[0] if single else vectors
+
+
+def load_real_model(model_name: str):
+    """加载真实的 SentenceTransformer 模型（优先使用项目 local_models 下的缓存）"""
+    from sentence_transformers import SentenceTransformer
+
+    local_model_path = os.path.join(ROOT_DIR, "local_models", model_name.split("/")[-1])
+    if os.path.exists(local_model_path):
+        return SentenceTransformer(local_model_path)
+    return SentenceTransformer(model_name)
+
+
+def synthetic_text(rng: random.Random) -> str:
+    return rng.choice(QUESTIONS).format(rng.choice(WORDS), rng.choice(WORDS))
+
+
+def synthetic_messages(count: int, seed: int = 0, end: datetime = None, step_seconds: int = 60) -> list[dict]:
+    """生成 count 条交替的 user/assistant 消息，时间戳以 step_seconds 为间隔截止到 end"""
+    rng = random.Random(seed)
+    end = end or datetime.now()
+    start = end - timedelta(seconds=step_seconds * count)
+    messages = []
+    for i in range(count):
+        role = "user" if i % 2 == 0 else "assistant"
+        content = synthetic_text(rng)
+        if role == "assistant":
+            content = f"好的，{content}，我已经记下了。"
+        timestamp = (start + timedelta(seconds=step_seconds * i)).strftime(TIMESTAMP_FORMAT)
+        messages.append({"role": role, "content": content, "timestamp": timestamp})
+    return messages
+
+
+def write_workspace(path: str, overrides: dict = None, messages: list = None):
+    """在 path 下写入 config.json、system_prompt.json 和 chat_history.json"""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(ROOT_DIR, "default.json"), "r", encoding="utf-8") as f:
+        config = json.load(f)
+    config.update(overrides or {})
+    with open(os.path.join(path, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(path, "system_prompt.json"), "w", encoding="utf-8") as f:
+        json.dump({"preset": "你是一个乐于助人的桌面助手。"}, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(path, "chat_history.json"), "w", encoding="utf-8") as f:
+        json.dump({"messages": messages or []}, f, ensure_ascii=False, indent=2)
+    return config
+
+
+def populate(vector_db, messages: list, batch_size: int = 2048):
+    """批量写入向量数据库（比逐条 add_message 快得多，用于准备测试数据）"""
+    from faiss_utils import MemoryAttributes
+
+    for start in range(0, len(messages), batch_size):
+        chunk = messages[start:start + batch_size]
+        embeddings = np.asarray(vector_db.embed([m["content"] for m in chunk]), dtype=np.float32)
+        base = vector_db.index.ntotal
+        vector_db.index.add(embeddings)
+        for offset, msg in enumerate(chunk):
+            vector_db.metadata.append({
+                "id": msg.get("id", f"{msg['timestamp']}_{msg['role']}_{base + offset}"),
+                "role": msg["role"],
+                "content": msg["content"],
+                "timestamp": msg["timestamp"],
+                "vector_idx": base + offset,
+            })
+    vector_db.attrs = MemoryAttributes.from_metadata(vector_db.metadata)
+
+
+def parse_sizes(text: str) -> list[int]:
+    """解析 "1k,10k,100k" 形式的规模列表"""
+    sizes = []
+    for part in text.split(","):
+        part = part.strip().lower()
+        if not part:
+            continue
+        scale = 1
+        if part.endswith("k"):
+            scale, part = 1000, part[:-1]
+        elif part.endswith("m"):
+            scale, part = 1000000, part[:-1]
+        sizes.append(int(float(part) * scale))
+    return sizes
@@ -0,0 +1,156 @@
+"""
+合成聊天记录生成器
+生成跨越N天的 chat_history.json 与 vector_db/ 测试数据，可配置消息长度分布、中英文比例和邮件摘要比例，
+用于启动、过期清理（routine_clear）、历史加载和界面渲染的基准测试
+
+用法:
+    python bench/gen_history.py --out fixtures/14d --days 14 --per-day 300
+    python bench/gen_history.py --out fixtures/long --days 30 --mean-chars 120 --latin-ratio 0.5 --email-ratio 0.1
+生成的目录可以直接作为工作目录使用（包含 config.json 与 system_prompt.json）
+"""
+
+import argparse
+import math
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from common import TIMESTAMP_FORMAT, HashEmbedder, load_real_model, populate, write_workspace
+
+CJK_WORDS = (
+    "今天", "明天", "昨天", "天气", "会议", "邮件", "项目", "进度", "报告", "晚饭", "电影", "周末", "计划", "提醒",
+    "文件", "代码", "测试", "部署", "服务器", "咖啡", "朋友", "生日", "礼物", "旅行", "机票", "酒店", "地铁", "下雨",
+    "帮我", "看看", "记得", "安排", "修改", "总结", "一下", "好的", "没问题", "已经", "完成", "还有", "然后", "因为",
+)
+LATIN_WORDS = (
+    "the", "meeting", "report", "deadline", "review", "release", "bug", "feature", "python", "faiss", "server",
+    "deploy", "email", "schedule", "coffee", "weekend", "please", "check", "update", "draft", "summary", "today",
+)
+CJK_PUNCT = ("，", "。", "？", "！")
+EMAIL_SUBJECTS = ("季度报告", "会议邀请", "账单提醒", "快递通知", "Weekly update", "Invoice", "项目评审")
+
+
+class HistoryGenerator:
+    """按长度分布与语言比例生成消息内容"""
+
+    def __init__(self, seed: int = 0, mean_chars: float = 40, sigma: float = 0.8,
+                 max_chars: int = 2000, latin_ratio: float = 0.2):
+        """
+        Args:
+            mean_chars: 消息长度（字符）的中位数，长度服从对数正态分布
+            sigma: 对数正态分布的sigma，越大长消息越多
+            max_chars: 单条消息最大长度
+            latin_ratio: 拉丁字母单词所占比例（0为纯中文，1为纯英文）
+        """
+        self.rng = random.Random(seed)
+        self.mu = math.log(max(1.0, mean_chars))
+        self.sigma = sigma
+        self.max_chars = max_chars
+        self.latin_ratio = latin_ratio
+
+    def length(self) -> int:
+        return max(2, min(self.max_chars, int(self.rng.lognormvariate(self.mu, self.sigma))))
+
+    def text(self, length: int = None) -> str:
+        length = length or self.length()
+        parts = []
+        size = 0
+        while size < length:
+            if self.rng.random() < self.latin_ratio:
+                word = self.rng.choice(LATIN_WORDS) + " "
+            else:
+                word = self.rng.choice(CJK_WORDS)
+                if self.rng.random() < 0.15:
+                    word += self.rng.choice(CJK_PUNCT)
+            parts.append(word)
+            size += len(word)
+        return "".join(parts)[:length].strip() or "好的"
+
+    def email_summary(self) -> str:
+        subject = self.rng.choice(EMAIL_SUBJECTS)
+        return f"您收到了封邮件：“{subject}：{self.text(min(50, self.length()))}”"
+
+
+def generate_messages(days: int, per_day: int, generator: HistoryGenerator, email_ratio: float = 0.05,
+                      end: datetime = None) -> list[dict]:
+    """
+    生成跨越 days 天、每天约 per_day 条的消息（按时间排序）
+
+    每天的消息集中在 8:00-24:00，用户消息后跟随几秒后的助手回复；
+    邮件摘要以单独的助手消息出现（与邮箱监听保存的格式一致）
+    """
+    rng = generator.rng
+    end = end or datetime.now()
+    messages = []
+    for day in range(days - 1, -1, -1):
+        day_start = (end - timedelta(days=day)).replace(hour=8, minute=0, second=0, microsecond=0)
+        # 最后一天的消息不晚于当前时间
+        span = 16 * 3600 if day > 0 else max(60, int((end - day_start).total_seconds()))
+        events = []
+        count = 0
+        while count < per_day:
+            offset = rng.uniform(0, span)
+            if rng.random() < email_ratio:
+                events.append((offset, [("assistant", generator.email_summary())]))
+                count += 1
+            else:
+                events.append((offset, [("user", generator.text()), ("assistant", generator.text())]))
+                count += 2
+        events.sort(key=lambda e: e[0])
+        for offset, items in events:
+            moment = day_start + timedelta(seconds=offset)
+            for i, (role, content) in enumerate(items):
+                timestamp = (moment + timedelta(seconds=3 * i)).strftime(TIMESTAMP_FORMAT)
+                messages.append({"role": role, "content": content, "timestamp": timestamp})
+    messages.sort(key=lambda m: m["timestamp"])
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成聊天记录生成器")
+    parser.add_argument("--out", default="fixtures/history", help="输出目录")
+    parser.add_argument("--days", type=int, default=14, help="跨越的天数")
+    parser.add_argument("--per-day", type=int, default=200, help="每天的消息数")
+    parser.add_argument("--mean-chars", type=float, default=40, help="消息长度中位数（字符）")
+    parser.add_argument("--sigma", type=float, default=0.8, help="长度对数正态分布的sigma")
+    parser.add_argument("--max-chars", type=int, default=2000, help="单条消息最大长度")
+    parser.add_argument("--latin-ratio", type=float, default=0.2, help="拉丁字母单词比例")
+    parser.add_argument("--email-ratio", type=float, default=0.05, help="邮件摘要消息比例")
+    parser.add_argument("--max-day", type=int, default=None, help="写入config.json的保留天数（默认与default.json一致）")
+    parser.add_argument("--no-vector-db", action="store_true", help="只生成 chat_history.json")
+    parser.add_argument("--real-model", action="store_true", help="使用真实嵌入模型生成向量库")
+    parser.add_argument("--dimension", type=int, default=384, help="哈希嵌入维度")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    generator = HistoryGenerator(args.seed, args.mean_chars, args.sigma, args.max_chars, args.latin_ratio)
+    messages = generate_messages(args.days, args.per_day, generator, args.email_ratio)
+
+    out_dir = os.path.abspath(args.out)
+    overrides = {"rerank_model": ""}
+    if args.max_day is not None:
+        overrides["max_day"] = args.max_day
+    config = write_workspace(out_dir, overrides, messages)
+    print(f"[info]已写入 {len(messages)} 条消息: {os.path.join(out_dir, 'chat_history.json')}")
+
+    if not args.no_vector_db:
+        from faiss_utils import VectorDatabase
+
+        embedder = load_real_model(config.get("model")) if args.real_model else HashEmbedder(args.dimension)
+        cwd = os.getcwd()
+        try:
+            os.chdir(out_dir)
+            vector_db = VectorDatabase(index_dir="vector_db", model=embedder)
+            vector_db.clear()
+            populate(vector_db, messages)
+            vector_db.save()
+        finally:
+            os.chdir(cwd)
+
+    print(f"[info]生成完成，用时: {time.time() - start_time:.2f}秒")
+
+
+if __name__ == "__main__":
+    main()
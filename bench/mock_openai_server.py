@@ -0,0 +1,184 @@
+"""
+本地模拟的 OpenAI 兼容服务
+实现 /v1/chat/completions（流式与非流式）和 /v1/models，可配置首包延迟、输出速率和错误率，
+无需API密钥和网络即可测量整个对话流水线
+
+用法:
+    python bench/mock_openai_server.py --port 8765 --latency-ms 300 --tokens-per-sec 40
+然后在 config.json 中设置 api_baseurl 为 http://127.0.0.1:8765/v1
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY_TOKENS = ("好的", "，", "我", "已经", "记", "下", "了", "。", "还有", "什么", "需要", "帮忙", "的", "吗", "？")
+
+
+class MockOptions:
+    def __init__(self, latency_ms: float = 0, tokens_per_sec: float = 0, reply_tokens: int = 32,
+                 error_rate: float = 0.0):
+        """
+        Args:
+            latency_ms: 收到请求到首个token的延迟
+            tokens_per_sec: 输出速率，0表示不限速
+            reply_tokens: 每次回复的token数
+            error_rate: 随机返回503的概率（用于测试重试）
+        """
+        self.latency_ms = latency_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+
+
+def estimate_prompt_tokens(messages: list) -> int:
+    return sum(max(1, len(str(m.get("content", ""))) // 2) + 4 for m in messages)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    options = MockOptions()
+
+    def log_message(self, format, *args):
+        # 基准测试时不输出访问日志
+        pass
+
+    def _send_json(self, status: int, data: dict):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "bench"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except (ValueError, json.JSONDecodeError):
+            self._send_json(400, {"error": {"message": "invalid json"}})
+            return
+
+        options = self.options
+        if options.error_rate and random.random() < options.error_rate:
+            self._send_json(503, {"error": {"message": "mock overloaded"}})
+            return
+
+        time.sleep(options.latency_ms / 1000)
+
+        tokens = [REPLY_TOKENS[i % len(REPLY_TOKENS)] for i in range(options.reply_tokens)]
+        usage = {
+            "prompt_tokens": estimate_prompt_tokens(request.get("messages", [])),
+            "completion_tokens": len(tokens),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        model = request.get("model") or "mock"
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        interval = 1 / options.tokens_per_sec if options.tokens_per_sec > 0 else 0
+
+        if not request.get("stream"):
+            time.sleep(interval * len(tokens))
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+            return
+
+        # 流式输出（SSE）
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        def send_chunk(delta: dict, finish_reason=None, chunk_usage=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [] if chunk_usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            if chunk_usage:
+                chunk["usage"] = chunk_usage
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            send_chunk({"role": "assistant", "content": ""})
+            for token in tokens:
+                send_chunk({"content": token})
+                if interval:
+                    time.sleep(interval)
+            send_chunk({}, finish_reason="stop")
+            # 最后一个分块附带用量（与 stream_options.include_usage 的格式一致）
+            send_chunk({}, chunk_usage=usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端取消了请求
+            pass
+
+
+def make_server(host: str, port: int, options: MockOptions = None) -> ThreadingHTTPServer:
+    handler = type("BoundMockHandler", (MockHandler,), {"options": options or MockOptions()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, options: MockOptions = None):
+    """
+    在后台线程中启动服务（port为0时自动分配端口）
+
+    Returns:
+        tuple: (server, base_url)，用完后调用 server.shutdown()
+    """
+    server = make_server(host, port, options)
+    threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True).start()
+    base_url = f"http://{host}:{server.server_address[1]}/v1"
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的 OpenAI 兼容服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200, help="首token延迟（毫秒）")
+    parser.add_argument("--tokens-per-sec", type=float, default=50, help="输出速率，0为不限速")
+    parser.add_argument("--reply-tokens", type=int, default=32, help="每次回复的token数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回503的概率")
+    args = parser.parse_args()
+
+    options = MockOptions(args.latency_ms, args.tokens_per_sec, args.reply_tokens, args.error_rate)
+    server = make_server(args.host, args.port, options)
+    print(f"[info]模拟服务已启动: http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
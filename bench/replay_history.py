@@ -0,0 +1,150 @@
+"""
+聊天记录回放工具
+把录制的（或 gen_history.py 生成的）chat_history.json 重新送入真实的处理流水线：
+之前的消息作为已有历史预先载入，最后 --turns 轮用户消息逐条经过
+save_message → generate_response → save_message；不跟在用户消息后的助手消息（如邮件摘要）直接保存。
+默认连接进程内的模拟服务，也可以指定其他OpenAI兼容地址
+
+用法:
+    python bench/replay_history.py --history fixtures/14d/chat_history.json --turns 50
+    python bench/replay_history.py --history my_history.json --turns 20 --base-url http://127.0.0.1:8765/v1 --speed 10
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from types import SimpleNamespace
+
+from common import HashEmbedder, load_real_model, populate, write_workspace
+from mock_openai_server import MockOptions, start_server
+
+from faiss_utils import VectorDatabase, parse_timestamp
+from message_utils import MessageUtils
+from perf_stats import STATS, Histogram
+
+
+def split_history(messages: list, turns: int) -> tuple[list, list]:
+    """按最后 turns 条用户消息切分为（预载历史, 回放部分）"""
+    user_positions = [i for i, m in enumerate(messages) if m.get("role") == "user"]
+    if turns <= 0 or not user_positions:
+        return messages, []
+    cut = user_positions[-turns] if turns <= len(user_positions) else user_positions[0]
+    return messages[:cut], messages[cut:]
+
+
+def replay(mu: MessageUtils, messages: list, speed: float = 0) -> dict:
+    """
+    回放消息，speed>0 时按原始时间间隔除以speed等待
+
+    Returns:
+        dict: 每轮耗时直方图与计数
+    """
+    turn_hist = Histogram()
+    counts = {"turns": 0, "unsolicited": 0}
+    previous_time = None
+    for pos, msg in enumerate(messages):
+        role, content = msg.get("role"), msg.get("content", "")
+        if speed > 0:
+            current_time = parse_timestamp(msg.get("timestamp"))
+            if previous_time is not None:
+                time.sleep(max(0.0, current_time - previous_time) / speed)
+            previous_time = current_time
+
+        if role == "user":
+            start = time.perf_counter()
+            mu.save_message("user", content)
+            response = mu.generate_response(content)
+            mu.save_message("assistant", response)
+            turn_hist.record((time.perf_counter() - start) * 1000)
+            counts["turns"] += 1
+        elif role == "assistant" and (pos == 0 or messages[pos - 1].get("role") != "user"):
+            # 没有对应用户消息的助手消息（邮件摘要等）
+            mu.save_message("assistant", content)
+            counts["unsolicited"] += 1
+        # 用户消息之后录制的回复由 generate_response 重新生成，这里跳过
+    counts["turn"] = turn_hist.summary()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="聊天记录回放工具")
+    parser.add_argument("--history", required=True, help="chat_history.json 路径")
+    parser.add_argument("--turns", type=int, default=20, help="回放最后多少轮用户消息（其余作为预载历史）")
+    parser.add_argument("--speed", type=float, default=0, help="按原始间隔回放的加速倍数，0为不等待")
+    parser.add_argument("--base-url", default="", help="OpenAI兼容地址，留空时启动进程内模拟服务")
+    parser.add_argument("--apikey", default="bench")
+    parser.add_argument("--api-model", default="mock")
+    parser.add_argument("--stream", action="store_true", help="使用流式请求")
+    parser.add_argument("--latency-ms", type=float, default=50, help="模拟服务首token延迟")
+    parser.add_argument("--tokens-per-sec", type=float, default=0, help="模拟服务输出速率，0为不限速")
+    parser.add_argument("--real-model", action="store_true", help="使用真实嵌入模型")
+    parser.add_argument("--dimension", type=int, default=384, help="哈希嵌入维度")
+    parser.add_argument("--workdir", default="", help="工作目录（默认使用临时目录并在结束后删除）")
+    parser.add_argument("--json", default="", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    with open(args.history, "r", encoding="utf-8") as f:
+        messages = json.load(f).get("messages", [])
+    preload, replayed = split_history(messages, args.turns)
+    print(f"[info]共{len(messages)}条消息：预载{len(preload)}条，回放{len(replayed)}条")
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server, base_url = start_server(options=MockOptions(args.latency_ms, args.tokens_per_sec))
+        print(f"[info]模拟服务: {base_url}")
+
+    output_path = os.path.abspath(args.json) if args.json else ""
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="liveagent-replay-")
+    cwd = os.getcwd()
+    try:
+        os.chdir(workdir)
+        config = write_workspace(workdir, {
+            "api_baseurl": base_url,
+            "apikey": args.apikey,
+            "api_model": args.api_model,
+            "api_stream": args.stream,
+            "rerank_model": "",
+        }, preload)
+
+        embedder = load_real_model(config.get("model")) if args.real_model else HashEmbedder(args.dimension)
+        setup_start = time.perf_counter()
+        vector_db = VectorDatabase(index_dir="vector_db", model=embedder)
+        vector_db.clear()
+        populate(vector_db, preload)
+        setup_s = time.perf_counter() - setup_start
+
+        mu = MessageUtils(vector_db, SimpleNamespace(vector_db=vector_db, prefetcher=None))
+        STATS.reset()
+        start = time.perf_counter()
+        result = replay(mu, replayed, args.speed)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+        if server is not None:
+            server.shutdown()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    result.update({
+        "preloaded": len(preload),
+        "setup_s": round(setup_s, 3),
+        "elapsed_s": round(elapsed, 3),
+        "stages": STATS.snapshot(),
+    })
+    turn = result["turn"]
+    print(f"\n回放完成: {result['turns']}轮对话, {result['unsolicited']}条独立助手消息, 用时{elapsed:.2f}秒（预载{setup_s:.2f}秒）")
+    print(f"每轮耗时: p50 {turn['p50_ms']:.1f}ms  p95 {turn['p95_ms']:.1f}ms  max {turn['max_ms']:.1f}ms")
+    print(STATS.format_table())
+
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "result": result}, f, ensure_ascii=False, indent=2)
+        print(f"[info]结果已写入: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
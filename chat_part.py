@@ -7,27 +7,43 @@ import sys
 import os
 import json
 import time
+import asyncio
 from datetime import datetime, timedelta
-import threading
+
+# 启动采样需在导入torch等重量级模块之前开始
+import profiler
+STARTUP_PROFILER = profiler.start("startup")
+
 import keyboard
-from PyQt5.QtCore import QObject, pyqtSignal, QThread, QTimer
+from PyQt5.QtCore import QObject, pyqtSignal, QTimer
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtGui import QFont
 
 import commands
 from faiss_utils import VectorDatabase
-from modules import is_json_file_empty
+from modules import is_json_file_empty, prune_history
 from message_utils import MessageUtils
+from summary_utils import ConversationSummarizer
+from prefetch import RetrievalPrefetcher
+from perf_stats import STATS
+from async_core import ASYNC_CORE
+from resource_governor import GOVERNOR
+from priority_scheduler import BACKGROUND
+from job_scheduler import JOBS, Job
+from response_cache import RESPONSE_CACHE
+from usage_stats import USAGE, BudgetExceededError
+from ai_part import AiChat
 from settings_webview import SettingWindow
 from Live2DViewerEX import L2DVEX
 from Automation import EmailUtils
-from Automation import EmailMonitorThread
+from Automation import EmailMonitor
 
 from ui_webview import ChatWindow, setup_system_tray, setup_webengine_global_config
 
 HISTORY_FILE = "chat_history.json"
 DEFAULT_HISTORY = {"messages": []}
-COMMAND_LIST = ("--help()","--vb_clear()","--history_clear()","--show_parameters()")
+COMMAND_LIST = ("--help()","--vb_clear()","--history_clear()","--show_parameters()","--stats()","--memory()","--jobs()",
+                "--usage()")
 
 # 读取配置文件
 def reload_config():
@@ -79,33 +95,154 @@ class HotkeySignals(QObject):
 hotkey_signal = HotkeySignals()
 
 
-# AI响应生成线程
-class AIResponseThread(QThread):
-    response_ready = pyqtSignal(str)  # 响应准备完成信号
-    error_occurred = pyqtSignal(str)  # 错误发生信号
-    
-    def __init__(self, vector_db, app, message):
+# 把异步调度核心的回调投递到Qt主线程（跨线程信号为排队连接）
+class UiDispatcher(QObject):
+    invoke = pyqtSignal(object)
+
+    def __init__(self):
         super().__init__()
-        self.vector_db = vector_db
-        self.app = app
-        self.message = message
-    
-    def run(self):
-        
+        self.invoke.connect(lambda func: func())
+
+    def dispatch(self, func):
+        self.invoke.emit(func)
+
+
+# 测量Qt事件循环的延迟，供资源调节器调整后台线程数
+class UiLagMonitor(QObject):
+    def __init__(self, interval_ms=100):
+        super().__init__()
+        self.interval_ms = interval_ms
+        self.last_tick = time.perf_counter()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self._tick)
+
+    def start(self):
+        self.last_tick = time.perf_counter()
+        self.timer.start(self.interval_ms)
+
+    def _tick(self):
+        now = time.perf_counter()
+        lag_ms = (now - self.last_tick) * 1000 - self.interval_ms
+        self.last_tick = now
+        GOVERNOR.report_ui_lag(max(0.0, lag_ms))
+
+
+async def save_in_order(vector_db, app, role, content, previous=None):
+    """
+    保存消息（含嵌入计算）到历史与向量库，界面线程不执行模型推理
+
+    previous 为上一次保存任务，保证消息按提交顺序写入
+    """
+    if previous is not None:
         try:
-            mu = MessageUtils(self.vector_db, self.app)
-            
-            response = mu.generate_response(self.message)
-            
-            self.response_ready.emit(response)
-            
-        except Exception as e:
-            error_msg = f"生成回复时发生错误: {e}"
-            print(f"[error]:{error_msg}")
-            import traceback
-            print(f"[error]错误堆栈: {traceback.format_exc()}")
-            
-            self.error_occurred.emit("抱歉，处理您的消息时出现了问题，请稍后再试。")
+            await asyncio.shield(asyncio.wrap_future(previous))
+        except Exception:
+            pass
+    await ASYNC_CORE.run_sync(MessageUtils(vector_db, app).save_message, role, content)
+
+
+async def update_summary_after(saved):
+    """回复写入历史后增量更新滚动对话摘要"""
+    await asyncio.shield(asyncio.wrap_future(saved))
+    summarizer = ConversationSummarizer(CONFIG)
+    await ASYNC_CORE.run_sync(summarizer.update_exclusive, limit="llm", priority=BACKGROUND)
+
+
+async def run_turn(vector_db, app, message, saved=None):
+    """生成一轮AI回复（运行在异步调度核心上，被取消时中断进行中的LLM请求）"""
+    # 采样全部线程的开销较大，需要时通过 profile_all_threads 开启
+    with profiler.profile("turn", current_thread_only=not CONFIG.get("profile_all_threads", False)):
+        # 等待之前的消息写入历史，检索与上下文才能包含它们（取消本轮不会中断保存）
+        if saved is not None:
+            try:
+                await asyncio.shield(asyncio.wrap_future(saved))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[warning]保存消息失败，继续生成回复: {e}")
+        mu = MessageUtils(vector_db, app)
+        # 检索与上下文组装包含嵌入计算和文件读取，放到线程池中执行
+        messages = await ASYNC_CORE.run_sync(mu.make_messages, message)
+        async with ASYNC_CORE.limit("llm"):
+            return await AiChat().aget_message(messages, raise_on_error=True)
+
+
+# 对话轮次调度器
+class TurnScheduler:
+    """
+    保证同一时间只有一个AI生成任务
+
+    生成期间收到新消息时：
+    - coalesce: 取消进行中的生成，将未回复的消息合并为一次请求
+    - queue: 按顺序排队，上一条回复完成后再生成下一条
+    """
+
+    def __init__(self, controller, policy="coalesce"):
+        self.controller = controller
+        self.policy = policy if policy in ("coalesce", "queue") else "coalesce"
+        self.current = None             # 当前生成任务（concurrent.futures.Future）
+        self.current_messages = []      # 当前任务负责回复的消息
+        self.pending = []               # 等待生成的消息
+        self.turn_id = 0                # 用于识别已被取代的轮次
+
+    def is_busy(self):
+        return self.current is not None
+
+    def submit(self, message):
+        """提交一条用户消息"""
+        if self.current is None:
+            self._start([message])
+            return
+
+        if self.policy == "coalesce":
+            print("[info]生成期间收到新消息，取消当前生成并合并请求")
+            messages = self.current_messages + self.pending + [message]
+            self.pending = []
+            self.current.cancel()
+            self._start(messages)
+        else:
+            print(f"[info]生成期间收到新消息，排队等待（队列长度: {len(self.pending) + 1}）")
+            self.pending.append(message)
+
+    def cancel(self):
+        """取消进行中的生成并清空队列"""
+        self.pending = []
+        if self.current is not None:
+            self.current.cancel()
+            self.current = None
+            self.current_messages = []
+
+    def _start(self, messages):
+        self.turn_id += 1
+        turn_id = self.turn_id
+        self.current_messages = list(messages)
+        self.current = ASYNC_CORE.submit(
+            run_turn(self.controller.vector_db, self.controller.app, "\n".join(messages),
+                     saved=self.controller.last_save),
+            callback=lambda response: self._on_done(turn_id, response, False),
+            error_callback=lambda error: self._on_done(turn_id, error, True),
+        )
+
+    def _on_done(self, turn_id, result, is_error):
+        # 丢弃已被取代或取消的轮次
+        if turn_id != self.turn_id or self.current is None:
+            return
+        self.current = None
+        self.current_messages = []
+
+        if is_error and isinstance(result, BudgetExceededError):
+            print(f"[warning]{result}")
+            self.controller._on_ai_error("抱歉，今日的API用量已达到预算上限，请明天再试或在配置中调整预算。", None)
+        elif is_error:
+            print(f"[error]生成回复时发生错误: {result}")
+            self.controller._on_ai_error("抱歉，处理您的消息时出现了问题，请稍后再试。", None)
+        else:
+            self.controller._on_ai_response_ready(result, None)
+
+        if self.pending:
+            next_message = self.pending.pop(0)
+            self.controller.chat_window.set_ai_processing(True)
+            self._start([next_message])
 
 
 # 聊天控制器类
@@ -114,7 +251,18 @@ class ChatController:
         self.vector_db = vector_db
         self.app = app
         self.chat_window = None
-        self.ai_thread = None
+        self.turns = TurnScheduler(self, CONFIG.get("turn_policy", "coalesce"))
+        # 最近一次保存消息的任务（消息保存在异步调度核心上按顺序执行）
+        self.last_save = None
+
+        # 输入时预取记忆检索结果
+        self.prefetcher = None
+        if CONFIG.get("prefetch_enabled", True):
+            self.prefetcher = RetrievalPrefetcher(
+                lambda draft: MessageUtils(self.vector_db, self.app).retrieve_memories(draft),
+                vector_db=self.vector_db
+            )
+        self.app.prefetcher = self.prefetcher
         
     def create_chat_window(self):
         """创建聊天窗口"""
@@ -123,28 +271,25 @@ class ChatController:
             # 连接信号到控制器方法
             self.chat_window.message_sent.connect(self.handle_message)
             self.chat_window.command_executed.connect(self.handle_command)
+            if self.prefetcher is not None:
+                self.chat_window.draft_changed.connect(self.prefetcher.prefetch)
+            # 输入期间推迟后台任务
+            self.chat_window.draft_changed.connect(lambda draft: JOBS.mark_activity())
         return self.chat_window
     
     def handle_message(self, message):
         """处理用户消息"""
         
+        JOBS.mark_activity()
         try:
-            # 保存用户消息到历史记录（前端已经显示了用户消息）
-            mu = MessageUtils(self.vector_db, self.app)
-            mu.save_message("user", message)
+            # 保存用户消息到历史记录（前端已经显示了用户消息），嵌入计算不在界面线程进行
+            self._save_message("user", message)
             
             # 通过WebView接口显示思考气泡（前端会自动处理）
             self.chat_window.set_ai_processing(True)
             
-            # 异步生成AI回复
-            self.ai_thread = AIResponseThread(self.vector_db, self.app, message)
-            self.ai_thread.response_ready.connect(
-                lambda response: self._on_ai_response_ready(response, None)
-            )
-            self.ai_thread.error_occurred.connect(
-                lambda error: self._on_ai_error(error, None)
-            )
-            self.ai_thread.start()
+            # 异步生成AI回复（由调度器处理取消、合并与排队）
+            self.turns.submit(message)
                     
         except Exception as e:
             error_msg = f"处理消息时发生错误: {e}"
@@ -164,23 +309,25 @@ class ChatController:
         # 添加AI回复
         self.chat_window.add_ai_message(response)
         
-        # 保存AI回复
-        try:
-            mu = MessageUtils(self.vector_db, self.app)
-            mu.save_message("assistant", response)
-        except Exception as e:
-            print(f"[error]保存AI回复时发生错误: {e}")
+        # 保存AI回复，完成后在后台增量更新滚动对话摘要
+        save = self._save_message("assistant", response)
+        if CONFIG.get("summary_enabled", True):
+            ASYNC_CORE.submit(update_summary_after(save))
         
-        # L2D发送消息
+        # L2D发送消息（WebSocket连接在线程池中进行，不阻塞界面）
         if CONFIG.get("live2d_listen", False):
-            try:
-                l2d_instance = L2DVEX(CONFIG.get("live2d_uri", "ws://"))
-                l2d_instance.send_text_message(response)
-            except Exception as e:
-                print(f"[error]发送消息到Live2D失败: {e}")
+            ASYNC_CORE.submit(send_to_live2d(response))
         else:
             print(f"[info]Live2D监听已禁用，跳过")
     
+    def _save_message(self, role, content):
+        """在异步调度核心上按顺序保存消息"""
+        self.last_save = ASYNC_CORE.submit(
+            save_in_order(self.vector_db, self.app, role, content, self.last_save),
+            error_callback=lambda error: print(f"[error]保存{role}消息时发生错误: {error}")
+        )
+        return self.last_save
+
     def _on_ai_error(self, error_msg, thinking_bubble):
         """AI生成错误"""
         print(f"[error]AI生成错误: {error_msg}")
@@ -209,7 +356,7 @@ def load_todays_history():
         return []
     
     try:
-        with open(HISTORY_FILE, "r", encoding="utf-8") as f:
+        with STATS.span("history_io"), open(HISTORY_FILE, "r", encoding="utf-8") as f:
             data = json.load(f)
         
         total_messages = len(data.get("messages", []))
@@ -265,8 +412,17 @@ def toggle_chat_window():
             chat_window.show_animation()
 
 
-def hotkey_listener():
-    """热键监听函数，在单独的线程中运行"""
+async def send_to_live2d(text):
+    """发送文本到Live2D（按顺序逐条发送）"""
+    try:
+        l2d_instance = L2DVEX(CONFIG.get("live2d_uri", "ws://"))
+        await ASYNC_CORE.run_sync(l2d_instance.send_text_message, text, limit="live2d")
+    except Exception as e:
+        print(f"[error]发送消息到Live2D失败: {e}")
+
+
+def register_hotkeys():
+    """注册全局热键（keyboard库自带监听线程，无需额外保持线程）"""
     try:
         # 读取配置文件中的热键设置
         hotkey_raw = CONFIG.get("hotkey", "Alt+Q")
@@ -288,62 +444,62 @@ def hotkey_listener():
                 print(f"[info]使用默认热键: {default_hotkey}")
             except Exception as e2:
                 print(f"[error]连默认热键也注册失败: {e2}")
-        
-        # 保持线程运行
-        while True:
-            import time
-            time.sleep(60)  # 每分钟检查一次线程状态
-            
+
     except Exception as e:
         print(f"[error]热键监听器错误: {e}")
-        import time
-        time.sleep(5)
-
-
-def is_older_than_given_day(timestamp_str, current_time=None, day=7):
-    # 将时间字符串转为datetime对象
-    timestamp = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
-    # 如果没提供当前时间，则使用当前时间
-    if current_time is None:
-        current_time = datetime.now()
-    # 计算时间差
-    return current_time - timestamp > timedelta(days=day)
 
 
 def routine_clear():
+    """按配置的保留天数清理聊天记录，并移除向量数据库中的过期记录"""
     app = QApplication.instance()
-    # 第一步：清理JSON文件
-    history_file = "chat_history.json"
-    if is_json_file_empty(HISTORY_FILE):
-        app.vector_db.clear()
-        return
-
-    with open(history_file, "r", encoding="utf-8") as f:
-        data = json.load(f)    # 过滤超过配置天数的消息
-    current_time = datetime.now()
-    max_days = CONFIG.get("max_day", 7)  # 从配置文件读取保留天数，默认7天
-    old_count = len(data["messages"])
-    data["messages"] = [
-        msg for msg in data["messages"]
-        if not is_older_than_given_day(msg["timestamp"], current_time, max_days)
-    ]
-    new_count = len(data["messages"])
-    print(f"[info]清理JSON文件: 原始记录数: {old_count}, 清理后记录数: {new_count}")
-
-    # 写回文件
-    with open(history_file, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-    # 第二步：重建向量数据库
-    if hasattr(app, 'vector_db') and app.vector_db is not None:
-        # 使用清理后的消息重建向量数据库
-        app.vector_db.rebuild_with_add_message(data["messages"])
-    else:
-        print("[warning]向量数据库未初始化，跳过重建")
+    prune_history(getattr(app, 'vector_db', None), CONFIG.get("max_day", 7), HISTORY_FILE)
+
+
+async def retention_job():
+    """启动时与定期清理过期记录（在线程池中执行，不阻塞界面）"""
+    await ASYNC_CORE.run_sync(routine_clear, priority=BACKGROUND)
+
+
+async def checkpoint_job():
+    """定期保存有修改的向量数据库与用量记录"""
+    vector_db = getattr(QApplication.instance(), 'vector_db', None)
+    if vector_db is not None:
+        await ASYNC_CORE.run_sync(vector_db.checkpoint, priority=BACKGROUND)
+    await ASYNC_CORE.run_sync(USAGE.checkpoint, priority=BACKGROUND)
+
+
+async def cache_evict_job():
+    """清理过期的预取缓存与响应缓存"""
+    prefetcher = getattr(QApplication.instance(), 'prefetcher', None)
+    if prefetcher is not None:
+        prefetcher.evict_expired()
+    await ASYNC_CORE.run_sync(RESPONSE_CACHE.evict_expired)
+
+
+def register_jobs():
+    """注册周期任务：记录清理、向量库保存、缓存清理（邮箱检查由邮箱监听自行注册）"""
+    # 启动时的清理可能需要为缺失的记录计算嵌入（等待嵌入进程加载模型），同样放到后台执行
+    JOBS.add(Job("retention", retention_job, cron=CONFIG.get("retention_cron", "0 4 * * *"), run_at_start=True))
+    JOBS.add(Job("checkpoint", checkpoint_job, interval=CONFIG.get("checkpoint_interval_minutes", 10) * 60))
+    JOBS.add(Job("cache_evict", cache_evict_job, interval=300, when_busy="run"))
 
 
 def cleanup_on_exit(app):
     """应用退出时的清理工作"""
+    # 先停止后台任务，再保存数据
+    JOBS.stop()
+    if getattr(app, 'email_monitor', None) is not None:
+        app.email_monitor.stop()
+    if getattr(app, 'chat_controller', None) is not None:
+        app.chat_controller.turns.cancel()
+        # 等待尚未写入的消息保存完成
+        if app.chat_controller.last_save is not None:
+            try:
+                app.chat_controller.last_save.result(timeout=CONFIG.get("shutdown_timeout", 5))
+            except Exception as e:
+                print(f"[warning]等待消息保存失败: {e}")
+    ASYNC_CORE.shutdown(timeout=CONFIG.get("shutdown_timeout", 5))
+
     try:
         # 清理热键
         keyboard.unhook_all_hotkeys()
@@ -359,6 +515,16 @@ def cleanup_on_exit(app):
     except:
         pass
 
+    # 停止嵌入工作进程
+    if getattr(app, 'vector_db', None) is not None:
+        app.vector_db.close()
+
+    USAGE.checkpoint()
+
+    # 导出性能统计
+    if CONFIG.get("stats_dump_file"):
+        STATS.dump_json(CONFIG["stats_dump_file"])
+
 
 def start_app():
     """主应用启动函数"""
@@ -386,8 +552,23 @@ def start_app():
     hotkey_signal.toggle_signal.connect(toggle_chat_window)
     hotkey_signal.exit_signal.connect(lambda: app.quit())
 
-    # 启动热键监听线程
-    threading.Thread(target=hotkey_listener, daemon=True).start()
+    # 启动异步调度核心，回调投递到界面线程
+    app.ui_dispatcher = UiDispatcher()
+    ASYNC_CORE.set_dispatcher(app.ui_dispatcher.dispatch)
+    ASYNC_CORE.start({
+        "llm": CONFIG.get("llm_concurrency", 2),
+        "io": CONFIG.get("io_concurrency", 4),
+    }, reserved={"llm": CONFIG.get("llm_reserved_interactive", 1)})
+    JOBS.configure(CONFIG)
+    JOBS.start()
+
+    # 界面延迟升高时减少后台任务的线程数
+    if CONFIG.get("governor_enabled", True):
+        app.lag_monitor = UiLagMonitor()
+        app.lag_monitor.start()
+
+    # 注册热键
+    register_hotkeys()
     
     # 确保应用在退出时关闭所有资源
     app.aboutToQuit.connect(lambda: cleanup_on_exit(app))
@@ -404,8 +585,8 @@ def start_app():
     # 在应用启动时
     app.vector_db = VectorDatabase()
 
-    #清理记录
-    routine_clear()
+    #注册后台任务（记录清理在启动时执行一次，之后按 retention_cron 执行）
+    register_jobs()
 
     # 加载现有历史记录
     load_todays_history()
@@ -415,28 +596,30 @@ def start_app():
         l2d = L2DVEX(CONFIG.get("live2d_uri", "ws://"))
     
     #监听邮箱
+    app.email_monitor = None
     if CONFIG.get("receiveemail", False):
         # 从data.json读取邮件检查间隔
         try:
             with open('data.json', 'r', encoding='utf-8') as f:
                 email_config = json.load(f)
             check_interval_minutes = email_config.get("check_interval", 5)  # 默认5分钟
-            check_interval_seconds = check_interval_minutes * 60  # 转换为秒
-            
-            email_monitor = EmailMonitorThread("data.json", check_interval_seconds, app, app.vector_db)
-            email_monitor.start()
-            print(f"[info]邮箱监听线程已启动，检查间隔: {check_interval_minutes}分钟")
         except Exception as e:
             print(f"[error]读取邮件配置失败，使用默认间隔: {e}")
             # 如果读取失败，使用默认的5分钟间隔
-            email_monitor = EmailMonitorThread("data.json", 300, app, app.vector_db)
-            email_monitor.start()
-            print("[info]邮箱监听线程已启动，检查间隔: 5分钟（默认）")
+            check_interval_minutes = 5
+
+        app.email_monitor = EmailMonitor("data.json", check_interval_minutes * 60, app, app.vector_db)
+        if app.email_monitor.start(ASYNC_CORE):
+            print(f"[info]邮箱监听已启动，检查间隔: {check_interval_minutes}分钟")
 
     # 成功标志
     print("[tips]对话框中输入--help()获取命令集")
     print("[info]初始化成功!按下热键唤起聊天窗口")
 
+    # 启动阶段采样到此结束
+    if STARTUP_PROFILER is not None:
+        STARTUP_PROFILER.stop()
+
     # 进入事件循环
     app.exec_()
 
@@ -1,4 +1,11 @@
 from faiss_utils import VectorDatabase
+from perf_stats import STATS
+from resource_governor import GOVERNOR
+from priority_scheduler import SCHEDULER
+from job_scheduler import JOBS
+from rate_limiter import RATE_LIMITER
+from response_cache import RESPONSE_CACHE
+from usage_stats import USAGE, FEATURE_NAMES
 import json
 
 
@@ -16,6 +23,14 @@ def cmd_exec(vector_db: VectorDatabase,msg):
         cmdd.history_clear()
     elif msg == "--show_parameters()":
         cmdd.show_parameters()
+    elif msg == "--stats()":
+        cmdd.stats()
+    elif msg == "--memory()":
+        cmdd.memory()
+    elif msg == "--jobs()":
+        cmdd.jobs()
+    elif msg == "--usage()":
+        cmdd.usage()
 
 class Command:
     def __init__(self, vector_db: VectorDatabase):
@@ -30,6 +45,10 @@ class Command:
         print(">--vb_clear(): 清除向量数据库并重建")
         print(">--history_clear(): 清除对话历史")
         print(">--show_parameters(): 显示当前运行参数")
+        print(">--stats(): 显示各阶段延迟统计(p50/p95/p99)")
+        print(">--memory(): 显示嵌入模型的加载状态与内存占用")
+        print(">--jobs(): 显示后台周期任务的执行情况")
+        print(">--usage(): 显示最近7天各场景的API用量、费用与延迟")
 
 
     def vb_clear(self):
@@ -62,4 +81,73 @@ class Command:
         print(f"> ai_api: {api_model}")
         print("> vector_db: Faiss")
         print(f"> embed_model: {model_name}")
-        print("> db: JSON")
\ No newline at end of file
+        print("> db: JSON")
+
+    def stats(self):
+        """显示各阶段延迟统计"""
+        print("[stats]各阶段延迟统计：")
+        print(STATS.format_table())
+        governor = GOVERNOR.stats()
+        print(f"> threads: {governor['threads']} (interactive {governor['interactive_threads']}, "
+              f"background {governor['background_threads']}/{governor['background_max']}), "
+              f"ui_lag: {governor['ui_lag_ms']}ms")
+        for name, slots in SCHEDULER.stats().items():
+            print(f"> {name}: capacity {slots['capacity']} (reserved {slots['reserved']}), "
+                  f"in_use {slots['in_use']}, waiting {slots['waiting']}")
+        rate = RATE_LIMITER.stats()
+        if rate['rpm'] or rate['tpm']:
+            print(f"> rate: rpm {rate['requests_available']}/{rate['rpm'] or '-'}, "
+                  f"tpm {rate['tokens_available']}/{rate['tpm'] or '-'}, waiting {rate['waiting']}, "
+                  f"throttled {rate['throttled']}, 429: {rate['rate_limited']}")
+        cache = RESPONSE_CACHE.stats()
+        if cache['hits'] or cache['misses']:
+            print(f"> response_cache: {cache['entries']}/{cache['max_entries']} entries, "
+                  f"hits {cache['hits']}, misses {cache['misses']}, hit_rate {cache['hit_rate']}")
+
+        # 配置了导出文件时同时写入JSON
+        try:
+            with open('config.json', 'r', encoding='utf-8') as f:
+                dump_file = json.load(f).get('stats_dump_file', '')
+        except Exception:
+            dump_file = ''
+        if dump_file and STATS.dump_json(dump_file):
+            print(f"[info]统计结果已写入: {dump_file}")
+
+    def memory(self):
+        """显示嵌入模型的加载状态与内存占用"""
+        stats = self.vector_db.memory_stats()
+        print("[memory]嵌入模型内存：")
+        print(f"> backend: {stats['backend']}")
+        print(f"> model_loaded: {stats['model_loaded']}")
+        print(f"> idle: {stats['idle_s']:.0f}s, unloads: {stats['unloads']}")
+        print(f"> main_rss: {stats['rss_mb']} MB")
+        if "worker_rss_mb" in stats:
+            print(f"> worker_rss: {stats['worker_rss_mb']} MB")
+
+    def jobs(self):
+        """显示后台周期任务的执行情况"""
+        print("[jobs]后台周期任务：")
+        for name, job in JOBS.stats().items():
+            duration = f"{job['last_duration_ms']}ms" if job['last_duration_ms'] is not None else "-"
+            print(f"> {name} ({job['schedule']}): runs {job['runs']}, failures {job['failures']}, "
+                  f"deferred {job['deferred']}, skipped {job['skipped']}")
+            print(f"  last: {job['last_run'] or '-'} ({duration}), next: {job['next_run'] or '-'}")
+            if job['last_error']:
+                print(f"  error: {job['last_error']}")
+
+    def usage(self):
+        """显示最近7天各场景的API用量、费用与延迟"""
+        summary = USAGE.summary()
+        print("[usage]API用量（输入/缓存命中/输出token，费用，平均延迟）：")
+        for day, features in summary['days'].items():
+            print(f"> {day}")
+            for feature, item in features.items():
+                latency = f"{item['avg_latency_ms']}ms" if item['avg_latency_ms'] is not None else "-"
+                print(f"  {FEATURE_NAMES.get(feature, feature)}: calls {item['calls']} (errors {item['errors']}), "
+                      f"tokens {item['prompt_tokens']}/{item['cached_tokens']}/{item['completion_tokens']}, "
+                      f"cost {item['cost']}, latency {latency}")
+        budget = summary['budget']
+        if budget['tokens'] or budget['cost']:
+            print(f"> budget: tokens {budget['tokens'] or '-'}, cost {budget['cost'] or '-'}, "
+                  f"used {budget['used']:.0%} (background stops at {budget['background_ratio']:.0%}), "
+                  f"rejected {budget['rejected']}")
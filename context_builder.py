@@ -0,0 +1,241 @@
+"""
+上下文组装模块
+按token预算与优先级组装发送给LLM的消息，保证提示词长度可预测
+"""
+
+import re
+
+# 中日韩字符，每个字符大致对应一个token
+CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+# 每条消息的固定开销（role、分隔符等）
+MESSAGE_OVERHEAD = 4
+
+RECENT_HEADER = "以下是你的最近聊天记录，请参考："
+MEMORY_HEADER = "以下是从你的记忆库中提取的相关信息："
+
+
+def estimate_tokens(text: str) -> int:
+    """没有本地分词器时的粗略估算：CJK按字计，其余按4字符/token计"""
+    if not text:
+        return 0
+    cjk_count = len(CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + (other_count + 3) // 4
+
+
+class TokenCounter:
+    """使用本地分词器统计token数量"""
+
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer
+
+    def count(self, text: str) -> int:
+        """统计文本的token数"""
+        if not text:
+            return 0
+        if self.tokenizer is not None:
+            try:
+                return len(self.tokenizer.encode(text, add_special_tokens=False))
+            except Exception as e:
+                print(f"[warning]分词器计数失败，改用估算: {e}")
+                self.tokenizer = None
+        return estimate_tokens(text)
+
+    def count_message(self, message: dict) -> int:
+        """统计单条消息的token数（含固定开销）"""
+        return self.count(message.get("content", "")) + MESSAGE_OVERHEAD
+
+
+class ContextBuilder:
+    """
+    按优先级在token预算内填充上下文
+
+    优先级（从高到低）：
+    1. 系统预设与当前输入（必选）
+    2. 最近的 recent_min 条聊天记录
+    3. 记忆库检索结果（按相似度顺序）
+    4. 其余较早的最近聊天记录
+    """
+
+    def __init__(self, counter: TokenCounter, budget: int = 3000, recent_min: int = 2):
+        self.counter = counter
+        self.budget = budget
+        self.recent_min = recent_min
+        self.used_tokens = 0
+
+    def _dedupe(self, input: str, recent: list[dict], memories: list[dict]):
+        """
+        去除重复条目：刚保存的当前输入、最近记录与检索结果内部的重复消息
+
+        同时出现在最近记录和检索结果中的消息在 select 中按实际选中的最近记录处理
+        """
+        input_ids = set()
+
+        # 末尾刚保存的用户输入已作为当前输入发送，不再作为历史重复发送；
+        # 合并发送时当前输入由多条消息以换行连接，从末尾起逐条与之精确匹配
+        remaining = input
+        while recent and recent[-1].get("role") == "user":
+            content = recent[-1].get("content") or ""
+            if not content:
+                break
+            if remaining == content:
+                remaining = ""
+            elif remaining.endswith("\n" + content):
+                remaining = remaining[:-len(content) - 1]
+            else:
+                break
+            input_ids.add(recent[-1].get("id"))
+            recent = recent[:-1]
+            if not remaining:
+                break
+
+        seen_ids = set(input_ids)
+        unique_recent = []
+        for item in recent:
+            item_id = item.get("id")
+            if item_id is not None and item_id in seen_ids:
+                continue
+            # 排队处理的输入可能已不在末尾
+            if item.get("role") == "user" and item.get("content") == input:
+                continue
+            seen_ids.add(item_id)
+            unique_recent.append(item)
+
+        # 检索结果只与当前输入和彼此去重
+        seen_ids = set(input_ids)
+        unique_memories = []
+        for item in memories:
+            item_id = item.get("id")
+            if item_id is not None and item_id in seen_ids:
+                continue
+            if item.get("content") == input:
+                continue
+            seen_ids.add(item_id)
+            unique_memories.append(item)
+
+        return unique_recent, unique_memories
+
+    def _take(self, message: dict) -> bool:
+        """在预算允许时占用该消息的token"""
+        cost = self.counter.count_message(message)
+        if self.used_tokens + cost > self.budget:
+            return False
+        self.used_tokens += cost
+        return True
+
+    def select(self, input: str, system_messages: list[dict],
+               recent: list[dict], memories: list[dict],
+               recent_limit: int = None, memory_limit: int = None, layout: str = None):
+        """
+        在预算内挑选最近记录和记忆
+
+        Args:
+            input: 当前用户输入
+            system_messages: 系统预设消息
+            recent: 最近聊天记录（从旧到新）
+            memories: 记忆检索结果（按优先级排序）
+            recent_limit: 去重后最多保留的最近记录条数
+            memory_limit: 去重后最多保留的记忆条数（与最近记录重复的不计入）
+            layout: 提示词布局版本，决定需要计入的标题
+
+        Returns:
+            tuple: (选中的最近记录, 选中的记忆)，均保持原有顺序
+        """
+        recent, memories = self._dedupe(input, recent, memories)
+        if recent_limit is not None:
+            recent = recent[-recent_limit:] if recent_limit > 0 else []
+
+        # 从新到旧为最近记录编号；检索结果与之重复时记下对应位置
+        newest_first = list(reversed(recent))
+        recent_pos = {item.get("id"): pos for pos, item in enumerate(newest_first) if item.get("id") is not None}
+        if memory_limit is not None:
+            limited, count = [], 0
+            for item in memories:
+                if item.get("id") in recent_pos:
+                    limited.append(item)
+                elif count < memory_limit:
+                    limited.append(item)
+                    count += 1
+            memories = limited
+
+        # 必选部分（只计入所用布局实际输出的标题）
+        self.used_tokens = sum(self.counter.count_message(m) for m in system_messages)
+        self.used_tokens += self.counter.count_message({"content": input})
+        if recent and (layout or DEFAULT_LAYOUT) == "v1":
+            self.used_tokens += self.counter.count_message({"content": RECENT_HEADER})
+        if any(item.get("id") not in recent_pos for item in memories):
+            self.used_tokens += self.counter.count_message({"content": MEMORY_HEADER})
+
+        chosen_recent = set()
+        for pos, item in enumerate(newest_first[:self.recent_min]):
+            if self._take(item):
+                chosen_recent.add(pos)
+
+        chosen_memories = []
+        for item in memories:
+            pos = recent_pos.get(item.get("id"))
+            if pos is None:
+                if self._take(item):
+                    chosen_memories.append(item)
+            elif pos not in chosen_recent and self._take(newest_first[pos]):
+                # 与最近记录重复的记忆按记忆的优先级占用预算，仍在最近记录中的原位置发送
+                chosen_recent.add(pos)
+
+        for pos, item in enumerate(newest_first):
+            if pos >= self.recent_min and self._take(item):
+                chosen_recent.add(pos)
+
+        selected_recent = [item for pos, item in enumerate(newest_first) if pos in chosen_recent]
+        selected_recent.reverse()
+        return selected_recent, chosen_memories
+
+
+# 提示词布局版本
+# v1: 旧布局（当前输入 → 最近记录 → 记忆 → 系统预设）
+# v2: 前缀缓存友好布局（系统预设 → 记忆块 → 最近记录 → 当前输入）
+PROMPT_LAYOUTS = ("v1", "v2")
+DEFAULT_LAYOUT = "v2"
+
+
+def format_memory_block(memories: list[dict]) -> str:
+    """将记忆合并为单个文本块，按时间排序保证相同记忆集合生成相同前缀"""
+    lines = [MEMORY_HEADER]
+    for item in sorted(memories, key=lambda m: (m.get("timestamp", ""), m.get("id") or "")):
+        role = "用户" if item.get("role") == "user" else "助手"
+        lines.append(f"[{item.get('timestamp', '')}] {role}: {item.get('content', '')}")
+    return "\n".join(lines)
+
+
+def assemble_messages(layout: str, input: str, system_messages: list[dict],
+                      recent: list[dict], memories: list[dict]) -> list[dict]:
+    """按指定布局版本拼装最终消息列表"""
+    if layout not in PROMPT_LAYOUTS:
+        print(f"[warning]未知的提示词布局: {layout}，使用 {DEFAULT_LAYOUT}")
+        layout = DEFAULT_LAYOUT
+
+    recent_messages = [
+        {"role": item.get("role", "user"), "content": item.get("content", "")}
+        for item in recent
+    ]
+
+    if layout == "v1":
+        messages = [{"role": "user", "content": input}]
+        if recent_messages:
+            messages.append({"role": "system", "content": RECENT_HEADER})
+            messages.extend(recent_messages)
+        if memories:
+            messages.append({"role": "system", "content": MEMORY_HEADER})
+            messages.extend(
+                {"role": item.get("role", "user"), "content": item.get("content", "")}
+                for item in memories
+            )
+        messages.extend(system_messages)
+        return messages
+
+    # v2: 变化越慢的内容越靠前，最大化提供方的前缀缓存命中
+    messages = list(system_messages)
+    if memories:
+        messages.append({"role": "system", "content": format_memory_block(memories)})
+    messages.extend(recent_messages)
+    messages.append({"role": "user", "content": input})
+    return messages
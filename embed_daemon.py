@@ -0,0 +1,358 @@
+"""
+共享嵌入服务
+多个liveAgent实例（不同人设/配置）共用一个嵌入模型进程，避免每个进程各自加载模型与torch运行时。
+默认监听Unix套接字（不支持时使用本机TCP端口），在短时间窗口内把不同客户端的请求合并为一批计算。
+
+协议：每帧为 8字节头（JSON头长度、负载长度，网络字节序）+ JSON头 + 负载
+    {"op": "info"}                  → {"ok": true, "model": ..., "dimension": ...}
+    {"op": "embed", "texts": [...]} → {"ok": true, "rows": n, "dimension": d} + n×d 个float32
+    {"op": "stats"}                 → {"ok": true, "queue_depth": ..., ...}
+
+用法:
+    python embed_daemon.py
+    python embed_daemon.py --address 127.0.0.1:8767 --wait-ms 10
+启动后，配置了 embed_daemon 的实例会自动使用该服务
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from embed_worker import load_sentence_model
+
+FRAME_HEADER = struct.Struct("!II")
+DEFAULT_TCP_PORT = 8767
+
+
+def default_address():
+    """默认地址：支持Unix套接字时使用临时目录下的套接字文件，否则使用本机TCP端口"""
+    if hasattr(socket, "AF_UNIX"):
+        return os.path.join(tempfile.gettempdir(), "liveagent-embed.sock")
+    return ("127.0.0.1", DEFAULT_TCP_PORT)
+
+
+def parse_address(address: str = ""):
+    """
+    解析地址配置
+
+    "" → 默认地址；"unix:/path/to.sock" → Unix套接字；"host:port" → TCP
+    """
+    if not address:
+        return default_address()
+    if address.startswith("unix:"):
+        return address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+def format_address(address) -> str:
+    return f"unix:{address}" if isinstance(address, str) else f"{address[0]}:{address[1]}"
+
+
+def pack_frame(header: dict, payload: bytes = b"") -> bytes:
+    data = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    return FRAME_HEADER.pack(len(data), len(payload)) + data + payload
+
+
+class EmbedDaemon:
+    """嵌入服务端：按连接读取请求，由单个批处理协程合并计算"""
+
+    def __init__(self, model_name: str, max_batch: int = 64, batch_wait_ms: float = 10):
+        self.model_name = model_name
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait_ms / 1000
+        self.model = None
+        self.dimension = None
+        self.queue = None
+        self.pending_texts = 0
+        self.clients = 0
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+        self.started_at = time.time()
+        # 模型推理在单独线程中进行，不阻塞事件循环
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-daemon")
+
+    def load(self):
+        self.model = load_sentence_model(self.model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "clients": self.clients,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "pending_texts": self.pending_texts,
+            "batches": self.batches,
+            "requests": self.requests,
+            "texts": self.texts,
+            "avg_batch": round(self.texts / self.batches, 2) if self.batches else 0,
+            "uptime_s": round(time.time() - self.started_at, 1),
+        }
+
+    async def serve(self, address):
+        self.queue = asyncio.Queue()
+        batcher = asyncio.create_task(self._batch_loop())
+        if isinstance(address, str):
+            server = await asyncio.start_unix_server(self._handle_client, path=address)
+        else:
+            server = await asyncio.start_server(self._handle_client, address[0], address[1])
+        print(f"[info]嵌入服务已启动: {format_address(address)}（模型: {self.model_name}）")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self._executor.shutdown(wait=False)
+
+    async def _handle_client(self, reader, writer):
+        self.clients += 1
+        try:
+            while True:
+                try:
+                    head = await reader.readexactly(FRAME_HEADER.size)
+                except asyncio.IncompleteReadError:
+                    break
+                header_len, payload_len = FRAME_HEADER.unpack(head)
+                request = json.loads(await reader.readexactly(header_len))
+                if payload_len:
+                    await reader.readexactly(payload_len)
+                writer.write(await self._dispatch(request))
+                await writer.drain()
+        except (ConnectionError, json.JSONDecodeError) as e:
+            print(f"[warning]嵌入服务连接异常: {e}")
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def _dispatch(self, request: dict) -> bytes:
+        op = request.get("op")
+        if op == "info":
+            return pack_frame({"ok": True, "model": self.model_name, "dimension": self.dimension})
+        if op == "stats":
+            return pack_frame({"ok": True, **self.stats()})
+        if op != "embed":
+            return pack_frame({"ok": False, "error": f"未知操作: {op}"})
+
+        texts = [str(t) for t in request.get("texts", [])]
+        if not texts:
+            return pack_frame({"ok": True, "rows": 0, "dimension": self.dimension})
+        future = asyncio.get_running_loop().create_future()
+        self.pending_texts += len(texts)
+        await self.queue.put((texts, future))
+        try:
+            vectors = await future
+        except Exception as e:
+            return pack_frame({"ok": False, "error": repr(e)})
+        return pack_frame({"ok": True, "rows": len(texts), "dimension": self.dimension},
+                          np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            count = len(batch[0][0])
+            # 等待其他客户端的请求合并到同一批
+            deadline = loop.time() + self.batch_wait
+            while count < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                count += len(item[0])
+
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            self.pending_texts -= len(texts)
+            try:
+                vectors = await loop.run_in_executor(
+                    self._executor, lambda: self.model.encode(texts, batch_size=len(texts)))
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            self.texts += len(texts)
+            offset = 0
+            for item_texts, future in batch:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+
+class EmbedDaemonClient:
+    """
+    嵌入服务客户端（与 EmbedWorker 接口一致：encode / aencode / stats / stop）
+
+    每个线程使用独立连接，连接断开时自动重连一次
+    """
+
+    def __init__(self, address, timeout: float = 60):
+        self.address = address
+        self.timeout = timeout
+        self.model_name = None
+        self.dimension = None
+        self._local = threading.local()
+        self._sockets = []
+        self._sockets_lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, address, model_name: str = None, timeout: float = 60):
+        """
+        连接嵌入服务，服务不可用或模型不一致时返回None
+        """
+        client = cls(address, timeout)
+        try:
+            info = client._request({"op": "info"})[0]
+        except OSError:
+            client.stop()
+            return None
+        if model_name and info.get("model") != model_name:
+            print(f"[warning]嵌入服务使用的模型({info.get('model')})与配置({model_name})不一致，不使用该服务")
+            client.stop()
+            return None
+        client.model_name = info.get("model")
+        client.dimension = info.get("dimension")
+        return client
+
+    def _open(self):
+        if isinstance(self.address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.address)
+        except OSError:
+            sock.close()
+            raise
+        with self._sockets_lock:
+            self._sockets.append(sock)
+        return sock
+
+    def _close(self, sock):
+        with self._sockets_lock:
+            if sock in self._sockets:
+                self._sockets.remove(sock)
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    @staticmethod
+    def _recv_exact(sock, size: int) -> bytes:
+        chunks = []
+        while size > 0:
+            chunk = sock.recv(min(size, 1 << 20))
+            if not chunk:
+                raise ConnectionError("嵌入服务连接已关闭")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def _request(self, header: dict) -> tuple[dict, bytes]:
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None)
+            try:
+                if sock is None:
+                    sock = self._local.sock = self._open()
+                sock.sendall(pack_frame(header))
+                header_len, payload_len = FRAME_HEADER.unpack(self._recv_exact(sock, FRAME_HEADER.size))
+                response = json.loads(self._recv_exact(sock, header_len))
+                payload = self._recv_exact(sock, payload_len) if payload_len else b""
+                break
+            except OSError:
+                # 服务重启等情况下旧连接失效，重连一次
+                if sock is not None:
+                    self._close(sock)
+                self._local.sock = None
+                if attempt == 1:
+                    raise
+        if not response.get("ok"):
+            raise RuntimeError(f"嵌入服务返回错误: {response.get('error')}")
+        return response, payload
+
+    def encode(self, texts):
+        """同步编码（与 SentenceTransformer.encode 的返回形状一致）"""
+        single = isinstance(texts, str)
+        response, payload = self._request({"op": "embed", "texts": [texts] if single else list(texts)})
+        vectors = np.frombuffer(payload, dtype=np.float32).reshape(response["rows"], response["dimension"])
+        return vectors[0] if single else vectors
+
+    async def aencode(self, texts):
+        """异步编码（阻塞的套接字读写放到默认线程池中）"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.encode, texts)
+
+    def stats(self) -> dict:
+        try:
+            return self._request({"op": "stats"})[0]
+        except (OSError, RuntimeError) as e:
+            return {"error": str(e)}
+
+    def stop(self):
+        """关闭本客户端的全部连接（不影响服务本身）"""
+        with self._sockets_lock:
+            sockets, self._sockets = self._sockets, []
+        for sock in sockets:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+
+def main():
+    try:
+        with open('config.json', 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except Exception as e:
+        print(f"[warning]读取配置文件失败，使用默认参数: {e}")
+        config = {}
+
+    parser = argparse.ArgumentParser(description="liveAgent 共享嵌入服务")
+    parser.add_argument("--address", default=config.get("embed_daemon_address", ""),
+                        help="监听地址：unix:/path/to.sock 或 host:port，留空使用默认地址")
+    parser.add_argument("--model", default=config.get("model", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"))
+    parser.add_argument("--wait-ms", type=float, default=config.get("embed_daemon_wait_ms", 10), help="合并请求的等待窗口（毫秒）")
+    parser.add_argument("--max-batch", type=int, default=config.get("embed_max_batch", 64), help="单批最多文本数")
+    args = parser.parse_args()
+
+    address = parse_address(args.address)
+    if isinstance(address, str) and os.path.exists(address):
+        # 已有服务在运行时退出，否则删除残留的套接字文件
+        client = EmbedDaemonClient.connect(address)
+        if client is not None:
+            client.stop()
+            print(f"[error]嵌入服务已在运行: {format_address(address)}")
+            return
+        os.remove(address)
+
+    start_time = time.time()
+    daemon = EmbedDaemon(args.model, args.max_batch, args.wait_ms)
+    daemon.load()
+    print(f"[info]模型加载完成，用时: {time.time() - start_time:.2f}秒")
+    try:
+        asyncio.run(daemon.serve(address))
+    except KeyboardInterrupt:
+        print("[info]嵌入服务已退出")
+    finally:
+        if isinstance(address, str) and os.path.exists(address):
+            os.remove(address)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+进程外嵌入计算
+嵌入模型运行在独立的工作进程中，结果通过共享内存缓冲区返回，避免模型推理占用主进程的GIL：
+- 多个线程的请求在短时间窗口内合并为一批发送
+- 工作进程崩溃时自动重启并重试当前批次
+- 提供同步 encode 与异步 aencode 接口
+"""
+
+import os
+import gc
+import sys
+import time
+import queue
+import asyncio
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from resource_governor import GOVERNOR
+
+
+def resolve_model_path(model_name: str) -> str:
+    """本地缓存的模型路径（local_models/模型名最后一段）"""
+    model_folder_name = model_name.split('/')[-1] if '/' in model_name else model_name
+    return os.path.join('local_models', model_folder_name)
+
+
+def load_sentence_model(model_name: str):
+    """加载 SentenceTransformer 模型（优先使用本地缓存，首次使用时下载并保存）"""
+    from sentence_transformers import SentenceTransformer
+
+    local_model_path = resolve_model_path(model_name)
+    print(f"[info]使用模型: {model_name}")
+    print(f"[info]本地路径: {local_model_path}")
+
+    # 检查本地是否有模型，如果没有则下载
+    if os.path.exists(local_model_path):
+        print("[info]使用本地缓存的模型")
+        return SentenceTransformer(local_model_path)
+
+    print("[info]首次使用，下载模型中...")
+    model = SentenceTransformer(model_name)
+    # 创建目录并保存模型
+    os.makedirs('local_models', exist_ok=True)
+    model.save(local_model_path)
+    print(f"[info]模型已保存到: {local_model_path}")
+    return model
+
+
+def release_model_memory():
+    """释放已卸载模型占用的内存（回收对象并清空CUDA缓存）"""
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def _worker_main(model_name: str, requests, responses, buffer_rows: int):
+    """工作进程入口：加载模型，循环处理编码请求并把结果写入共享内存"""
+    try:
+        model = load_sentence_model(model_name)
+        dimension = model.get_sentence_embedding_dimension()
+        shm = shared_memory.SharedMemory(create=True, size=buffer_rows * dimension * 4)
+    except Exception as e:
+        responses.put(("failed", repr(e)))
+        return
+
+    out = np.ndarray((buffer_rows, dimension), dtype=np.float32, buffer=shm.buf)
+    responses.put(("ready", dimension, shm.name))
+    threads = None
+    try:
+        while True:
+            message = requests.get()
+            if message is None:
+                break
+            batch_id, texts, requested_threads = message
+            try:
+                # 线程数由主进程的资源调节器按上下文决定
+                if requested_threads and requested_threads != threads:
+                    import torch
+                    torch.set_num_threads(requested_threads)
+                    threads = requested_threads
+                vectors = model.encode(texts, batch_size=len(texts))
+                out[:len(texts)] = vectors
+                responses.put(("done", batch_id, len(texts)))
+            except Exception as e:
+                responses.put(("error", batch_id, repr(e)))
+    finally:
+        del out
+        # 共享内存由主进程负责释放
+        shm.close()
+
+
+@contextmanager
+def _skip_main_import():
+    """
+    启动spawn子进程时不在子进程中重新导入主脚本
+
+    spawn默认把主脚本作为 __mp_main__ 再执行一遍，界面入口 chat_part.py 的模块级代码
+    （导入PyQt与keyboard、启动采样、创建热键信号和配置文件）会在每个工作进程中重复执行；
+    工作进程入口在本模块中，不依赖主脚本，因此在 Process.start() 期间暂时隐藏主模块的路径
+    """
+    main_module = sys.modules.get("__main__")
+    saved = {name: main_module.__dict__[name] for name in ("__file__", "__spec__")
+             if main_module is not None and name in main_module.__dict__}
+    for name in saved:
+        if name == "__spec__":
+            main_module.__spec__ = None
+        else:
+            del main_module.__dict__[name]
+    try:
+        yield
+    finally:
+        main_module.__dict__.update(saved)
+
+
+class EmbedWorker:
+    """嵌入工作进程的主进程端（线程安全）"""
+
+    def __init__(self, model_name: str, max_batch: int = 64, batch_wait_ms: float = 5,
+                 buffer_rows: int = 256, start_timeout: float = 600, max_restarts: int = 5):
+        """
+        Args:
+            model_name: SentenceTransformer 模型名
+            max_batch: 单批最多合并的文本数
+            batch_wait_ms: 收到请求后等待更多请求合并的时间
+            buffer_rows: 共享内存缓冲区行数（单次发送给工作进程的最大文本数）
+            start_timeout: 等待工作进程加载模型的最长时间（秒）
+            max_restarts: 最多自动重启次数
+        """
+        self.model_name = model_name
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait_ms / 1000
+        self.buffer_rows = buffer_rows
+        self.start_timeout = start_timeout
+        self.max_restarts = max_restarts
+        self.dimension = None
+
+        self._ctx = mp.get_context("spawn")
+        self._process = None
+        self._requests = None
+        self._responses = None
+        self._shm = None
+        self._out = None
+        self._pending = queue.Queue()
+        self._dispatcher = None
+        self._running = False
+        self._lock = threading.Lock()
+        # 保护工作进程的启动、卸载与请求收发
+        self._process_lock = threading.RLock()
+        self._batch_id = 0
+
+        self.restarts = 0
+        self.batches = 0
+        self.requests = 0
+
+    # ---------- 进程管理 ----------
+
+    def start(self):
+        """启动工作进程并等待模型加载完成（重复调用无效果）"""
+        with self._lock:
+            if self._running:
+                return self
+            self._spawn()
+            self._running = True
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="embed-dispatch", daemon=True)
+            self._dispatcher.start()
+        return self
+
+    def _spawn(self):
+        self._requests = self._ctx.Queue()
+        self._responses = self._ctx.Queue()
+        self._process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.model_name, self._requests, self._responses, self.buffer_rows),
+            name="embed-worker",
+            daemon=True,
+        )
+        start_time = time.time()
+        with _skip_main_import():
+            self._process.start()
+
+        deadline = start_time + self.start_timeout
+        while True:
+            try:
+                message = self._responses.get(timeout=0.5)
+                break
+            except queue.Empty:
+                if not self._process.is_alive() or time.time() > deadline:
+                    self._process.kill()
+                    raise RuntimeError("嵌入工作进程启动失败")
+        if message[0] != "ready":
+            raise RuntimeError(f"嵌入工作进程加载模型失败: {message[1]}")
+
+        _, self.dimension, shm_name = message
+        self._shm = shared_memory.SharedMemory(name=shm_name)
+        self._out = np.ndarray((self.buffer_rows, self.dimension), dtype=np.float32, buffer=self._shm.buf)
+        print(f"[info]嵌入工作进程已启动(pid={self._process.pid})，用时: {time.time() - start_time:.2f}秒")
+
+    def _release(self):
+        """释放当前工作进程与共享内存"""
+        if self._process is not None and self._process.is_alive():
+            try:
+                self._requests.put(None)
+                self._process.join(timeout=3)
+            except Exception:
+                pass
+            if self._process.is_alive():
+                self._process.kill()
+        self._out = None
+        if self._shm is not None:
+            try:
+                self._shm.close()
+                self._shm.unlink()
+            except Exception:
+                pass
+            self._shm = None
+
+    def _restart(self):
+        if self.restarts >= self.max_restarts:
+            raise RuntimeError(f"嵌入工作进程已重启{self.restarts}次，不再重启")
+        self.restarts += 1
+        print(f"[warning]嵌入工作进程已退出，正在重启（第{self.restarts}次）")
+        self._release()
+        self._spawn()
+
+    def stop(self):
+        """停止分发线程与工作进程"""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+        self._pending.put(None)
+        if self._dispatcher is not None:
+            self._dispatcher.join(timeout=5)
+        self._release()
+        print("[info]嵌入工作进程已停止")
+
+    def unload(self) -> bool:
+        """停止工作进程以释放模型（分发线程继续运行，下一次请求时重新启动）"""
+        with self._process_lock:
+            if self._process is None:
+                return False
+            self._release()
+            self._process = None
+        return True
+
+    def is_alive(self) -> bool:
+        return self._running and self._process is not None and self._process.is_alive()
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process is not None else None
+
+    # ---------- 请求接口 ----------
+
+    def submit(self, texts: list[str]) -> Future:
+        """提交一组文本，返回以 (len(texts), dimension) 数组完成的 Future"""
+        future = Future()
+        if not self._running:
+            future.set_exception(RuntimeError("嵌入工作进程未启动"))
+            return future
+        self._pending.put((list(texts), future))
+        return future
+
+    def encode(self, texts):
+        """同步编码（与 SentenceTransformer.encode 的返回形状一致）"""
+        single = isinstance(texts, str)
+        vectors = self.submit([texts] if single else texts).result()
+        return vectors[0] if single else vectors
+
+    async def aencode(self, texts):
+        """异步编码"""
+        single = isinstance(texts, str)
+        vectors = await asyncio.wrap_future(self.submit([texts] if single else texts))
+        return vectors[0] if single else vectors
+
+    def stats(self) -> dict:
+        return {
+            "alive": self.is_alive(),
+            "pid": self.pid,
+            "restarts": self.restarts,
+            "batches": self.batches,
+            "requests": self.requests,
+            "queue_depth": self._pending.qsize(),
+        }
+
+    # ---------- 批处理 ----------
+
+    def _dispatch_loop(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            # 在短窗口内合并更多请求
+            batch = [item]
+            count = len(item[0])
+            deadline = time.perf_counter() + self.batch_wait
+            while count < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._pending.put(None)
+                    break
+                batch.append(item)
+                count += len(item[0])
+            self._run_batch(batch)
+
+        # 退出时让仍在等待的请求失败
+        while True:
+            try:
+                item = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(RuntimeError("嵌入工作进程已停止"))
+
+    def _run_batch(self, batch):
+        texts = [text for item_texts, _ in batch for text in item_texts]
+        try:
+            vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+            for start in range(0, len(texts), self.buffer_rows):
+                chunk = texts[start:start + self.buffer_rows]
+                vectors[start:start + len(chunk)] = self._call(chunk)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.requests += len(batch)
+        offset = 0
+        for item_texts, future in batch:
+            future.set_result(vectors[offset:offset + len(item_texts)])
+            offset += len(item_texts)
+
+    def _call(self, texts: list[str]) -> np.ndarray:
+        """把一批文本发送给工作进程并读取共享内存中的结果；进程崩溃时重启并重试一次"""
+        with self._process_lock:
+            if self._process is None:
+                # 空闲卸载后按需重新启动
+                print("[info]重新启动嵌入工作进程")
+                self._spawn()
+            return self._call_locked(texts)
+
+    def _call_locked(self, texts: list[str]) -> np.ndarray:
+        for attempt in range(2):
+            self._batch_id += 1
+            batch_id = self._batch_id
+            threads = GOVERNOR.threads() if GOVERNOR.enabled else None
+            self._requests.put((batch_id, texts, threads))
+            while True:
+                try:
+                    message = self._responses.get(timeout=0.5)
+                except queue.Empty:
+                    if self._process.is_alive():
+                        continue
+                    self._restart()
+                    break
+                if message[1] != batch_id:
+                    continue
+                if message[0] == "error":
+                    raise RuntimeError(f"嵌入计算失败: {message[2]}")
+                return np.array(self._out[:message[2]])
+        raise RuntimeError("嵌入工作进程多次崩溃，放弃本批请求")
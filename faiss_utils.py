@@ -1,18 +1,106 @@
 # faiss_utils.py
 import os
 import json
+import asyncio
+import contextvars
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import time
+import threading
+from datetime import datetime
+from rerank_utils import CrossEncoderReranker
+from perf_stats import STATS, process_rss_mb
+from resource_governor import GOVERNOR
+from priority_scheduler import SCHEDULER
+from embed_worker import EmbedWorker, load_sentence_model, resolve_model_path, release_model_memory
+from embed_daemon import EmbedDaemonClient, parse_address, format_address
+from modules import message_id
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# 重建与批量添加时每次嵌入计算的消息数
+REBUILD_BATCH = 32
+
+
+def parse_timestamp(timestamp) -> float:
+    """将消息时间戳解析为Unix时间，解析失败时视为当前时间"""
+    try:
+        return datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+class MemoryAttributes:
+    """
+    与索引行一一对应的检索属性数组（时间戳与重要度）
+
+    时间戳在插入时解析一次，检索时直接对NumPy数组做向量化计算
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.importance = np.ones(capacity, dtype=np.float32)
+
+    def _reserve(self, needed: int):
+        capacity = len(self.times)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        times = np.zeros(capacity, dtype=np.float64)
+        importance = np.ones(capacity, dtype=np.float32)
+        times[:self.size] = self.times[:self.size]
+        importance[:self.size] = self.importance[:self.size]
+        self.times, self.importance = times, importance
+
+    def append(self, timestamp, importance: float = 1.0):
+        self._reserve(self.size + 1)
+        self.times[self.size] = parse_timestamp(timestamp)
+        self.importance[self.size] = importance
+        self.size += 1
+
+    @classmethod
+    def from_metadata(cls, metadata: list[dict]):
+        attrs = cls(max(1024, len(metadata)))
+        attrs.size = len(metadata)
+        attrs.times[:attrs.size] = [parse_timestamp(m.get("timestamp")) for m in metadata]
+        attrs.importance[:attrs.size] = [m.get("importance", 1.0) for m in metadata]
+        return attrs
+
+
+def _metadata_item(message_id, role, content, timestamp, importance, vector_idx) -> dict:
+    item = {
+        "id": message_id,
+        "role": role,
+        "content": content,
+        "timestamp": timestamp,
+        "vector_idx": vector_idx
+    }
+    if importance != 1.0:
+        item["importance"] = importance
+    return item
+
+
 class VectorDatabase:
-    def __init__(self, index_dir="./vector_db"):
+    def __init__(self, index_dir="./vector_db", model=None):
         """
         初始化向量数据库
+
+        Args:
+            index_dir: 索引与元数据的保存目录
+            model: 可选，直接传入的嵌入模型（需提供 encode 与 get_sentence_embedding_dimension），
+                   传入时不再加载配置中的模型（用于基准测试）
         """
         self.index_dir = index_dir
         os.makedirs(index_dir, exist_ok=True)
 
+        # 保护索引与元数据的并发读写（预取、回复生成和邮件线程会同时访问）
+        self._lock = threading.RLock()
+        # 串行化写盘（快照在 self._lock 内获取，写文件在锁外进行）
+        self._save_lock = threading.Lock()
+        # 每次重建或清空时递增，用于使检索缓存失效
+        self.generation = 0
+
         # 从配置文件读取模型名称
         try:
             with open('config.json', 'r', encoding='utf-8') as f:
@@ -20,29 +108,54 @@ class VectorDatabase:
             model_name = config.get('model', 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
         except Exception as e:
             print(f"[warning]读取配置文件失败，使用默认模型: {e}")
+            config = {}
             model_name = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
 
-        # 动态生成本地模型路径
-        # 提取模型名称的最后部分作为文件夹名
-        model_folder_name = model_name.split('/')[-1] if '/' in model_name else model_name
-        local_model_path = os.path.join('local_models', model_folder_name)
-
-        print(f"[info]使用模型: {model_name}")
-        print(f"[info]本地路径: {local_model_path}")
-
-        # 检查本地是否有模型，如果没有则下载
-        if os.path.exists(local_model_path):
-            print("[info]使用本地缓存的模型")
-            self.model = SentenceTransformer(local_model_path)
+        # 按上下文限制torch与FAISS的线程数
+        GOVERNOR.configure(config)
+        # 嵌入计算名额：预留一个给交互任务，后台批量写入时检索不必排队
+        SCHEDULER.configure({"embed": config.get("embed_concurrency", 2)}, {"embed": 1})
+
+        # 可选的交叉编码器重排序（第二阶段）
+        self.reranker = None
+        self.rerank_overfetch = config.get('rerank_overfetch', 3)
+        if config.get('rerank_model'):
+            self.reranker = CrossEncoderReranker(
+                config['rerank_model'],
+                budget_ms=config.get('rerank_budget_ms', 150)
+            )
+        # 最近一次检索各阶段耗时（毫秒）
+        self.last_timings = {}
+
+        # 检索打分：similarity 仅按相似度；decay 结合时间衰减与重要度
+        self.scoring = config.get('memory_scoring', 'decay')
+        self.half_life_hours = config.get('memory_half_life_hours', 72)
+        self.recency_weight = config.get('memory_recency_weight', 0.3)
+
+        # 嵌入模型：外部传入 > 共享嵌入服务（已启动时）> 独立工作进程（默认）> 进程内加载
+        self.model_name = model_name
+        self.config = config
+        self._model = None
+        self._model_lock = threading.Lock()
+        # 共享嵌入服务断开时只由一个线程启动本地计算，其余线程等待后重试
+        self._fallback_lock = threading.Lock()
+        # 外部传入的模型不做空闲卸载
+        self._owns_model = model is None
+        self.worker = None
+        self._tokenizer = None
+        if model is not None:
+            print("[info]使用外部传入的嵌入模型")
+            self.model = model
+            self.dimension = self.model.get_sentence_embedding_dimension()
         else:
-            print("[info]首次使用，下载模型中...")
-            self.model = SentenceTransformer(model_name)
-            # 创建目录并保存模型
-            os.makedirs('local_models', exist_ok=True)
-            self.model.save(local_model_path)
-            print(f"[info]模型已保存到: {local_model_path}")
-
-        self.dimension = self.model.get_sentence_embedding_dimension()
+            if config.get('embed_daemon', True):
+                address = parse_address(config.get('embed_daemon_address', ''))
+                self.worker = EmbedDaemonClient.connect(address, model_name)
+                if self.worker is not None:
+                    print(f"[info]使用共享嵌入服务: {format_address(address)}")
+            if self.worker is None:
+                self.worker = self._start_local_backend()
+            self.dimension = self.worker.dimension if self.worker is not None else self.model.get_sentence_embedding_dimension()
 
         # 文件路径
         self.index_path = os.path.join(index_dir, "chat_index.faiss")
@@ -59,122 +172,350 @@ class VectorDatabase:
             self.metadata = []
             print("[info]创建新索引")
 
-    def embed(self, text):
-        """文本向量化 (支持字符串或列表)"""
-        return self.model.encode(text)
+        # 时间戳只在加载/插入时解析一次
+        self.attrs = MemoryAttributes.from_metadata(self.metadata)
+        # 上次保存后是否有未写入磁盘的修改
+        self.dirty = False
+
+        # 空闲卸载：超过设定时间没有嵌入请求时释放模型，下次嵌入时重新加载
+        self.idle_unload_s = config.get('embed_idle_unload_minutes', 30) * 60
+        self.last_embed_time = time.time()
+        self.unloads = 0
+        self._closed = threading.Event()
+        if self.idle_unload_s > 0 and self._owns_model:
+            threading.Thread(target=self._idle_watch, name="embed-idle", daemon=True).start()
+
+    @property
+    def model(self):
+        """进程内的嵌入模型（空闲卸载后在下次访问时重新加载；使用工作进程或共享服务时为None）"""
+        if self._model is None and self.worker is None and self._owns_model:
+            with self._model_lock:
+                if self._model is None:
+                    print("[info]重新加载嵌入模型")
+                    self._model = load_sentence_model(self.model_name)
+        return self._model
+
+    @model.setter
+    def model(self, value):
+        self._model = value
+
+    def _start_local_backend(self):
+        """
+        在本进程启动嵌入计算：独立工作进程（默认）或直接加载模型
 
-    def add_message(self, message_id, role, content, timestamp):
-        """添加消息到向量数据库"""
-        embedding = self.embed([content])[0]
-        self.index.add(np.array([embedding]))
-
-        self.metadata.append({
-            "id": message_id,
-            "role": role,
-            "content": content,
-            "timestamp": timestamp,
-            "vector_idx": self.index.ntotal - 1
-        })
-
-    def rebuild_with_add_message(self, messages):
-        """重建向量数据库"""
-        try:
-            self._rebuilding = True           #标志位
-            print("[info]开始重建向量数据库，方法: add_message")
-            start_time = time.time()
+        Returns:
+            EmbedWorker 或 None（进程内模式，模型已加载到 self.model）
+        """
+        if self.config.get('embed_worker', True):
+            # 模型推理在独立进程中进行，不占用主进程的GIL
+            return EmbedWorker(
+                self.model_name,
+                max_batch=self.config.get('embed_max_batch', 64),
+                batch_wait_ms=self.config.get('embed_batch_wait_ms', 5)
+            ).start()
+        self.model = load_sentence_model(self.model_name)
+        return None
+
+    def _fallback_from_daemon(self, failed, error):
+        """
+        共享嵌入服务不可用时切换到本地计算
 
-            # 创建新的元数据和索引
-            new_metadata = []
+        启动工作进程或加载模型可能需要数秒，在 self._lock 之外进行，检索与写入不被阻塞；
+        完成后在锁内替换后端
+        """
+        with self._fallback_lock:
+            if self.worker is not failed:
+                # 其他线程已完成切换
+                return
+            print(f"[warning]共享嵌入服务不可用，改为本地计算: {error}")
+            local = self._start_local_backend()
+            with self._lock:
+                self.worker = local
+            failed.stop()
+
+    @property
+    def tokenizer(self):
+        """嵌入模型的本地分词器（用于统计上下文token数）"""
+        if self._model is not None:
+            return getattr(self._model, 'tokenizer', None)
+        # 模型在其他进程中或已卸载时单独加载分词器，不加载模型权重
+        if self._tokenizer is None:
+            try:
+                from transformers import AutoTokenizer
+                local_model_path = resolve_model_path(self.model_name)
+                source = local_model_path if os.path.exists(local_model_path) else self.model_name
+                self._tokenizer = AutoTokenizer.from_pretrained(source)
+            except Exception as e:
+                print(f"[warning]加载分词器失败，使用估算的token数: {e}")
+                self._tokenizer = False
+        return self._tokenizer or None
 
-            # 创建新索引
-            dimension = self.model.get_sentence_embedding_dimension()
-            new_index = faiss.IndexFlatL2(dimension)
+    def embed(self, text):
+        """文本向量化 (支持字符串或列表)"""
+        self.last_embed_time = time.time()
+        with SCHEDULER.slot("embed"), STATS.span("embed"):
+            worker = self.worker
+            if worker is None:
+                return self.model.encode(text)
+            try:
+                return worker.encode(text)
+            except OSError as e:
+                if not isinstance(worker, EmbedDaemonClient):
+                    raise
+                self._fallback_from_daemon(worker, e)
+        return self.embed(text)
+
+    async def aembed(self, text):
+        """异步文本向量化（工作进程模式下不占用事件循环线程）"""
+        self.last_embed_time = time.time()
+        worker = self.worker
+        if worker is None or isinstance(worker, EmbedDaemonClient):
+            # run_in_executor 不会复制contextvars，显式传入当前上下文，后台调用方才能以后台优先级占用嵌入名额
+            context = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(None, context.run, self.embed, text)
+        async with SCHEDULER.aslot("embed"):
+            with STATS.span("embed"):
+                return await worker.aencode(text)
+
+    def unload_model(self) -> bool:
+        """
+        释放嵌入模型，下次嵌入时自动重新加载
 
-            # 临时保存当前索引和元数据
-            old_index = self.index
-            old_metadata = self.metadata
+        工作进程模式下直接停止工作进程（模型与torch线程池随进程一起释放）；
+        共享嵌入服务由服务自身管理，不卸载
 
-            # 设置临时索引和元数据用于重建
-            self.index = new_index
-            self.metadata = new_metadata
+        Returns:
+            bool: 是否释放了模型
+        """
+        if not self._owns_model:
+            return False
+        worker = self.worker
+        if isinstance(worker, EmbedWorker):
+            if not worker.unload():
+                return False
+        elif worker is None:
+            with self._model_lock:
+                if self._model is None:
+                    return False
+                self._model = None
+            release_model_memory()
+        else:
+            return False
+        self.unloads += 1
+        print(f"[info]嵌入模型已空闲{(time.time() - self.last_embed_time) / 60:.0f}分钟，已释放")
+        return True
+
+    def _idle_watch(self):
+        interval = max(1.0, min(60.0, self.idle_unload_s / 4))
+        while not self._closed.wait(interval):
+            if time.time() - self.last_embed_time >= self.idle_unload_s:
+                try:
+                    self.unload_model()
+                except Exception as e:
+                    print(f"[error]释放嵌入模型失败: {e}")
+
+    def memory_stats(self) -> dict:
+        """嵌入模型的加载状态与内存占用"""
+        worker = self.worker
+        if not self._owns_model:
+            backend, loaded = "external", True
+        elif isinstance(worker, EmbedWorker):
+            backend, loaded = "worker", worker.pid is not None
+        elif worker is not None:
+            backend, loaded = "daemon", True
+        else:
+            backend, loaded = "in_process", self._model is not None
+        stats = {
+            "backend": backend,
+            "model_loaded": loaded,
+            "idle_s": round(time.time() - self.last_embed_time, 1),
+            "unloads": self.unloads,
+            "rss_mb": process_rss_mb(),
+        }
+        if backend == "worker":
+            stats["worker_rss_mb"] = process_rss_mb(worker.pid) if loaded else 0
+        return stats
+
+    def close(self):
+        """停止嵌入工作进程（或断开共享嵌入服务）"""
+        self._closed.set()
+        if self.worker is not None:
+            self.worker.stop()
+
+    def add_message(self, message_id, role, content, timestamp, importance=1.0):
+        """添加消息到向量数据库（importance为检索时的重要度权重）"""
+        embedding = self.embed([content])[0]
+        with self._lock:
+            self.index.add(np.array([embedding]))
+            self.metadata.append(_metadata_item(message_id, role, content, timestamp, importance,
+                                                self.index.ntotal - 1))
+            self.attrs.append(timestamp, importance)
+            self.dirty = True
+
+    def add_messages(self, messages, batch_size: int = REBUILD_BATCH) -> int:
+        """批量添加聊天记录中的消息（每批一次嵌入计算），返回添加的条数"""
+        for start in range(0, len(messages), batch_size):
+            batch = messages[start:start + batch_size]
+            embeddings = np.asarray(self.embed([msg["content"] for msg in batch]), dtype=np.float32)
+            with self._lock:
+                base = self.index.ntotal
+                self.index.add(embeddings)
+                for offset, msg in enumerate(batch):
+                    importance = msg.get("importance", 1.0)
+                    self.metadata.append(_metadata_item(message_id(msg), msg["role"], msg["content"],
+                                                        msg["timestamp"], importance, base + offset))
+                    self.attrs.append(msg["timestamp"], importance)
+                self.dirty = True
+        return len(messages)
+
+    def ids(self) -> set:
+        """当前索引中全部消息的ID"""
+        with self._lock:
+            return {item["id"] for item in self.metadata}
+
+    def remove_older_than(self, cutoff: float) -> int:
+        """
+        删除时间戳早于 cutoff（Unix时间）的记录，只移除过期的行，不重新计算嵌入
 
-            # 添加所有消息
-            for msg in messages:
-                # 生成唯一ID
-                msg_id = msg.get("id", f"{msg['timestamp']}_{msg['role']}")
+        索引、元数据与检索属性在锁内一次性更新，检索不会看到不一致的中间状态
 
-                # 使用add_message方法添加消息
-                self.add_message(
-                    msg_id,
-                    msg["role"],
-                    msg["content"],
-                    msg["timestamp"]
-                )
+        Returns:
+            int: 删除的条数
+        """
+        with self._lock:
+            size = self.attrs.size
+            expired = np.nonzero(self.attrs.times[:size] < cutoff)[0]
+            if len(expired) == 0:
+                return 0
+            self.index.remove_ids(expired.astype(np.int64))
+            keep = np.ones(size, dtype=bool)
+            keep[expired] = False
+            # 构造新的元数据条目，正在保存的快照不受影响
+            metadata = [{**item, "vector_idx": row}
+                        for row, item in enumerate(item for item, kept in zip(self.metadata, keep) if kept)]
+            attrs = MemoryAttributes(max(1024, len(metadata)))
+            attrs.size = len(metadata)
+            attrs.times[:attrs.size] = self.attrs.times[:size][keep]
+            attrs.importance[:attrs.size] = self.attrs.importance[:size][keep]
+            self.metadata = metadata
+            self.attrs = attrs
+            self.generation += 1
+            self.dirty = True
+        print(f"[info]从向量数据库移除{len(expired)}条过期记录，剩余{len(metadata)}条")
+        return len(expired)
+
+    def _weights(self, times, importance):
+        """时间衰减 × 重要度权重（NumPy数组运算），similarity 打分时全为1"""
+        if self.scoring != 'decay':
+            return np.ones_like(importance, dtype=np.float32)
+        if self.half_life_hours <= 0:
+            return importance
+        age_hours = np.maximum(0.0, time.time() - times) / 3600.0
+        decay = np.exp2(-age_hours / self.half_life_hours)
+        recency = (1.0 - self.recency_weight) + self.recency_weight * decay
+        return recency * importance
 
-            # 保存重建后的数据库
-            self.save()
+    def search(self, query, k=5, threshold=0.4):
+        """相似性搜索"""
+        return self.search_batch([query], k=k, threshold=threshold)
 
-            end_time = time.time()
-            print(f"[info]向量数据库重建完成！用时: {end_time - start_time:.2f}秒")
-            print(f"[info]重建后记录数: {len(self.metadata)}")
+    def search_batch(self, queries, k=5, threshold=0.4):
+        """
+        多查询相似性搜索：一次批量编码、一次Faiss批量检索，合并去重后返回
 
-        except Exception as e:
-            print(f"[error]重建向量数据库出错: {str(e)[:200]}，回滚到原数据库")
-            # 恢复原始索引和元数据
-            self.index = old_index
-            self.metadata = old_metadata
-        finally:
-            self._rebuilding = False
+        Args:
+            queries: 查询文本列表，第一个为主查询（用于重排序）
+            k: 返回结果数
+            threshold: 相似度阈值
 
-    def search(self, query, k=5, threshold=0.4):
-        """相似性搜索"""
+        Returns:
+            list: 按得分排序的结果，同一条记忆只保留得分最高的一次
+        """
+        with GOVERNOR.interactive():
+            return self._search_batch(queries, k, threshold)
+
+    def _search_batch(self, queries, k, threshold):
         # 检查索引是否为空                                                                                              =
         if self.index is None or self.index.ntotal == 0:
             print("[warning]搜索时索引为空")
             return []
 
-        # 检查元数据与索引是否一致
-        if len(self.metadata) != self.index.ntotal:
-            print(f"[error]元数据长度({len(self.metadata)})与索引大小({self.index.ntotal})不一致!")
+        queries = [q for q in queries if q]
+        if not queries:
             return []
 
         try:
-            # 获取查询向量
-            query_embed = self.embed([query])[0]
-            query_vector = np.array([query_embed])
-
-            # Faiss搜索 (返回距离和索引)
-            distances, indices = self.index.search(query_vector, k)
-
-            results = []
-
-            # 遍历所有结果
-            for idx, dist in zip(indices[0], distances[0]):
-                # 跳过无效索引
-                if idx < 0 or idx >= self.index.ntotal:
-                    continue
-
-                # 跳过元数据范围之外
-                if idx >= len(self.metadata):
-                    print(f"[warning]索引 {idx} 超出元数据范围(0-{len(self.metadata) - 1})")
-                    continue
-
-                # 计算相似度
-                similarity = max(0, 1.0 - dist / 10.0)
-
-                if similarity >= threshold:
-                    # 创建结果的副本（避免修改原始元数据）
-                    result = {
-                        "id": self.metadata[idx]["id"],
-                        "role": self.metadata[idx]["role"],
-                        "content": self.metadata[idx]["content"],
-                        "timestamp": self.metadata[idx]["timestamp"],
-                        "similarity": similarity
-                    }
-                    results.append(result)
-
-            # 按相似度排序并返回前k个
-            sorted_results = sorted(results, key=lambda x: x["similarity"], reverse=True)
+            timings = {"queries": len(queries)}
+            start_time = time.perf_counter()
+
+            # 批量获取查询向量
+            query_vectors = np.asarray(self.embed(queries), dtype=np.float32)
+            timings["embed_ms"] = (time.perf_counter() - start_time) * 1000
+
+            # 启用重排序时多取候选；时间衰减打分时也多取一些，让较新的记忆有机会排到前面
+            fetch_k = k * self.rerank_overfetch if self.reranker is not None else k
+            search_k = fetch_k * 2 if self.scoring == 'decay' else fetch_k
+
+            # Faiss批量搜索 (返回距离和索引)
+            stage_start = time.perf_counter()
+            with self._lock:
+                # 检查元数据与索引是否一致（在锁内读取，不会看到更新到一半的状态）
+                if len(self.metadata) != self.index.ntotal:
+                    print(f"[error]元数据长度({len(self.metadata)})与索引大小({self.index.ntotal})不一致!")
+                    return []
+                distances, indices = self.index.search(query_vectors, search_k)
+                metadata = self.metadata
+                attrs = self.attrs
+            timings["search_ms"] = (time.perf_counter() - stage_start) * 1000
+            STATS.record("faiss_search", timings["search_ms"])
+
+            # 向量化计算相似度与综合得分（所有查询的结果展平处理）
+            ids = indices.ravel()
+            dists = distances.ravel()
+            valid = (ids >= 0) & (ids < len(metadata)) & (ids < attrs.size)
+            ids = ids[valid]
+            similarity = np.maximum(0.0, 1.0 - dists[valid] / 10.0)
+            keep = similarity >= threshold
+            ids, similarity = ids[keep], similarity[keep]
+            weights = self._weights(attrs.times[ids], attrs.importance[ids])
+            scores = similarity * weights
+
+            # 多查询合并：按得分降序后，每条记忆只保留第一次出现
+            order = np.argsort(-scores, kind="stable")
+            ids, similarity, weights, scores = ids[order], similarity[order], weights[order], scores[order]
+            _, first = np.unique(ids, return_index=True)
+            first.sort()
+            first = first[:fetch_k]
+
+            # 只为排名靠前的结果构造字典
+            sorted_results = []
+            result_weights = []
+            for pos in first:
+                item = metadata[ids[pos]]
+                sorted_results.append({
+                    "id": item["id"],
+                    "role": item["role"],
+                    "content": item["content"],
+                    "timestamp": item["timestamp"],
+                    "similarity": float(similarity[pos]),
+                    "score": float(scores[pos])
+                })
+                result_weights.append(float(weights[pos]))
+
+            # 第二阶段：交叉编码器重排序，超出预算时保持向量顺序
+            if self.reranker is not None and len(sorted_results) > 1:
+                ranked, rerank_ms = self.reranker.rerank(queries[0], sorted_results)
+                timings["rerank_ms"] = rerank_ms
+                STATS.record("rerank", rerank_ms)
+                timings["rerank_fallback"] = ranked is None
+                if ranked is not None:
+                    # 交叉编码器得分（logit）映射到0~1后同样乘以时间衰减与重要度
+                    for item, weight in zip(sorted_results, result_weights):
+                        item["score"] = float(weight / (1.0 + np.exp(-item["rerank_score"])))
+                    sorted_results = sorted(ranked, key=lambda x: x["score"], reverse=True)
+
+            timings["total_ms"] = (time.perf_counter() - start_time) * 1000
+            self.last_timings = timings
             return sorted_results[:min(k, len(sorted_results))]
 
         except Exception as e:
@@ -182,55 +523,57 @@ class VectorDatabase:
             return []  # 出错时返回空列表
 
     def save(self):
-        """保存索引和元数据"""
-        faiss.write_index(self.index, self.index_path)
-        with open(self.metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(self.metadata, f, ensure_ascii=False, indent=2)
-        print(f"[info]保存向量数据库: {len(self.metadata)}条记录")
+        """保存索引和元数据（只在锁内复制快照，序列化与写文件不阻塞检索和写入）"""
+        with self._save_lock:
+            with self._lock:
+                index_bytes = faiss.serialize_index(self.index)
+                metadata = list(self.metadata)
+                self.dirty = False
+            try:
+                with open(self.index_path, 'wb') as f:
+                    f.write(index_bytes.tobytes())
+                with open(self.metadata_path, 'w', encoding='utf-8') as f:
+                    json.dump(metadata, f, ensure_ascii=False, indent=2)
+            except Exception:
+                # 写入失败时保留未保存标记，下次检查点重试
+                self.dirty = True
+                raise
+        print(f"[info]保存向量数据库: {len(metadata)}条记录")
+
+    def checkpoint(self) -> bool:
+        """有未保存的修改时写入磁盘，返回是否执行了保存"""
+        if not self.dirty:
+            return False
+        self.save()
+        return True
 
     def clear(self):
-        """清空数据库并重建空索引"""
+        """清空数据库并重建空索引（先写入空文件，成功后在锁内一次性替换内存状态）"""
         print("[info]开始清空数据库...")
 
-        try:
-            # 1. 清空内存数据
-            self.index = None
-            self.metadata = []
-
-            # 2. 确保目录存在
-            os.makedirs(self.index_dir, exist_ok=True)
-
-            # 3. 创建新的空索引
-            self.index = faiss.IndexFlatL2(self.dimension)
-
-            # 4. 保存空数据库
-            # 保存索引
-            faiss.write_index(self.index, self.index_path)
-
-            # 保存空元数据
-            with open(self.metadata_path, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=2)
-
-            # 5. 更新内存状态
-            self.metadata = []
-
-            print("[info]向量数据库已完全清空并重建")
-            return True
-        except Exception as e:
-            # 错误处理：尝试恢复可用状态
-            print(f"[error]清空数据库时出错: {e}")
-
-            # 尝试加载之前的数据库（如果存在）
-            if os.path.exists(self.index_path) and os.path.exists(self.metadata_path):
-                try:
-                    self.index = faiss.read_index(self.index_path)
-                    with open(self.metadata_path, 'r', encoding='utf-8') as f:
-                        self.metadata = json.load(f)
-                    print("[info]已恢复之前的数据库状态")
-                except:
-                    print("[error]无法恢复数据库状态")
-
-            return False
+        index = faiss.IndexFlatL2(self.dimension)
+        with self._save_lock:
+            try:
+                os.makedirs(self.index_dir, exist_ok=True)
+                faiss.write_index(index, self.index_path)
+                with open(self.metadata_path, 'w', encoding='utf-8') as f:
+                    json.dump([], f, ensure_ascii=False, indent=2)
+            except Exception as e:
+                # 内存中的数据未改动，标记为未保存，由下次检查点写回一致的文件
+                print(f"[error]清空数据库时出错: {e}")
+                with self._lock:
+                    self.dirty = True
+                return False
+
+            with self._lock:
+                self.index = index
+                self.metadata = []
+                self.attrs = MemoryAttributes()
+                self.generation += 1
+                self.dirty = False
+
+        print("[info]向量数据库已完全清空并重建")
+        return True
 
     def size(self):
         """返回当前存储的消息数量"""
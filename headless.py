@@ -0,0 +1,284 @@
+"""
+无界面核心服务模式
+不依赖PyQt，运行向量数据库、消息处理、AI对话和邮箱监听，并提供本地HTTP/JSON接口：
+
+    POST /v1/message   {"message": "...", "stream": false}
+                       发送消息；stream为true时以SSE（text/event-stream）逐段返回回复
+                       生成失败时返回 {"error": ...}（预算用尽503，其他错误502；流式时为error事件），不保存回复
+    GET  /v1/search?q=...&k=5&threshold=0.4
+                       检索记忆
+    GET  /v1/stats     各阶段延迟统计
+
+用法:
+    python headless.py --host 127.0.0.1 --port 8766
+"""
+
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from faiss_utils import VectorDatabase
+from message_utils import MessageUtils
+from modules import prune_history
+from summary_utils import ConversationSummarizer
+from perf_stats import STATS
+from async_core import ASYNC_CORE
+from resource_governor import GOVERNOR
+from priority_scheduler import SCHEDULER, BACKGROUND
+from job_scheduler import JOBS, Job
+from rate_limiter import RATE_LIMITER
+from response_cache import RESPONSE_CACHE
+from usage_stats import USAGE, BudgetExceededError
+
+
+def load_config() -> dict:
+    try:
+        with open('config.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[error]读取 config.json 时发生错误: {e}")
+        return {}
+
+
+class HeadlessApp:
+    """
+    代替 QApplication 持有共享状态
+
+    MessageUtils 与 EmailMonitor 只通过 app.vector_db 等属性访问应用，
+    因此可以在没有Qt事件循环的情况下直接使用
+    """
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.vector_db = VectorDatabase()
+        self.prefetcher = None
+        self.chat_window = None
+        self.email_monitor = None
+        # 限制同时生成的轮次数，超出的请求排队等待
+        self.turn_slots = threading.BoundedSemaphore(max(1, config.get("headless_max_concurrency", 4)))
+
+    def start(self):
+        """启动时的清理与后台任务（与界面模式一致）"""
+        ASYNC_CORE.start({
+            "llm": self.config.get("llm_concurrency", 2),
+            "io": self.config.get("io_concurrency", 4),
+        }, reserved={"llm": self.config.get("llm_reserved_interactive", 1)})
+        JOBS.configure(self.config)
+        JOBS.start()
+        JOBS.add(Job("retention", self._retention_job, cron=self.config.get("retention_cron", "0 4 * * *"),
+                     run_at_start=True))
+        JOBS.add(Job("checkpoint", self._checkpoint_job,
+                     interval=self.config.get("checkpoint_interval_minutes", 10) * 60))
+        JOBS.add(Job("cache_evict", self._cache_evict_job, interval=300, when_busy="run"))
+
+        if self.config.get("receiveemail", False):
+            # 邮箱监听依赖IMAP与系统通知，只在启用时导入
+            from Automation import EmailMonitor
+            try:
+                with open('data.json', 'r', encoding='utf-8') as f:
+                    check_interval_minutes = json.load(f).get("check_interval", 5)
+            except Exception as e:
+                print(f"[error]读取邮件配置失败，使用默认间隔: {e}")
+                check_interval_minutes = 5
+            self.email_monitor = EmailMonitor("data.json", check_interval_minutes * 60, self, self.vector_db)
+            if self.email_monitor.start(ASYNC_CORE):
+                print(f"[info]邮箱监听已启动，检查间隔: {check_interval_minutes}分钟")
+
+    async def _retention_job(self):
+        await ASYNC_CORE.run_sync(prune_history, self.vector_db, self.config.get("max_day", 7), priority=BACKGROUND)
+
+    async def _checkpoint_job(self):
+        await ASYNC_CORE.run_sync(self.vector_db.checkpoint, priority=BACKGROUND)
+        await ASYNC_CORE.run_sync(USAGE.checkpoint, priority=BACKGROUND)
+
+    async def _cache_evict_job(self):
+        await ASYNC_CORE.run_sync(RESPONSE_CACHE.evict_expired)
+
+    def handle_message(self, message: str, on_delta=None, cancel_event=None):
+        """
+        处理一轮对话：保存用户消息、生成回复并保存
+
+        Returns:
+            str: AI回复；被取消时返回None
+
+        Raises:
+            BudgetExceededError: 今日用量已达到预算
+            Exception: 生成失败（此时不保存回复）
+        """
+        JOBS.mark_activity()
+        with self.turn_slots:
+            mu = MessageUtils(self.vector_db, self)
+            mu.save_message("user", message)
+            response = mu.generate_response(message, cancel_event=cancel_event, on_delta=on_delta, raise_on_error=True)
+            if response is None:
+                return None
+            mu.save_message("assistant", response)
+
+        if self.config.get("summary_enabled", True):
+            summarizer = ConversationSummarizer(self.config)
+            ASYNC_CORE.submit(ASYNC_CORE.run_sync(summarizer.update_exclusive, limit="llm", priority=BACKGROUND))
+        return response
+
+    def search(self, query: str, k: int = 5, threshold: float = None) -> list[dict]:
+        if threshold is None:
+            threshold = self.config.get("cosine_similarity", 0.5)
+        return self.vector_db.search(query, k=k, threshold=threshold)
+
+    def stop(self):
+        JOBS.stop()
+        if self.email_monitor is not None:
+            self.email_monitor.stop()
+        ASYNC_CORE.shutdown(timeout=self.config.get("shutdown_timeout", 5))
+        try:
+            self.vector_db.save()
+        except Exception as e:
+            print(f"[error]保存向量数据库失败: {e}")
+        self.vector_db.close()
+        USAGE.checkpoint()
+        if self.config.get("stats_dump_file"):
+            STATS.dump_json(self.config["stats_dump_file"])
+
+
+class HeadlessHandler(BaseHTTPRequestHandler):
+    core: HeadlessApp = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, message: str, on_delta=None, cancel_event=None):
+        """
+        调用核心处理消息
+
+        Returns:
+            tuple: (回复, 错误信息, HTTP状态码)，成功时错误信息为None
+        """
+        try:
+            return self.core.handle_message(message, on_delta=on_delta, cancel_event=cancel_event), None, 200
+        except BudgetExceededError as e:
+            print(f"[warning]{e}")
+            return None, "今日的API用量已达到预算上限", 503
+        except Exception as e:
+            print(f"[error]生成回复时发生错误: {e}")
+            return None, f"生成回复失败: {e}", 502
+
+    def _send_event(self, data: dict):
+        self.wfile.write(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path == "/v1/stats":
+            self._send_json(200, {
+                "stages": STATS.snapshot(),
+                "memories": self.core.vector_db.size(),
+                "embedding": self.core.vector_db.memory_stats(),
+                "threads": GOVERNOR.stats(),
+                "scheduler": SCHEDULER.stats(),
+                "jobs": JOBS.stats(),
+                "rate_limit": RATE_LIMITER.stats(),
+                "response_cache": RESPONSE_CACHE.stats(),
+                "usage": USAGE.summary(),
+            })
+        elif url.path == "/v1/search":
+            query = params.get("q", [""])[0]
+            if not query:
+                self._send_json(400, {"error": "缺少参数 q"})
+                return
+            try:
+                k = int(params.get("k", ["5"])[0])
+                threshold = float(params["threshold"][0]) if "threshold" in params else None
+            except ValueError:
+                self._send_json(400, {"error": "k 或 threshold 格式错误"})
+                return
+            self._send_json(200, {"results": self.core.search(query, k, threshold)})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/v1/message":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            message = str(request.get("message", "")).strip()
+        except (ValueError, json.JSONDecodeError):
+            self._send_json(400, {"error": "请求体不是有效的JSON"})
+            return
+        if not message:
+            self._send_json(400, {"error": "缺少 message"})
+            return
+
+        if not request.get("stream"):
+            response, error, status = self._handle(message)
+            if error is not None:
+                self._send_json(status, {"error": error})
+            else:
+                self._send_json(200, {"content": response})
+            return
+
+        # 流式返回：客户端断开时取消生成
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        cancel_event = threading.Event()
+
+        def on_delta(delta):
+            if cancel_event.is_set():
+                return
+            try:
+                self._send_event({"delta": delta})
+            except (BrokenPipeError, ConnectionResetError):
+                print("[info]客户端已断开，取消生成")
+                cancel_event.set()
+
+        response, error, _ = self._handle(message, on_delta=on_delta, cancel_event=cancel_event)
+        if cancel_event.is_set() or (response is None and error is None):
+            return
+        try:
+            if error is not None:
+                self._send_event({"error": error})
+            else:
+                self._send_event({"done": True, "content": response})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def main():
+    config = load_config()
+    parser = argparse.ArgumentParser(description="liveAgent 无界面核心服务")
+    parser.add_argument("--host", default=config.get("headless_host", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=config.get("headless_port", 8766))
+    args = parser.parse_args()
+
+    print("[info]初始化中...")
+    core = HeadlessApp(config)
+    core.start()
+
+    handler = type("BoundHeadlessHandler", (HeadlessHandler,), {"core": core})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"[info]无界面服务已启动: http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("[info]正在退出...")
+    finally:
+        server.server_close()
+        core.stop()
+
+
+if __name__ == "__main__":
+    main()
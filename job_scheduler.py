@@ -0,0 +1,258 @@
+"""
+后台任务调度
+在异步调度核心上运行周期任务（记录清理、向量库保存、邮箱检查、缓存清理等）：
+- 支持固定间隔与cron表达式（分 时 日 月 周，支持 * , - /）
+- 每次执行加入随机抖动，避免多个任务同时触发
+- 记录每个任务的上次执行时间、耗时、次数与失败次数
+- 用户正在对话时推迟（或跳过）任务，空闲后再执行
+"""
+
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+from async_core import ASYNC_CORE
+from perf_stats import STATS
+from priority_scheduler import SCHEDULER, BACKGROUND, at_priority
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _parse_cron_field(spec: str, low: int, high: int) -> set:
+    values = set()
+    for part in spec.split(","):
+        step = 1
+        has_step = "/" in part
+        if has_step:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(part)
+            end = high if has_step else start
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"cron字段超出范围: {spec}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """五段cron表达式：分 时 日 月 周（周日为0或7，日与周同时限定时满足其一即可）"""
+
+    def __init__(self, expr: str):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron表达式需要5个字段: {expr}")
+        self.expr = expr
+        self.minutes = _parse_cron_field(fields[0], 0, 59)
+        self.hours = _parse_cron_field(fields[1], 0, 23)
+        self.days = _parse_cron_field(fields[2], 1, 31)
+        self.months = _parse_cron_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in _parse_cron_field(fields[4], 0, 7)}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """moment 之后的下一次触发时间（精确到分钟）"""
+        t = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+            elif t.hour not in self.hours:
+                t = (t + timedelta(hours=1)).replace(minute=0)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"cron表达式没有可触发的时间: {self.expr}")
+
+
+class Job:
+    """一个周期任务"""
+
+    def __init__(self, name: str, func, interval: float = None, cron: str = None, jitter: float = None,
+                 when_busy: str = "defer", max_defer: float = 1800, run_at_start: bool = False):
+        """
+        Args:
+            name: 任务名（唯一）
+            func: 无参数的协程函数
+            interval: 执行间隔（秒），与 cron 二选一
+            cron: cron表达式
+            jitter: 随机推迟的最大秒数，默认间隔任务为间隔的10%，cron任务为60秒
+            when_busy: 用户正在对话时的处理方式：defer 推迟到空闲、skip 跳过本次、run 照常执行
+            max_defer: 最多推迟的秒数，超过后照常执行
+            run_at_start: 启动时先执行一次
+        """
+        if (interval is None) == (cron is None):
+            raise ValueError("interval 与 cron 必须且只能指定一个")
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.cron = CronSchedule(cron) if cron else None
+        if jitter is None:
+            jitter = interval * 0.1 if interval is not None else 60
+        self.jitter = jitter
+        self.when_busy = when_busy
+        self.max_defer = max_defer
+        self.run_at_start = run_at_start
+
+        self.runs = 0
+        self.failures = 0
+        self.deferred = 0
+        self.skipped = 0
+        self.last_run = None
+        self.last_duration_ms = None
+        self.last_error = None
+        self.next_run = None
+
+    def next_delay(self) -> float:
+        """距离下一次执行的秒数（含抖动）"""
+        if self.cron is not None:
+            now = datetime.now()
+            delay = (self.cron.next_after(now) - now).total_seconds()
+        else:
+            delay = self.interval
+        return max(0.0, delay + random.uniform(0, self.jitter))
+
+    def stats(self) -> dict:
+        return {
+            "schedule": self.cron.expr if self.cron is not None else f"every {self.interval:g}s",
+            "runs": self.runs,
+            "failures": self.failures,
+            "deferred": self.deferred,
+            "skipped": self.skipped,
+            "last_run": self.last_run,
+            "last_duration_ms": self.last_duration_ms,
+            "last_error": self.last_error,
+            "next_run": self.next_run,
+        }
+
+
+class JobScheduler:
+    """在异步调度核心上运行周期任务，用户对话期间推迟任务"""
+
+    def __init__(self, core=ASYNC_CORE, idle_seconds: float = 60, busy_poll: float = 5):
+        """
+        Args:
+            idle_seconds: 最近一次用户活动后多少秒内视为正在对话
+            busy_poll: 推迟期间检查是否空闲的间隔（秒）
+        """
+        self.core = core
+        self.idle_seconds = idle_seconds
+        self.busy_poll = busy_poll
+        self.jobs = {}
+        self._futures = {}
+        self._running = False
+        self.last_activity = 0.0
+
+    def configure(self, config: dict):
+        self.idle_seconds = config.get("job_defer_idle_s", self.idle_seconds)
+
+    # ---------- 用户活动 ----------
+
+    def mark_activity(self):
+        """记录一次用户活动（发送消息、输入等）"""
+        self.last_activity = time.monotonic()
+
+    def is_busy(self) -> bool:
+        """用户刚刚有过活动，或有交互任务正在占用资源"""
+        return time.monotonic() - self.last_activity < self.idle_seconds or SCHEDULER.interactive_busy()
+
+    # ---------- 任务管理 ----------
+
+    def add(self, job: Job) -> Job:
+        """注册任务（同名任务会被替换），调度器已启动时立即开始计时"""
+        self.remove(job.name)
+        self.jobs[job.name] = job
+        if self._running:
+            self._launch(job)
+        return job
+
+    def remove(self, name: str):
+        future = self._futures.pop(name, None)
+        if future is not None:
+            future.cancel()
+        self.jobs.pop(name, None)
+
+    def start(self):
+        """启动全部已注册任务（需先启动异步调度核心）"""
+        if self._running:
+            return
+        self._running = True
+        for job in self.jobs.values():
+            self._launch(job)
+
+    def stop(self):
+        self._running = False
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+
+    def run_now(self, name: str):
+        """立即执行一次（不受对话状态影响）"""
+        return self.core.submit(self._execute(self.jobs[name], check_busy=False))
+
+    def stats(self) -> dict:
+        return {name: job.stats() for name, job in self.jobs.items()}
+
+    def _launch(self, job: Job):
+        self._futures[job.name] = self.core.submit(self._runner(job))
+
+    # ---------- 执行 ----------
+
+    async def _runner(self, job: Job):
+        if job.run_at_start:
+            await self._execute(job)
+        while True:
+            delay = job.next_delay()
+            job.next_run = (datetime.now() + timedelta(seconds=delay)).strftime(TIMESTAMP_FORMAT)
+            await asyncio.sleep(delay)
+            await self._execute(job)
+
+    async def _execute(self, job: Job, check_busy: bool = True):
+        if check_busy and job.when_busy != "run" and self.is_busy():
+            if job.when_busy == "skip":
+                job.skipped += 1
+                return
+            job.deferred += 1
+            waited = 0.0
+            while self.is_busy() and waited < job.max_defer:
+                await asyncio.sleep(self.busy_poll)
+                waited += self.busy_poll
+
+        start = time.perf_counter()
+        job.last_run = datetime.now().strftime(TIMESTAMP_FORMAT)
+        try:
+            # 周期任务均以后台优先级占用资源
+            with at_priority(BACKGROUND):
+                await job.func()
+            job.last_error = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.failures += 1
+            job.last_error = str(e)[:200]
+            print(f"[error]周期任务{job.name}执行失败: {e}")
+        finally:
+            job.runs += 1
+            job.last_duration_ms = round((time.perf_counter() - start) * 1000, 1)
+            STATS.record(f"job_{job.name}", job.last_duration_ms)
+
+
+# 进程内共享的任务调度器
+JOBS = JobScheduler()
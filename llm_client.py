@@ -0,0 +1,298 @@
+"""
+异步LLM客户端模块
+基于asyncio的请求层：单次请求截止时间、429/5xx抖动指数退避重试、
+以及可选的对冲请求（超过p95延迟后向同一或备用端点发出重复请求，取先返回者）
+"""
+
+import asyncio
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from types import SimpleNamespace
+
+from openai import AsyncOpenAI, APIStatusError, APITimeoutError, APIConnectionError
+
+from perf_stats import STATS
+from rate_limiter import RATE_LIMITER
+
+
+class LatencyTracker:
+    """记录最近的请求延迟，用于推算对冲等待时间（线程安全）"""
+
+    def __init__(self, size: int = 100):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float):
+        """返回q分位延迟（秒），样本不足时返回None"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < 5:
+            return None
+        pos = min(len(samples) - 1, int(round(q * (len(samples) - 1))))
+        return samples[pos]
+
+
+# 所有AiChat实例共享的延迟统计
+LATENCY = LatencyTracker()
+
+
+def is_retryable(error: Exception) -> bool:
+    """429、5xx、超时与连接错误可以重试"""
+    if isinstance(error, (APITimeoutError, APIConnectionError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _retry_after(error: Exception):
+    """读取服务器返回的Retry-After（秒）"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+# 每个事件循环中每个端点复用一个 AsyncOpenAI 客户端，保持HTTP连接与TLS会话
+# （httpx连接池绑定在创建它的事件循环上，不能跨循环共享）
+_CLIENTS = weakref.WeakKeyDictionary()
+_CLIENTS_LOCK = threading.Lock()
+
+
+def _get_client(endpoint: dict):
+    loop = asyncio.get_running_loop()
+    key = (endpoint["base_url"], endpoint["api_key"])
+    with _CLIENTS_LOCK:
+        clients = _CLIENTS.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=endpoint["api_key"],
+                base_url=endpoint["base_url"],
+                max_retries=0,  # 重试由本模块控制
+            )
+            clients[key] = client
+    return client
+
+
+async def close_clients():
+    """关闭当前事件循环中缓存的客户端（临时事件循环结束前调用）"""
+    with _CLIENTS_LOCK:
+        clients = _CLIENTS.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.close()
+
+
+async def run_and_close_clients(coro):
+    """在临时事件循环（asyncio.run）中执行请求，结束后关闭该循环中的客户端"""
+    try:
+        return await coro
+    finally:
+        await close_clients()
+
+
+class AsyncLLMClient:
+    """带截止时间、重试与对冲的OpenAI兼容客户端"""
+
+    def __init__(self, config: dict):
+        self.timeout = config.get('api_timeout', 60)
+        self.max_retries = config.get('api_max_retries', 2)
+        self.backoff_base = config.get('api_backoff_base', 0.5)
+        self.backoff_max = config.get('api_backoff_max', 8)
+        self.hedge = config.get('api_hedge', False)
+        self.hedge_min_delay = config.get('api_hedge_min_delay', 2.0)
+        # 流式请求可测量首token延迟(TTFT)
+        self.stream = config.get('api_stream', False)
+        # 流式请求要求在最后一个分块中返回用量（不支持 stream_options 的端点可关闭）
+        self.stream_usage = config.get('api_stream_usage', True)
+        # 速率限制由所有实例共享，这里只更新额度配置
+        RATE_LIMITER.configure(config)
+
+        self.primary = {
+            "base_url": config.get('api_baseurl'),
+            "api_key": config.get('apikey'),
+            "model": config.get('api_model', 'gpt-4o'),
+        }
+        # 未配置备用端点时，对冲请求发往主端点
+        self.fallback = {
+            "base_url": config.get('api_fallback_baseurl') or self.primary["base_url"],
+            "api_key": config.get('api_fallback_apikey') or self.primary["api_key"],
+            "model": config.get('api_fallback_model') or self.primary["model"],
+        }
+
+    def hedge_delay(self) -> float:
+        """对冲等待时间：取历史p95延迟，且不低于最小值"""
+        p95 = LATENCY.percentile(0.95)
+        return max(self.hedge_min_delay, p95 or self.timeout / 2)
+
+    async def _request(self, endpoint: dict, messages: list, temperature: float, timeout: float, on_delta=None):
+        client = _get_client(endpoint)
+        if not self.stream and on_delta is None:
+            return await client.chat.completions.create(
+                model=endpoint["model"],
+                messages=messages,
+                temperature=temperature,
+                timeout=timeout,
+            )
+        return await self._stream(client, endpoint, messages, temperature, timeout, on_delta)
+
+    async def _stream(self, client, endpoint: dict, messages: list, temperature: float, timeout: float,
+                      on_delta=None):
+        """流式请求，拼接为与非流式相同结构的响应对象（on_delta会收到每个文本片段）"""
+        start_time = time.perf_counter()
+        first_token = True
+        parts = []
+        usage = None
+        options = {"stream_options": {"include_usage": True}} if self.stream_usage else {}
+        stream = await client.chat.completions.create(
+            model=endpoint["model"],
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+            timeout=timeout,
+            **options,
+        )
+        async for chunk in stream:
+            # 部分服务商会在最后一个分块中附带用量
+            if getattr(chunk, 'usage', None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if first_token:
+                first_token = False
+                STATS.record("llm_ttft", (time.perf_counter() - start_time) * 1000)
+            parts.append(delta)
+            if on_delta is not None:
+                on_delta(delta)
+
+        content = "".join(parts)
+        if usage is None:
+            # 端点未返回用量时按内容估算，速率限制与用量预算仍能计入本次请求
+            usage = RATE_LIMITER.estimate_usage(messages, content)
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    async def _request_with_retry(self, endpoint: dict, messages: list, temperature: float, deadline: float,
+                                  on_delta=None):
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        # 已经输出过片段的流式请求不再重试，避免调用方收到重复内容
+        streamed = []
+
+        def emit(delta):
+            streamed.append(True)
+            on_delta(delta)
+
+        estimated = RATE_LIMITER.estimate(messages)
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError("LLM请求超过截止时间")
+            # 每次尝试（包括重试与对冲）都占用速率额度，等待额度的时间计入截止时间
+            await asyncio.wait_for(RATE_LIMITER.acquire(estimated), remaining)
+            remaining = deadline - loop.time()
+            try:
+                response = await asyncio.wait_for(
+                    self._request(endpoint, messages, temperature, remaining, emit if on_delta else None), remaining
+                )
+            except asyncio.CancelledError:
+                # 被取消的请求（如落后的对冲请求）可能已被服务端计费，不退还额度
+                raise
+            except Exception as e:
+                RATE_LIMITER.refund(estimated)
+                retry_after = _retry_after(e)
+                if isinstance(e, APIStatusError) and e.status_code == 429:
+                    # 服务端限流说明本地额度偏高，所有请求一起暂停
+                    RATE_LIMITER.penalize(retry_after or self.backoff_base)
+                if attempt >= self.max_retries or not is_retryable(e) or streamed:
+                    raise
+                # 全抖动指数退避，服务器给出Retry-After时以其为下限
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                if loop.time() + delay >= deadline:
+                    raise
+                attempt += 1
+                print(f"[warning]LLM请求失败({e.__class__.__name__})，{delay:.2f}秒后第{attempt}次重试")
+                await asyncio.sleep(delay)
+                continue
+            usage = getattr(response, 'usage', None)
+            RATE_LIMITER.settle(estimated, getattr(usage, 'total_tokens', None))
+            return response
+
+    async def complete(self, messages: list, temperature: float, timeout: float = None, on_delta=None):
+        """
+        发送请求并返回完整响应对象
+
+        on_delta: 可选回调，传入时以流式请求并逐段回调文本（此时不发出对冲请求）
+        """
+        loop = asyncio.get_running_loop()
+        start_time = time.perf_counter()
+        deadline = loop.time() + (timeout or self.timeout)
+
+        primary = asyncio.ensure_future(
+            self._request_with_retry(self.primary, messages, temperature, deadline, on_delta)
+        )
+        tasks = [primary]
+        try:
+            if self.hedge and on_delta is None:
+                delay = self.hedge_delay()
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and loop.time() + 0.1 < deadline:
+                    print(f"[info]主请求超过{delay:.2f}秒未返回，发出对冲请求")
+                    tasks.append(asyncio.ensure_future(
+                        self._request_with_retry(self.fallback, messages, temperature, deadline)
+                    ))
+
+            # 取最先成功的结果；先完成的请求失败时继续等待另一个
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        elapsed = time.perf_counter() - start_time
+                        LATENCY.record(elapsed)
+                        STATS.record("llm_total", elapsed * 1000)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # 取消落后的请求，断开其HTTP连接
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run_cancellable(coro, cancel_event, poll_interval: float = 0.05):
+    """
+    运行协程，cancel_event（threading.Event）被置位时取消它
+
+    取消会中断进行中的HTTP请求；被取消时返回None
+    """
+    task = asyncio.ensure_future(coro)
+    while not task.done():
+        if cancel_event.is_set():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            return None
+        await asyncio.wait({task}, timeout=poll_interval)
+    return task.result()
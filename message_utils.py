@@ -1,20 +1,44 @@
-import sys
 import os
+import re
 import json
 
 from ai_part import AiChat
+from usage_stats import BudgetExceededError
 from faiss_utils import VectorDatabase
-from modules import is_json_file_empty
-from datetime import datetime, timedelta
-from PyQt5.QtCore import Qt, QPropertyAnimation, QPoint, QEasingCurve, QTimer, QObject, pyqtSignal
-from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QTextEdit,
-                             QLineEdit, QPushButton, QFrame, QScrollArea,
-                             QSizePolicy, QHBoxLayout, QLabel, QSystemTrayIcon, QMenu)
-from PyQt5.QtGui import QFont, QIcon, QColor, QPainter, QBrush, QLinearGradient, QPalette
+from context_builder import ContextBuilder, TokenCounter, assemble_messages, DEFAULT_LAYOUT
+from modules import is_json_file_empty, HISTORY_LOCK
+from summary_utils import load_summary, SUMMARY_HEADER
+from perf_stats import STATS
+from datetime import datetime
 
 HISTORY_FILE = "chat_history.json"
 DEFAULT_HISTORY = {"messages": []}
 
+# 关键词查询中去除的虚词、代词和常见口语词
+STOP_WORDS = (
+    "那个", "这个", "什么", "怎么", "为什么", "一下", "可以", "能不能", "是不是", "请问", "帮我",
+    "那", "这", "呢", "吗", "吧", "啊", "呀", "嘛", "哦", "的", "了", "着", "过", "是",
+    "我", "你", "他", "她", "它", "们", "请", "把", "被", "和", "与", "就", "也", "都", "还", "又",
+)
+LATIN_STOP_WORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "to", "of", "and", "or", "in", "on",
+    "it", "that", "this", "what", "how", "why", "i", "you", "me", "my", "your", "please", "do", "does",
+}
+
+
+def extract_keywords(text: str) -> str:
+    """去除虚词与标点，得到用于检索的关键词串"""
+    words = []
+    for token in re.findall(r'[A-Za-z0-9_]+|[^\sA-Za-z0-9_\W]+', text):
+        if token.isascii():
+            if token.lower() not in LATIN_STOP_WORDS:
+                words.append(token)
+            continue
+        for stop in STOP_WORDS:
+            token = token.replace(stop, " ")
+        words.extend(token.split())
+    return " ".join(words)
+
 class MessageUtils:
     def __init__(self, vector_db: VectorDatabase, app):
         self.vector_db = vector_db
@@ -28,14 +52,22 @@ class MessageUtils:
             print(f"[error]读取 config.json 时发生错误: {e}")
             self.config = {} 
 
-    def save_message(self, role, content):
-        """保存消息到JSON文件"""
+    def save_message(self, role, content, importance=None):
+        """
+        保存消息到JSON文件
+
+        importance 为记忆检索时的重要度权重，默认按角色读取 memory_importance_user / memory_importance_assistant
+        """
+        if importance is None:
+            importance = self.config.get(f"memory_importance_{role}", 1.0)
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         message = {
             "role": role,
             "content": content,
             "timestamp": timestamp
         }
+        if importance != 1.0:
+            message["importance"] = importance
 
         # 添加到向量数据库
         # 生成唯一ID
@@ -45,90 +77,158 @@ class MessageUtils:
                 msg_id,
                 role,
                 content,
-                timestamp
+                timestamp,
+                importance
             )
 
-        # 读取现有历史记录或创建新的
-        history = DEFAULT_HISTORY.copy()
-        if os.path.exists(HISTORY_FILE):
+        with HISTORY_LOCK, STATS.span("history_io"):
+            # 读取现有历史记录或创建新的
+            history = DEFAULT_HISTORY.copy()
+            if os.path.exists(HISTORY_FILE):
+                try:
+                    with open(HISTORY_FILE, "r", encoding="utf-8") as f:
+                        if is_json_file_empty(HISTORY_FILE):
+                            raise IOError("JSON file is empty")
+                        history = json.load(f)
+                except (json.JSONDecodeError, IOError):
+                    history = DEFAULT_HISTORY
+
+            # 添加新消息
+            history["messages"].append(message)
+
+            # 保存回文件
             try:
-                with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-                    if is_json_file_empty(HISTORY_FILE):
-                        raise IOError("JSON file is empty")
-                    history = json.load(f)
-            except (json.JSONDecodeError, IOError):
-                history = DEFAULT_HISTORY
-
-        # 添加新消息
-        history["messages"].append(message)
-
-        # 保存回文件
+                with open(HISTORY_FILE, "w", encoding="utf-8") as f:
+                    json.dump(history, f, ensure_ascii=False, indent=2)
+            except IOError:
+                pass
+
+
+    def build_queries(self, query: str) -> list[str]:
+        """
+        构造多条检索查询：当前输入、上一条助手回复+当前输入、关键词查询
+
+        追问（如“那第二个呢？”）单独检索往往无效，结合上一轮回复才能召回相关记忆
+        """
+        queries = [query]
+        if not self.config.get('retrieval_multi_query', True):
+            return queries
+
+        # 上一条助手回复 + 当前输入
+        for item in reversed(getattr(self.vector_db, 'metadata', [])[-4:]):
+            if item.get('role') == 'assistant':
+                previous = item.get('content', '')[-200:]
+                queries.append(f"{previous}\n{query}")
+                break
+
+        # 不依赖LLM的关键词查询
+        keywords = extract_keywords(query)
+        if keywords and keywords != query:
+            queries.append(keywords)
+
+        return queries
+
+    def retrieve_memories(self, query: str) -> list[dict]:
+        """从记忆库检索与查询相关的内容（多取一些候选，由上下文组装去重后再截取）"""
+        if not hasattr(self.vector_db, 'search'):
+            return []
         try:
-            with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-                json.dump(history, f, ensure_ascii=False, indent=2)
-        except IOError:
-            pass
+            # 从配置文件读取余弦相似度阈值
+            threshold = self.config.get('cosine_similarity', 0.5)
+            k = self.config.get('context_memory_k', 3) + self.config.get('context_recent_turns', 7) + 1
+            if hasattr(self.vector_db, 'search_batch'):
+                return self.vector_db.search_batch(self.build_queries(query), k=k, threshold=threshold)
+            return self.vector_db.search(query, k=k, threshold=threshold)
+        except Exception as e:
+            print(f"[warning]搜索向量数据库时出错: {e}")
+            # 继续执行，不中断对话流程
+            return []
 
+    def make_messages(self, input: str, n: int = None) -> list[dict]:
+        """生成包含历史与记忆的新对话消息结构（按token预算组装）"""
+        with STATS.span("prompt_assembly"):
+            return self._make_messages(input, n)
 
-    def make_messages(self, input: str, n: int = 7) -> list[dict]:
-        """生成包含历史与记忆的新对话消息结构"""
-        messages = []
+    def _make_messages(self, input: str, n: int = None) -> list[dict]:
         ac = AiChat()
 
-        # 1. 当前用户输入
-        messages.append({
-            "role": "user",
-            "content": input
-        })
-
-        # 2. 最近聊天记录
-        messages.append({
-            "role": "system",
-            "content": "以下是你的最近聊天记录，请参考："
-        })
-
+        if n is None:
+            n = self.config.get('context_recent_turns', 7)
+        budget = self.config.get('context_token_budget', 3000)
+        memory_k = self.config.get('context_memory_k', 3)
+        recent_min = self.config.get('context_recent_min', 2)
+
+        preset_messages = ac.system_message if hasattr(ac, 'system_message') else []
+
+        # 滚动摘要代替最近窗口之外的旧对话
+        summary_messages = []
+        summary = load_summary() if self.config.get('summary_enabled', True) else None
+        if summary and summary.get('content'):
+            summary_messages.append({
+                "role": "system",
+                "content": f"{SUMMARY_HEADER}\n{summary['content']}"
+            })
+
+        # 最近聊天记录（多取几条，以便剔除刚保存的当前输入；合并发送的输入以换行分隔）
+        recent = []
+        recent_limit = n
+        if summary_messages:
+            # 摘要之后、尚未并入摘要的消息都作为原始记录发送
+            recent_limit = n + self.config.get('summary_batch', 4) - 1
         if hasattr(self.vector_db, 'metadata'):
-            meta = self.vector_db.metadata[-n:] if self.vector_db.index.ntotal >= n else self.vector_db.metadata
-            for item in meta:
-                role = item.get('role', 'user')
-                content = item.get('content', '')
-                messages.append({"role": role, "content": content})
-
-        # 3. 从记忆库检索相似内容
-        messages.append({
-            "role": "system",
-            "content": "以下是从你的记忆库中提取的相关信息："
-        })
-
-        if hasattr(self.vector_db, 'search'):
-            try:
-                # 从配置文件读取余弦相似度阈值
-                threshold = self.config.get('cosine_similarity', 0.5)
-                results = self.vector_db.search(input, k=3, threshold=threshold)
-                for res in results:
-                    messages.append({
-                        "role": res.get('role', 'user'),
-                        "content": res.get('content', '')
-                    })
-            except Exception as e:                
-                print(f"[warning]搜索向量数据库时出错: {e}")
-                # 继续执行，不中断对话流程
-
-        # 4. 加入 system prompt
-        if hasattr(ac, 'system_message'):
-            messages.extend(ac.system_message)
-
+            recent = self.vector_db.metadata[-(recent_limit + 1 + input.count('\n')):]
+            if summary_messages:
+                until_id = summary.get('until_id')
+                for pos, item in enumerate(recent):
+                    if item.get('id') == until_id:
+                        recent = recent[pos + 1:]
+                        break
+
+        # 从记忆库检索相似内容（输入时已预取则直接使用）
+        memories = None
+        prefetcher = getattr(self.app, 'prefetcher', None)
+        if prefetcher is not None:
+            memories = prefetcher.get(input)
+        if memories is None:
+            with STATS.span("retrieval"):
+                memories = self.retrieve_memories(input)
+
+        system_messages = preset_messages + summary_messages
+
+        counter = TokenCounter(getattr(self.vector_db, 'tokenizer', None))
+        layout = self.config.get('prompt_layout', DEFAULT_LAYOUT)
+        builder = ContextBuilder(counter, budget=budget, recent_min=recent_min)
+        recent, memories = builder.select(input, system_messages, recent, memories,
+                                          recent_limit=recent_limit, memory_limit=memory_k, layout=layout)
+
+        messages = assemble_messages(layout, input, system_messages, recent, memories)
+
+        print(f"[info]上下文组装完成: {len(messages)}条消息, 约{builder.used_tokens}tokens (预算{budget}, 布局{layout})")
         return messages
     
-    def generate_response(self, message):
-        """生成回复"""
+    def generate_response(self, message, cancel_event=None, on_delta=None, raise_on_error=False):
+        """
+        生成回复（cancel_event被置位时放弃生成并返回None；on_delta用于流式接收回复片段）
+
+        raise_on_error 为True时向上抛出异常，由调用方决定如何提示且不把错误提示保存为回复
+        """
         try:
             ac = AiChat()
             new_message = self.make_messages(message)
-            response = ac.get_message(new_message)
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            response = ac.get_message(new_message, raise_on_error=raise_on_error,
+                                      cancel_event=cancel_event, on_delta=on_delta)
             return response
             
+        except BudgetExceededError as e:
+            if raise_on_error:
+                raise
+            print(f"[warning]{e}")
+            return "抱歉，今日的API用量已达到预算上限，请明天再试或在配置中调整预算。"
         except Exception as e:
+            if raise_on_error:
+                raise
             error_msg = f"生成回复时发生错误: {e}"
             print(f"[error]💥 ========== 回复生成失败 ==========")
             print(f"[error]❌ {error_msg}")
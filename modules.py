@@ -1,5 +1,13 @@
 import json
 import os
+import threading
+from datetime import datetime, timedelta
+
+from resource_governor import GOVERNOR
+from priority_scheduler import BACKGROUND, at_priority
+
+# 保护 chat_history.json 读改写过程的锁（多个线程会同时写入历史记录）
+HISTORY_LOCK = threading.RLock()
 
 def is_json_file_empty(file_path):
     # 检查文件是否存在
@@ -30,4 +38,71 @@ def is_json_file_empty(file_path):
         return len(data) == 0
     else:
         # 其他类型（数字、字符串、布尔值、null）都视为非空
-        return False
\ No newline at end of file
+        return False
+
+
+def is_older_than_given_day(timestamp_str, current_time=None, day=7):
+    # 将时间字符串转为datetime对象
+    timestamp = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
+    # 如果没提供当前时间，则使用当前时间
+    if current_time is None:
+        current_time = datetime.now()
+    # 计算时间差
+    return current_time - timestamp > timedelta(days=day)
+
+
+def message_id(message: dict) -> str:
+    """聊天记录中消息的ID（旧记录没有id字段时与 save_message 的生成规则一致）"""
+    return message.get("id", f"{message['timestamp']}_{message['role']}")
+
+
+def prune_history(vector_db, max_days=7, history_file="chat_history.json"):
+    """
+    清理超过保留天数的聊天记录，并从向量数据库中移除对应的记录（不依赖Qt，界面与无界面模式共用）
+
+    历史文件与向量库在 HISTORY_LOCK 内一起更新，只移除过期的行，不重新计算嵌入；
+    之后按清理后的记录补齐向量库中缺少的消息（如向量库文件被删除）
+
+    Args:
+        vector_db: 向量数据库实例，为None时只清理JSON文件
+        max_days: 保留天数
+        history_file: 聊天记录文件路径
+    """
+    # 第一步：清理JSON文件
+    if is_json_file_empty(history_file):
+        if vector_db is not None:
+            vector_db.clear()
+        return
+
+    with HISTORY_LOCK:
+        with open(history_file, "r", encoding="utf-8") as f:
+            data = json.load(f)    # 过滤超过配置天数的消息
+        current_time = datetime.now()
+        old_count = len(data["messages"])
+        data["messages"] = [
+            msg for msg in data["messages"]
+            if not is_older_than_given_day(msg["timestamp"], current_time, max_days)
+        ]
+        new_count = len(data["messages"])
+        print(f"[info]清理JSON文件: 原始记录数: {old_count}, 清理后记录数: {new_count}")
+
+        # 写回文件
+        if new_count != old_count:
+            with open(history_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+
+        if vector_db is None:
+            print("[warning]向量数据库未初始化，跳过清理")
+            return
+
+        # 第二步：移除向量库中同样过期的记录（与历史文件使用同一截止时间）
+        vector_db.remove_older_than((current_time - timedelta(days=max_days)).timestamp())
+        indexed = vector_db.ids()
+
+    # 第三步：补齐向量库中缺少的记录（正在保存的消息先写入向量库，不会被误判为缺少）
+    missing = [msg for msg in data["messages"] if message_id(msg) not in indexed]
+    if missing:
+        print(f"[info]向量数据库缺少{len(missing)}条记录，正在补齐")
+        with GOVERNOR.background(), at_priority(BACKGROUND):
+            vector_db.add_messages(missing)
+        vector_db.save()
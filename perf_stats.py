@@ -0,0 +1,171 @@
+"""
+性能统计模块
+轻量计时区间 + 内存中的HDR风格直方图（对数分桶，约2%相对精度），
+用于查看各阶段延迟的p50/p95/p99
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 相邻分桶的比例，决定相对精度
+BUCKET_RATIO = 1.02
+_LOG_RATIO = math.log(BUCKET_RATIO)
+# 小于该值（毫秒）的样本统一计入第0桶
+MIN_VALUE_MS = 0.001
+
+# 固定的阶段展示顺序，未列出的阶段排在后面
+STAGE_ORDER = (
+    "embed", "faiss_search", "rerank", "retrieval", "history_io",
+    "prompt_assembly", "llm_ttft", "llm_total", "ui_inject", "live2d_send",
+)
+
+
+def process_rss_mb(pid: int = None):
+    """
+    进程常驻内存（MB）
+
+    安装了psutil时使用psutil，否则读取 /proc（Linux）；都不可用时返回None
+    """
+    pid = pid or os.getpid()
+    try:
+        import psutil
+        return round(psutil.Process(pid).memory_info().rss / 1048576, 1)
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class Histogram:
+    """对数分桶直方图，内存占用与样本数无关"""
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _bucket(self, value: float) -> int:
+        if value <= MIN_VALUE_MS:
+            return 0
+        return int(math.log(value / MIN_VALUE_MS) / _LOG_RATIO) + 1
+
+    @staticmethod
+    def _bucket_value(bucket: int) -> float:
+        """分桶的代表值（上界）"""
+        if bucket == 0:
+            return MIN_VALUE_MS
+        return MIN_VALUE_MS * (BUCKET_RATIO ** bucket)
+
+    def record(self, value: float):
+        bucket = self._bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        target = max(1, math.ceil(q * self.count))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min(self._bucket_value(bucket), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.50), 3),
+            "p95_ms": round(self.percentile(0.95), 3),
+            "p99_ms": round(self.percentile(0.99), 3),
+            "max_ms": round(self.max or 0.0, 3),
+        }
+
+
+class StatsRegistry:
+    """按阶段名称管理直方图（线程安全）"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def record(self, stage: str, ms: float):
+        """记录一个阶段的耗时（毫秒）"""
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.record(ms)
+
+    @contextmanager
+    def span(self, stage: str):
+        """计时区间：with STATS.span("embed"): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = {name: h.summary() for name, h in self._histograms.items()}
+        ordered = {name: stages[name] for name in STAGE_ORDER if name in stages}
+        ordered.update({name: stages[name] for name in sorted(stages) if name not in ordered})
+        return ordered
+
+    def format_table(self) -> str:
+        stages = self.snapshot()
+        if not stages:
+            return "> 暂无统计数据"
+        lines = [f"> {'stage':<16}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)"]
+        for name, s in stages.items():
+            lines.append(
+                f"> {name:<16}{s['count']:>7}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}"
+                f"{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}"
+            )
+        return "\n".join(lines)
+
+    def dump_json(self, path: str, extra: dict = None) -> bool:
+        """将统计结果写入JSON文件"""
+        data = {
+            "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+            "dumped": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "stages": self.snapshot(),
+        }
+        if extra:
+            data.update(extra)
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            return True
+        except Exception as e:
+            print(f"[error]写入统计文件失败: {e}")
+            return False
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self.started = time.time()
+
+
+# 进程内共享的统计实例
+STATS = StatsRegistry()
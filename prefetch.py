@@ -0,0 +1,155 @@
+"""
+检索预取模块
+用户输入时根据草稿在后台预先执行记忆检索，结果按草稿文本缓存，
+发送时若草稿未变或几乎未变即可直接使用
+"""
+
+import re
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+
+# 比较草稿时忽略首尾空白和结尾标点
+TRAILING_PUNCT = re.compile(r'[\s,.!?;:~，。！？；：、…]+$')
+
+
+def normalize_draft(text: str) -> str:
+    """规范化草稿文本作为缓存键"""
+    text = re.sub(r'\s+', ' ', text or '').strip()
+    return TRAILING_PUNCT.sub('', text)
+
+
+class RetrievalPrefetcher:
+    """按草稿文本缓存记忆检索结果"""
+
+    def __init__(self, retrieve, vector_db=None, max_entries: int = 32, ttl: float = 120,
+                 similarity: float = 0.9, min_length: int = 2):
+        """
+        Args:
+            retrieve: 检索函数，接收查询文本并返回检索结果列表
+            vector_db: 向量数据库，用于在重建/清空后使缓存失效
+            max_entries: 缓存条目上限
+            ttl: 缓存有效期（秒）
+            similarity: 视为“几乎未变”的最小文本相似度
+            min_length: 触发预取的最短草稿长度
+        """
+        self.retrieve = retrieve
+        self.vector_db = vector_db
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.min_length = min_length
+
+        self._cache = OrderedDict()     # key -> (results, created, generation)
+        self._inflight = {}             # key -> Future
+        self._latest = None
+        self._lock = threading.Lock()
+        # 单线程执行，新草稿排在旧草稿之后，过时的草稿会被跳过
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self.hits = 0
+        self.misses = 0
+
+    def _generation(self):
+        return getattr(self.vector_db, 'generation', 0)
+
+    def prefetch(self, draft: str):
+        """提交草稿，在后台预先检索"""
+        key = normalize_draft(draft)
+        if len(key) < self.min_length or key.startswith('-'):
+            return
+
+        with self._lock:
+            self._latest = key
+            if key in self._inflight or self._fresh(key):
+                return
+            self._inflight[key] = self._executor.submit(self._run, key, draft)
+
+    def _run(self, key: str, draft: str):
+        try:
+            with self._lock:
+                # 已有更新的草稿，跳过本次检索
+                if self._latest != key:
+                    return None
+            generation = self._generation()
+            results = self.retrieve(draft)
+            with self._lock:
+                self._cache[key] = (results, time.monotonic(), generation)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+            return results
+        except Exception as e:
+            print(f"[warning]预取检索失败: {e}")
+            return None
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _fresh(self, key: str):
+        """返回未过期的缓存结果（调用方需持有锁）"""
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        results, created, generation = entry
+        if time.monotonic() - created > self.ttl or generation != self._generation():
+            del self._cache[key]
+            return None
+        return entry
+
+    def get(self, query: str, wait: float = 1.0):
+        """
+        获取查询对应的预取结果
+
+        Args:
+            query: 最终发送的文本
+            wait: 相同草稿仍在检索中时最多等待的秒数
+
+        Returns:
+            list | None: 命中时返回检索结果，否则返回None
+        """
+        key = normalize_draft(query)
+        with self._lock:
+            entry = self._fresh(key)
+            future = self._inflight.get(key)
+
+        if entry is None and future is not None:
+            try:
+                future.result(timeout=wait)
+            except Exception:
+                pass
+            with self._lock:
+                entry = self._fresh(key)
+
+        if entry is None:
+            # 几乎未变的草稿（如补全了最后一两个字）
+            with self._lock:
+                for cached_key in reversed(list(self._cache.keys())):
+                    if SequenceMatcher(None, cached_key, key).ratio() >= self.similarity:
+                        entry = self._fresh(cached_key)
+                        if entry is not None:
+                            break
+
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        print(f"[info]命中预取的检索结果（累计命中{self.hits}/未命中{self.misses}）")
+        return entry[0]
+
+    def evict_expired(self) -> int:
+        """清除过期或已失效的缓存，返回清除的条数"""
+        with self._lock:
+            now = time.monotonic()
+            generation = self._generation()
+            stale = [key for key, (_, created, gen) in self._cache.items()
+                     if now - created > self.ttl or gen != generation]
+            for key in stale:
+                del self._cache[key]
+        return len(stale)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,238 @@
+"""
+优先级调度
+LLM请求、嵌入计算等共享资源按名称限制并发，等待者按优先级（其次按到达顺序）获得资源：
+- INTERACTIVE: 用户对话轮次、检索
+- BACKGROUND: 邮件摘要、对话摘要、索引重建等
+每种资源可为交互任务预留名额，后台任务最多占用 capacity - reserved 个（至少1个），
+因此对话最多只需等待一个正在进行的后台调用；后台批处理在两批之间调用
+yield_to_interactive 主动让出，直到没有交互任务为止
+当前优先级保存在contextvars中，会随 AsyncCore.run_sync 传入线程池
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+
+from perf_stats import STATS
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+_PRIORITY = contextvars.ContextVar("priority", default=INTERACTIVE)
+
+
+def current_priority() -> int:
+    return _PRIORITY.get()
+
+
+@contextmanager
+def at_priority(level: int):
+    """在当前上下文（线程或协程）中以指定优先级执行：with at_priority(BACKGROUND): ..."""
+    token = _PRIORITY.set(level)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+class _Waiter:
+    """等待资源的请求：线程使用Event，协程使用事件循环中的Future"""
+
+    __slots__ = ("event", "loop", "future", "granted", "cancelled")
+
+    def __init__(self, loop=None, future=None):
+        self.event = threading.Event() if future is None else None
+        self.loop = loop
+        self.future = future
+        self.granted = False
+        self.cancelled = False
+
+    def grant(self):
+        self.granted = True
+        if self.future is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class PrioritySlots:
+    """带优先级与预留名额的计数信号量（线程与协程均可使用）"""
+
+    def __init__(self, name: str, capacity: int, reserved: int = 0):
+        self.name = name
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._seq = itertools.count()
+        self.in_use = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.granted = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.resize(capacity, reserved)
+
+    def resize(self, capacity: int, reserved: int = None):
+        with self._lock:
+            self.capacity = max(1, int(capacity))
+            if reserved is not None:
+                self.reserved = max(0, int(reserved))
+            self._dispatch_locked()
+
+    def background_limit(self) -> int:
+        return max(1, self.capacity - self.reserved)
+
+    def _can_take(self, level: int) -> bool:
+        if sum(self.in_use.values()) >= self.capacity:
+            return False
+        return level == INTERACTIVE or self.in_use[BACKGROUND] < self.background_limit()
+
+    def _dispatch_locked(self):
+        while self._waiters:
+            level, _, waiter = self._waiters[0]
+            if waiter.cancelled:
+                heapq.heappop(self._waiters)
+                continue
+            if not self._can_take(level):
+                break
+            heapq.heappop(self._waiters)
+            self.in_use[level] += 1
+            self.granted[level] += 1
+            waiter.grant()
+
+    def _enqueue(self, level: int, waiter: _Waiter):
+        with self._lock:
+            heapq.heappush(self._waiters, (level, next(self._seq), waiter))
+            self._dispatch_locked()
+
+    def acquire(self, level: int = INTERACTIVE):
+        """阻塞获取一个名额"""
+        start = time.perf_counter()
+        waiter = _Waiter()
+        self._enqueue(level, waiter)
+        waiter.event.wait()
+        self._record_wait(level, start)
+
+    async def acquire_async(self, level: int = INTERACTIVE):
+        """在事件循环中等待一个名额（被取消时放弃排队）"""
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(loop, loop.create_future())
+        self._enqueue(level, waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    # 名额已分配但调用方已取消，直接归还
+                    self.in_use[level] -= 1
+                    self._dispatch_locked()
+                else:
+                    waiter.cancelled = True
+            raise
+        self._record_wait(level, start)
+
+    def release(self, level: int = INTERACTIVE):
+        with self._lock:
+            self.in_use[level] -= 1
+            self._dispatch_locked()
+
+    def _record_wait(self, level: int, start: float):
+        STATS.record(f"{self.name}_wait_{PRIORITY_NAMES[level]}", (time.perf_counter() - start) * 1000)
+
+    def waiting(self, level: int) -> int:
+        with self._lock:
+            return sum(1 for l, _, w in self._waiters if l == level and not w.cancelled)
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "reserved": self.reserved,
+            "in_use": {PRIORITY_NAMES[l]: n for l, n in self.in_use.items()},
+            "waiting": {PRIORITY_NAMES[l]: self.waiting(l) for l in PRIORITY_NAMES},
+            "granted": {PRIORITY_NAMES[l]: n for l, n in self.granted.items()},
+        }
+
+
+class PriorityScheduler:
+    """按名称管理各类资源的优先级名额，未配置的资源不限制"""
+
+    def __init__(self):
+        self.resources = {}
+        self._lock = threading.Lock()
+
+    def configure(self, limits: dict, reserved: dict = None):
+        """
+        设置资源并发上限，reserved 为各资源预留给交互任务的名额
+
+        已存在的资源只调整上限，正在排队的请求不受影响
+        """
+        reserved = reserved or {}
+        with self._lock:
+            for name, capacity in limits.items():
+                if name in self.resources:
+                    self.resources[name].resize(capacity, reserved.get(name))
+                else:
+                    self.resources[name] = PrioritySlots(name, capacity, reserved.get(name, 0))
+
+    @contextmanager
+    def slot(self, name: str, level: int = None):
+        """阻塞占用一个名额：with SCHEDULER.slot("embed"): ...（默认使用当前上下文的优先级）"""
+        slots = self.resources.get(name)
+        if slots is None:
+            yield
+            return
+        level = current_priority() if level is None else level
+        slots.acquire(level)
+        try:
+            yield
+        finally:
+            slots.release(level)
+
+    @asynccontextmanager
+    async def aslot(self, name: str, level: int = None):
+        """协程中占用一个名额：async with SCHEDULER.aslot("llm"): ..."""
+        slots = self.resources.get(name)
+        if slots is None:
+            yield
+            return
+        level = current_priority() if level is None else level
+        await slots.acquire_async(level)
+        try:
+            yield
+        finally:
+            slots.release(level)
+
+    def interactive_busy(self) -> bool:
+        """是否有交互任务正在占用或等待任何资源"""
+        return any(s.in_use[INTERACTIVE] or s.waiting(INTERACTIVE) for s in list(self.resources.values()))
+
+    def yield_to_interactive(self, timeout: float = 30, poll: float = 0.05) -> float:
+        """
+        后台批处理的让出点：等待直到没有交互任务（最多等待 timeout 秒，避免后台任务饿死）
+
+        Returns:
+            float: 实际等待的秒数
+        """
+        start = time.monotonic()
+        while self.interactive_busy() and time.monotonic() - start < timeout:
+            time.sleep(poll)
+        return time.monotonic() - start
+
+    async def ayield_to_interactive(self, timeout: float = 30, poll: float = 0.05) -> float:
+        """yield_to_interactive 的协程版本"""
+        start = time.monotonic()
+        while self.interactive_busy() and time.monotonic() - start < timeout:
+            await asyncio.sleep(poll)
+        return time.monotonic() - start
+
+    def stats(self) -> dict:
+        return {name: slots.stats() for name, slots in list(self.resources.items())}
+
+
+# 进程内共享的优先级调度器
+SCHEDULER = PriorityScheduler()
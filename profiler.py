@@ -0,0 +1,151 @@
+"""
+采样性能分析模块（可选）
+通过环境变量 LIVEAGENT_PROFILE=1 或配置项 profile_enabled 开启。
+后台线程定时采样调用栈，输出 collapsed-stack 格式文件（可直接用 flamegraph.pl / speedscope 查看），
+文件保存在 profiles/ 目录并自动轮换
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_DIR = "profiles"
+PROFILE_ENV = "LIVEAGENT_PROFILE"
+
+
+def _load_config() -> dict:
+    try:
+        with open('config.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def profiling_enabled(config: dict = None) -> bool:
+    """环境变量优先，其次读取配置项 profile_enabled"""
+    env = os.environ.get(PROFILE_ENV, "").strip().lower()
+    if env:
+        return env in ("1", "true", "yes", "on")
+    if config is None:
+        config = _load_config()
+    return bool(config.get("profile_enabled", False))
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """定时采样指定线程（或全部线程）调用栈的低开销分析器"""
+
+    def __init__(self, name: str, thread_id: int = None, interval_ms: float = 5,
+                 out_dir: str = PROFILE_DIR, keep: int = 20):
+        """
+        Args:
+            name: 输出文件名前缀
+            thread_id: 只采样该线程；为None时采样全部线程（以线程名作为栈底）
+            interval_ms: 采样间隔（毫秒）
+            out_dir: 输出目录
+            keep: 同名前缀最多保留的文件数
+        """
+        self.name = name
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.out_dir = out_dir
+        self.keep = keep
+        self.samples = Counter()
+        self._running = False
+        self._thread = None
+        self._start_time = None
+
+    def start(self):
+        self._running = True
+        self._start_time = time.time()
+        self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while self._running:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if self.thread_id is not None and thread_id != self.thread_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.reverse()
+                if self.thread_id is None:
+                    stack.insert(0, names.get(thread_id, str(thread_id)).replace(";", ":"))
+                self.samples[";".join(stack)] += 1
+            time.sleep(self.interval)
+
+    def stop(self):
+        """停止采样并写出文件，返回文件路径"""
+        if not self._running:
+            return None
+        self._running = False
+        self._thread.join(timeout=1)
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._start_time))
+        path = os.path.join(self.out_dir, f"{self.name}-{stamp}-{os.getpid()}-{threading.get_ident()}.collapsed")
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            elapsed = time.time() - self._start_time
+            print(f"[info]性能采样已保存: {path}（{elapsed:.2f}秒, {sum(self.samples.values())}个样本）")
+        except Exception as e:
+            print(f"[error]写入性能采样文件失败: {e}")
+            return None
+
+        self._rotate()
+        return path
+
+    def _rotate(self):
+        """只保留最新的 keep 个同名前缀文件"""
+        try:
+            files = [
+                os.path.join(self.out_dir, f) for f in os.listdir(self.out_dir)
+                if f.startswith(f"{self.name}-") and f.endswith(".collapsed")
+            ]
+            files.sort(key=os.path.getmtime, reverse=True)
+            for old in files[self.keep:]:
+                os.remove(old)
+        except Exception as e:
+            print(f"[warning]清理旧的性能采样文件失败: {e}")
+
+
+def start(name: str, thread_id: int = None):
+    """开启时启动并返回分析器，未开启时返回None"""
+    config = _load_config()
+    if not profiling_enabled(config):
+        return None
+    return SamplingProfiler(
+        name,
+        thread_id=thread_id,
+        interval_ms=config.get("profile_interval_ms", 5),
+        keep=config.get("profile_keep", 20),
+    ).start()
+
+
+@contextmanager
+def profile(name: str, current_thread_only: bool = True):
+    """对一段代码进行采样分析（未开启时无开销）"""
+    profiler = start(name, threading.get_ident() if current_thread_only else None)
+    try:
+        yield profiler
+    finally:
+        if profiler is not None:
+            profiler.stop()
@@ -0,0 +1,199 @@
+"""
+LLM请求速率限制
+所有AiChat实例共享一组令牌桶，同时限制每分钟请求数(RPM)与每分钟token数(TPM)：
+- 请求前按消息长度估算token数并预扣，收到响应后按API返回的用量多退少补
+- 额度不足时按优先级排队：交互请求可以使用全部额度，
+  后台请求（邮件摘要、对话摘要等）只能使用预留部分之外的额度，且有交互请求等待时让行
+- 收到429时按Retry-After暂停所有请求，避免继续触发限流
+桶的状态是进程级的，线程与不同事件循环中的协程均可使用
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+from context_builder import estimate_tokens, MESSAGE_OVERHEAD
+from perf_stats import STATS
+from priority_scheduler import INTERACTIVE, BACKGROUND, PRIORITY_NAMES, current_priority
+
+
+class TokenBucket:
+    """每分钟补满的令牌桶，capacity 为0表示不限制"""
+
+    def __init__(self, capacity: float):
+        self.capacity = 0.0
+        self.level = 0.0
+        self._updated = time.monotonic()
+        self.resize(capacity)
+
+    def resize(self, capacity: float):
+        capacity = max(0.0, float(capacity or 0))
+        if capacity != self.capacity:
+            # 调整上限时保留已用比例
+            ratio = self.level / self.capacity if self.capacity else 1.0
+            self.capacity = capacity
+            self.level = capacity * ratio
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def refill(self, now: float):
+        if not self.unlimited:
+            rate = self.capacity / 60.0
+            self.level = min(self.capacity, self.level + (now - self._updated) * rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, floor: float = 0.0) -> float:
+        """扣除 amount 后剩余不低于 floor 还需等待的秒数（已刷新时调用）"""
+        if self.unlimited:
+            return 0.0
+        # 单次需求超过桶容量时只要求桶满，避免永远等不到
+        need = min(amount + floor, self.capacity)
+        if self.level >= need:
+            return 0.0
+        return (need - self.level) / (self.capacity / 60.0)
+
+    def take(self, amount: float):
+        if not self.unlimited:
+            self.level -= amount
+
+
+class RateLimiter:
+    """RPM与TPM双令牌桶，带交互预留额度（线程安全）"""
+
+    def __init__(self, rpm: int = 0, tpm: int = 0, reserved_ratio: float = 0.2, completion_tokens: int = 500):
+        """
+        Args:
+            rpm: 每分钟请求数上限，0为不限制
+            tpm: 每分钟token数上限，0为不限制
+            reserved_ratio: 预留给交互请求的额度比例，后台请求不能使用
+            completion_tokens: 预扣时估算的输出token数
+        """
+        self._lock = threading.Lock()
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.reserved_ratio = reserved_ratio
+        self.completion_tokens = completion_tokens
+        self.blocked_until = 0.0
+        self.waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.granted = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.throttled = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.rate_limited = 0
+
+    def configure(self, config: dict):
+        """从配置字典（api_rpm、api_tpm 等键）更新额度，已预扣的额度保留"""
+        with self._lock:
+            self.requests.resize(config.get("api_rpm", 0))
+            self.tokens.resize(config.get("api_tpm", 0))
+            self.reserved_ratio = min(0.9, max(0.0, config.get("api_reserved_interactive_ratio", 0.2)))
+            self.completion_tokens = config.get("api_expected_completion_tokens", 500)
+
+    def estimate_prompt(self, messages: list) -> int:
+        """按消息内容估算输入token数"""
+        return sum(estimate_tokens(m.get("content") or "") + MESSAGE_OVERHEAD for m in messages)
+
+    def estimate(self, messages: list) -> int:
+        """请求的预扣token数：消息内容估算加上预期输出"""
+        return self.estimate_prompt(messages) + self.completion_tokens
+
+    def estimate_usage(self, messages: list, reply: str):
+        """API未返回用量时按消息与回复估算，结构与API返回的usage一致"""
+        prompt_tokens = self.estimate_prompt(messages)
+        completion_tokens = estimate_tokens(reply)
+        return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                               total_tokens=prompt_tokens + completion_tokens, estimated=True)
+
+    def _wait_time_locked(self, level: int, tokens: int) -> float:
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if level == BACKGROUND:
+            # 后台请求不能动用预留额度，有交互请求排队时也让行
+            wait = max(
+                wait,
+                self.requests.wait_time(1, self.requests.capacity * self.reserved_ratio),
+                self.tokens.wait_time(tokens, self.tokens.capacity * self.reserved_ratio),
+            )
+            if wait == 0 and self.waiting[INTERACTIVE]:
+                wait = 0.05
+        else:
+            wait = max(wait, self.requests.wait_time(1), self.tokens.wait_time(tokens))
+        if wait == 0:
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.granted[level] += 1
+        return wait
+
+    async def acquire(self, tokens: int, level: int = None, poll: float = 1.0):
+        """
+        等待额度并预扣1个请求与 tokens 个token（默认使用当前上下文的优先级）
+
+        被取消时不扣除额度；调用方可用 asyncio.wait_for 限制等待时间
+        """
+        level = current_priority() if level is None else level
+        start = time.perf_counter()
+        with self._lock:
+            wait = self._wait_time_locked(level, tokens)
+            if wait:
+                self.throttled[level] += 1
+                self.waiting[level] += 1
+        if not wait:
+            return
+        try:
+            while wait:
+                # 其他协程或线程可能同时在等待，分段睡眠后重新检查
+                await asyncio.sleep(min(wait, poll))
+                with self._lock:
+                    wait = self._wait_time_locked(level, tokens)
+        finally:
+            with self._lock:
+                self.waiting[level] -= 1
+            STATS.record(f"llm_rate_wait_{PRIORITY_NAMES[level]}", (time.perf_counter() - start) * 1000)
+
+    def settle(self, estimated: int, actual: int = None):
+        """
+        按实际用量修正预扣的token数
+
+        actual 为None（API未返回用量）时保持估算值
+        """
+        if actual is None:
+            return
+        with self._lock:
+            self.tokens.take(actual - estimated)
+
+    def refund(self, estimated: int):
+        """请求未被处理（失败）时退还预扣的token"""
+        with self._lock:
+            self.tokens.take(-estimated)
+            self.tokens.level = min(self.tokens.level, self.tokens.capacity)
+
+    def penalize(self, seconds: float):
+        """服务器返回429时，在 seconds 秒内暂停所有请求"""
+        with self._lock:
+            self.rate_limited += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            return {
+                "rpm": self.requests.capacity,
+                "tpm": self.tokens.capacity,
+                "requests_available": round(self.requests.level, 1),
+                "tokens_available": round(self.tokens.level),
+                "reserved_ratio": self.reserved_ratio,
+                "blocked_s": round(max(0.0, self.blocked_until - now), 1),
+                "waiting": {PRIORITY_NAMES[l]: n for l, n in self.waiting.items()},
+                "granted": {PRIORITY_NAMES[l]: n for l, n in self.granted.items()},
+                "throttled": {PRIORITY_NAMES[l]: n for l, n in self.throttled.items()},
+                "rate_limited": self.rate_limited,
+            }
+
+
+# 所有AiChat实例共享的速率限制器
+RATE_LIMITER = RateLimiter()
@@ -0,0 +1,111 @@
+"""
+检索重排序模块
+使用本地小型交叉编码器对向量检索的候选结果重新排序，
+在毫秒级预算内完成，超时则退回向量检索顺序
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+
+class CrossEncoderReranker:
+    """带延迟预算的交叉编码器重排序"""
+
+    def __init__(self, model_name: str, budget_ms: float = 150, retry_after: float = 60, max_retry_after: float = 3600):
+        """
+        Args:
+            model_name: 交叉编码器模型名
+            budget_ms: 单次重排序的延迟预算（毫秒）
+            retry_after: 加载失败后多久（秒）再尝试，之后每次失败加倍
+            max_retry_after: 重试间隔上限（秒）
+        """
+        self.model_name = model_name
+        self.budget_ms = budget_ms
+        self.retry_after = retry_after
+        self.max_retry_after = max_retry_after
+        self.model = None
+        self._loading = False
+        # 加载失败（如离线无法下载）后退避，避免每次检索都重新尝试
+        self.load_failures = 0
+        self._failed_at = None
+        self._lock = threading.Lock()
+        # 单线程执行，超时的任务在后台完成后直接丢弃
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self._pending = None
+        self.timeouts = 0
+        self.completed = 0
+
+    def _load(self):
+        """加载交叉编码器（优先使用本地缓存）"""
+        model_folder_name = self.model_name.split('/')[-1]
+        local_model_path = os.path.join('local_models', model_folder_name)
+        try:
+            from sentence_transformers import CrossEncoder
+
+            if os.path.exists(local_model_path):
+                model = CrossEncoder(local_model_path)
+            else:
+                print(f"[info]首次使用重排序模型，下载中: {self.model_name}")
+                model = CrossEncoder(self.model_name)
+                os.makedirs('local_models', exist_ok=True)
+                model.save(local_model_path)
+            self.model = model
+            print(f"[info]重排序模型已加载: {self.model_name}")
+        except Exception as e:
+            self.load_failures += 1
+            self._failed_at = time.monotonic()
+            print(f"[error]加载重排序模型失败，{self._retry_delay():.0f}秒内不再尝试: {e}")
+        finally:
+            self._loading = False
+
+    def _retry_delay(self) -> float:
+        return min(self.max_retry_after, self.retry_after * 2 ** max(0, self.load_failures - 1))
+
+    def ready(self) -> bool:
+        """模型是否可用；未加载时在后台开始加载"""
+        if self.model is not None:
+            return True
+        with self._lock:
+            if self._failed_at is not None and time.monotonic() - self._failed_at < self._retry_delay():
+                return False
+            if not self._loading:
+                self._loading = True
+                threading.Thread(target=self._load, daemon=True).start()
+        return False
+
+    def rerank(self, query: str, candidates: list[dict]):
+        """
+        对候选结果重新排序
+
+        Returns:
+            tuple: (排序后的候选列表或None, 耗时毫秒)。模型未就绪或超出预算时返回None
+        """
+        start_time = time.perf_counter()
+        if not candidates or not self.ready():
+            return None, 0.0
+
+        # 上一次超时的任务仍在运行时直接跳过，避免排队拖慢本次检索
+        if self._pending is not None and not self._pending.done():
+            return None, 0.0
+
+        pairs = [(query, item.get("content", "")) for item in candidates]
+        future = self._executor.submit(self.model.predict, pairs)
+        self._pending = future
+        try:
+            scores = future.result(timeout=self.budget_ms / 1000)
+        except FutureTimeoutError:
+            self.timeouts += 1
+            elapsed = (time.perf_counter() - start_time) * 1000
+            print(f"[warning]重排序超出预算({elapsed:.0f}ms > {self.budget_ms}ms)，使用向量检索顺序")
+            return None, elapsed
+        except Exception as e:
+            print(f"[warning]重排序失败，使用向量检索顺序: {e}")
+            return None, (time.perf_counter() - start_time) * 1000
+
+        self.completed += 1
+        for item, score in zip(candidates, scores):
+            item["rerank_score"] = float(score)
+        ranked = sorted(candidates, key=lambda x: x["rerank_score"], reverse=True)
+        return ranked, (time.perf_counter() - start_time) * 1000
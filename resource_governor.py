@@ -0,0 +1,132 @@
+"""
+CPU资源调节
+按上下文设置torch的intra-op线程数与FAISS的OpenMP线程数，避免嵌入计算和检索占满全部核心：
+- interactive: 单条查询等交互操作，使用少量线程保证延迟
+- background: 重建索引、邮件批量处理等后台任务，限制在一定比例的核心内
+后台线程上限根据界面事件循环的延迟自动调整：延迟超过目标时减少线程，恢复后逐步增加
+两种线程数都是进程级设置，同时存在交互与后台任务时以交互为准
+"""
+
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ResourceGovernor:
+    """线程数调节器（线程安全）"""
+
+    def __init__(self, interactive_threads: int = 4, background_share: float = 0.5,
+                 target_lag_ms: float = 50, enabled: bool = True):
+        """
+        Args:
+            interactive_threads: 交互操作使用的线程数
+            background_share: 后台任务最多使用的核心比例
+            target_lag_ms: 界面事件循环延迟的目标值（毫秒）
+            enabled: 为False时不修改线程数
+        """
+        self.cpu_count = os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._active = {"interactive": 0, "background": 0}
+        self.current = None
+        self.lag_ms = 0.0
+        self.adjustments = 0
+        self._last_adjust = 0.0
+        self.configure(interactive_threads=interactive_threads, background_share=background_share,
+                       target_lag_ms=target_lag_ms, enabled=enabled)
+
+    def configure(self, config: dict = None, **kwargs):
+        """从配置字典（governor_* 键）或关键字参数更新设置"""
+        config = config or {}
+        enabled = kwargs.get("enabled", config.get("governor_enabled", True))
+        interactive = kwargs.get("interactive_threads", config.get("governor_interactive_threads", 4))
+        share = kwargs.get("background_share", config.get("governor_background_share", 0.5))
+        target = kwargs.get("target_lag_ms", config.get("governor_target_lag_ms", 50))
+        with self._lock:
+            self.enabled = enabled
+            self.interactive_threads = max(1, min(self.cpu_count, int(interactive)))
+            self.background_max = max(1, int(self.cpu_count * share))
+            self.background_threads = self.background_max
+            self.target_lag_ms = target
+            self._apply_locked()
+
+    # ---------- 上下文 ----------
+
+    @contextmanager
+    def context(self, kind: str):
+        """with GOVERNOR.context("background"): ...（kind 为 interactive 或 background）"""
+        with self._lock:
+            self._active[kind] += 1
+            self._apply_locked()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active[kind] -= 1
+                self._apply_locked()
+
+    def interactive(self):
+        return self.context("interactive")
+
+    def background(self):
+        return self.context("background")
+
+    def threads(self) -> int:
+        """当前应使用的线程数"""
+        if self._active["background"] and not self._active["interactive"]:
+            return self.background_threads
+        return self.interactive_threads
+
+    def _apply_locked(self):
+        if not self.enabled:
+            return
+        threads = self.threads()
+        if threads == self.current:
+            return
+        self.current = threads
+        # 只调整已经导入的库，不为此导入torch或faiss
+        faiss = sys.modules.get("faiss")
+        if faiss is not None and hasattr(faiss, "omp_set_num_threads"):
+            faiss.omp_set_num_threads(threads)
+        torch = sys.modules.get("torch")
+        if torch is not None:
+            torch.set_num_threads(threads)
+
+    # ---------- 自适应 ----------
+
+    def report_ui_lag(self, lag_ms: float, cooldown: float = 2.0):
+        """
+        报告一次界面事件循环延迟（毫秒），按平滑后的延迟调整后台线程上限
+
+        延迟高于目标时减少一个线程，低于目标一半时增加一个线程，两次调整至少间隔 cooldown 秒
+        """
+        with self._lock:
+            self.lag_ms = 0.8 * self.lag_ms + 0.2 * lag_ms
+            now = time.monotonic()
+            if now - self._last_adjust < cooldown:
+                return
+            if self.lag_ms > self.target_lag_ms and self.background_threads > 1:
+                self.background_threads -= 1
+            elif self.lag_ms < self.target_lag_ms / 2 and self.background_threads < self.background_max:
+                self.background_threads += 1
+            else:
+                return
+            self._last_adjust = now
+            self.adjustments += 1
+            self._apply_locked()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "threads": self.current,
+            "interactive_threads": self.interactive_threads,
+            "background_threads": self.background_threads,
+            "background_max": self.background_max,
+            "ui_lag_ms": round(self.lag_ms, 1),
+            "adjustments": self.adjustments,
+        }
+
+
+# 进程内共享的资源调节器
+GOVERNOR = ResourceGovernor()
@@ -0,0 +1,154 @@
+"""
+LLM响应缓存
+相同模型、温度与消息（规范化后）的请求直接返回已保存的回复，避免重复调用API：
+- 用于邮件摘要等输入可能重复的后台请求（重启后同一封邮件可能再次被摘要）
+- 对话请求不使用缓存（上下文每轮不同，且用户期望重新生成）
+按最近使用顺序淘汰，超过条目上限或有效期的记录会被删除；缓存保存在JSON文件中，重启后仍然有效
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r'\s+', ' ', text or '').strip()
+
+
+def cache_key(model: str, temperature: float, messages: list) -> str:
+    """(模型, 温度, 规范化消息) 的哈希值"""
+    payload = json.dumps({
+        "model": model,
+        "temperature": temperature,
+        "messages": [[m.get("role", ""), _normalize(m.get("content"))] for m in messages],
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """持久化的LRU响应缓存（线程安全）"""
+
+    def __init__(self, path: str = "llm_cache.json", max_entries: int = 500, max_age_days: float = 30,
+                 enabled: bool = True):
+        """
+        Args:
+            path: 缓存文件路径
+            max_entries: 最多保存的条目数
+            max_age_days: 条目有效期（天），0为不过期
+            enabled: 为False时不读写缓存
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> {"content", "created"}
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, config: dict):
+        """从配置字典（response_cache_* 键）更新设置"""
+        with self._lock:
+            self.enabled = config.get("response_cache_enabled", True)
+            self.max_entries = config.get("response_cache_max_entries", 500)
+            self.max_age_days = config.get("response_cache_max_age_days", 30)
+
+    def _expired(self, entry: dict, now: float) -> bool:
+        return bool(self.max_age_days) and now - entry["created"] > self.max_age_days * 86400
+
+    def _load_locked(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+            now = time.time()
+            # 文件中按最近使用顺序保存
+            for key, entry in items:
+                if not self._expired(entry, now):
+                    self._entries[key] = entry
+            print(f"[info]加载响应缓存: {len(self._entries)}条")
+        except Exception as e:
+            print(f"[warning]读取响应缓存失败，使用空缓存: {e}")
+            self._entries.clear()
+
+    def _save_locked(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(list(self._entries.items()), f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"[warning]保存响应缓存失败: {e}")
+
+    def get(self, key: str):
+        """返回缓存的回复文本，未命中或已过期时返回None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._load_locked()
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, time.time()):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["content"]
+
+    def put(self, key: str, content: str):
+        """保存回复并立即写入文件（后台请求频率低，逐条写入开销可以忽略）"""
+        if not self.enabled or not content:
+            return
+        with self._lock:
+            self._load_locked()
+            self._entries[key] = {"content": content, "created": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save_locked()
+
+    def evict_expired(self) -> int:
+        """删除过期条目，返回删除的数量"""
+        with self._lock:
+            if not self._loaded:
+                return 0
+            now = time.time()
+            expired = [key for key, entry in self._entries.items() if self._expired(entry, now)]
+            for key in expired:
+                del self._entries[key]
+            if expired:
+                self._save_locked()
+            return len(expired)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._loaded = True
+            self._save_locked()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+# 进程内共享的响应缓存
+RESPONSE_CACHE = ResponseCache()
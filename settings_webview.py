@@ -113,6 +113,9 @@ class SettingsBridge(QObject):
                     callback.call([False, "配置数据验证失败"])
                 return
             
+            # 与现有配置合并，保留设置页面中未展示的高级配置项
+            form_data = {**self.config, **form_data}
+
             # 保存配置
             success, message = self._save_config(form_data)
             
@@ -344,6 +347,23 @@ class SettingsBridge(QObject):
                 callback.call([False, error_msg])
             return False
     
+    # ==================== 用量统计 ====================
+
+    @pyqtSlot(object, result='QVariant')
+    @pyqtSlot(result='QVariant')
+    def getUsageStats(self, callback=None):
+        """获取最近7天各场景的API用量与今日预算使用情况"""
+        try:
+            from usage_stats import USAGE, FEATURE_NAMES
+            summary = USAGE.summary()
+            summary["feature_names"] = FEATURE_NAMES
+        except Exception as e:
+            print(f"[error]读取用量统计失败: {e}")
+            summary = {"days": {}, "budget": {}, "feature_names": {}}
+        if callback:
+            callback.call([summary])
+        return summary
+
     @pyqtSlot(str)
     def execute_command(self, command):
         """执行命令（用于清除历史记录等操作）"""
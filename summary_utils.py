@@ -0,0 +1,153 @@
+"""
+滚动对话摘要模块
+在后台将最近窗口之外的旧对话增量压缩为摘要，保存在历史记录中，
+由 make_messages 代替旧的原始对话注入上下文
+"""
+
+import os
+import json
+import threading
+from datetime import datetime
+
+from ai_part import AiChat
+from modules import is_json_file_empty, HISTORY_LOCK
+
+HISTORY_FILE = "chat_history.json"
+
+SUMMARY_HEADER = "以下是更早之前对话的摘要："
+SUMMARY_INSTRUCTION = (
+    "你是对话摘要助手。请将【已有摘要】与【新增对话】合并为一段更新后的中文摘要，"
+    "保留用户的偏好、约定、待办事项和重要事实，省略寒暄。"
+    "只输出摘要正文，不超过{max_chars}字。"
+)
+
+# 摘要缓存，避免每轮对话都完整读取历史文件
+_summary_cache = {"mtime": None, "summary": None}
+# 同一时间只允许一个摘要任务运行
+_update_lock = threading.Lock()
+
+
+def _message_id(msg: dict) -> str:
+    return msg.get("id", f"{msg.get('timestamp', '')}_{msg.get('role', '')}")
+
+
+def _read_history() -> dict:
+    if is_json_file_empty(HISTORY_FILE):
+        return {"messages": []}
+    with open(HISTORY_FILE, "r", encoding="utf-8") as f:
+        history = json.load(f)
+    history.setdefault("messages", [])
+    return history
+
+
+def load_summary():
+    """读取当前保存的滚动摘要，不存在时返回None"""
+    try:
+        mtime = os.path.getmtime(HISTORY_FILE)
+    except OSError:
+        return None
+
+    if _summary_cache["mtime"] == mtime:
+        return _summary_cache["summary"]
+
+    try:
+        with HISTORY_LOCK:
+            summary = _read_history().get("summary")
+    except Exception as e:
+        print(f"[warning]读取对话摘要失败: {e}")
+        return None
+
+    _summary_cache["mtime"] = mtime
+    _summary_cache["summary"] = summary
+    return summary
+
+
+def pending_messages(history: dict, window: int) -> list[dict]:
+    """返回已滑出最近窗口、但尚未并入摘要的消息"""
+    messages = history.get("messages", [])
+    older = messages[:-window] if window > 0 else messages
+    summary = history.get("summary") or {}
+    until_id = summary.get("until_id")
+    until_timestamp = summary.get("until_timestamp", "")
+
+    if not until_id:
+        return older
+
+    # 优先按ID定位；若该消息已被定期清理，则按时间戳过滤
+    for pos, msg in enumerate(older):
+        if _message_id(msg) == until_id:
+            return older[pos + 1:]
+    return [msg for msg in older if msg.get("timestamp", "") > until_timestamp]
+
+
+class ConversationSummarizer:
+    """增量维护滚动对话摘要"""
+
+    def __init__(self, config: dict = None):
+        config = config or {}
+        self.window = config.get("context_recent_turns", 7)
+        self.batch = config.get("summary_batch", 4)
+        self.max_chars = config.get("summary_max_chars", 400)
+
+    def _summarize(self, previous: str, messages: list[dict]) -> str:
+        lines = []
+        for msg in messages:
+            role = "用户" if msg.get("role") == "user" else "助手"
+            lines.append(f"[{msg.get('timestamp', '')}] {role}: {msg.get('content', '')}")
+
+        prompt = [
+            {"role": "system", "content": SUMMARY_INSTRUCTION.format(max_chars=self.max_chars)},
+            {"role": "user", "content": f"【已有摘要】\n{previous or '（无）'}\n\n【新增对话】\n" + "\n".join(lines)},
+        ]
+        return AiChat().get_message(prompt, raise_on_error=True, feature="summary")
+
+    def update(self) -> bool:
+        """若有足够多的新旧消息则更新摘要，返回是否发生更新"""
+        with HISTORY_LOCK:
+            history = _read_history()
+        pending = pending_messages(history, self.window)
+        if len(pending) < self.batch:
+            return False
+
+        previous = (history.get("summary") or {}).get("content", "")
+        start_time = datetime.now()
+        try:
+            content = self._summarize(previous, pending).strip()
+        except Exception as e:
+            print(f"[error]生成对话摘要失败: {e}")
+            return False
+        if not content:
+            return False
+        if len(content) > self.max_chars * 2:
+            content = content[:self.max_chars * 2]
+
+        last = pending[-1]
+        summary = {
+            "content": content,
+            "until_id": _message_id(last),
+            "until_timestamp": last.get("timestamp", ""),
+            "updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+        # 重新读取后写回，避免覆盖摘要期间新增的消息
+        with HISTORY_LOCK:
+            history = _read_history()
+            history["summary"] = summary
+            with open(HISTORY_FILE, "w", encoding="utf-8") as f:
+                json.dump(history, f, ensure_ascii=False, indent=2)
+
+        elapsed = (datetime.now() - start_time).total_seconds()
+        print(f"[info]对话摘要已更新: 合并{len(pending)}条消息, 用时{elapsed:.2f}秒")
+        return True
+
+    def update_exclusive(self):
+        """更新摘要，已有更新在进行时直接跳过（可在任意工作线程中调用）"""
+        if not _update_lock.acquire(blocking=False):
+            return False
+        try:
+            return self.update()
+        except Exception as e:
+            print(f"[error]后台摘要任务失败: {e}")
+            return False
+        finally:
+            _update_lock.release()
@@ -5,6 +5,7 @@ UI模块 - 基于WebView的聊天窗口界面组件
 
 import os
 import json
+import time
 import markdown
 from datetime import datetime
 from PyQt5.QtCore import (Qt, QPropertyAnimation, QPoint, QEasingCurve, 
@@ -17,6 +18,7 @@ from PyQt5.QtGui import (QFont, QIcon, QColor, QPainter, QBrush, QPen,
                         QLinearGradient, QPalette, QKeyEvent, QKeySequence, QRegion, QPainterPath)
 from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEngineProfile, QWebEnginePage
 from PyQt5.QtWebChannel import QWebChannel
+from perf_stats import STATS
 
 # 读取配置文件的函数
 def load_config():
@@ -40,6 +42,7 @@ class ChatBridge(QObject):
     """前后端通信桥梁"""
     message_sent = pyqtSignal(str)
     command_executed = pyqtSignal(str)
+    draft_changed = pyqtSignal(str)
     
     def __init__(self):
         super().__init__()
@@ -56,6 +59,11 @@ class ChatBridge(QObject):
         """执行命令"""
         self.command_executed.emit(command)
 
+    @pyqtSlot(str)
+    def update_draft(self, text):
+        """前端输入草稿变化（已防抖），用于预取检索"""
+        self.draft_changed.emit(text)
+
 
 class SolidBackground(QWidget):
     """纯色背景组件"""
@@ -109,6 +117,7 @@ class ChatWebView(QWebEngineView):
     
     message_sent = pyqtSignal(str)
     command_executed = pyqtSignal(str)
+    draft_changed = pyqtSignal(str)
     
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -120,6 +129,7 @@ class ChatWebView(QWebEngineView):
         # Bridge信号连接到ChatWebView信号，提供双重通信机制
         self.bridge.message_sent.connect(self.message_sent.emit)
         self.bridge.command_executed.connect(self.command_executed.emit)
+        self.bridge.draft_changed.connect(self.draft_changed.emit)
         
         # 创建自定义页面（支持控制台消息监听）
         self.custom_page = CustomWebEnginePage(self)
@@ -143,6 +153,8 @@ class ChatWebView(QWebEngineView):
     
     def add_message(self, content, is_user=True, is_thinking=False):
         """添加消息到聊天界面"""
+        inject_start = time.perf_counter()
+
         # 等待页面加载完成
         def wait_and_execute():
             # 检查页面是否加载完成
@@ -177,7 +189,8 @@ class ChatWebView(QWebEngineView):
                     """
                     
                     def on_script_finished(result):
-                        pass  # JavaScript执行结果记录已移除
+                        # 记录从调用到消息渲染进页面的耗时
+                        STATS.record("ui_inject", (time.perf_counter() - inject_start) * 1000)
                     
                     self.page().runJavaScript(script, on_script_finished)
                 else:
@@ -403,6 +416,7 @@ class ChatWindow(QWidget):
     # 信号定义
     message_sent = pyqtSignal(str)      # 用户消息发送信号
     command_executed = pyqtSignal(str)  # 命令执行信号
+    draft_changed = pyqtSignal(str)     # 输入草稿变化信号
     window_hidden = pyqtSignal()        # 窗口隐藏信号
     
     def __init__(self, tray_icon=None):
@@ -547,6 +561,7 @@ class ChatWindow(QWidget):
         # 连接信号 - 使用ChatWebView的信号（ChatWebView已经连接了Bridge和控制台消息）
         self.chat_webview.message_sent.connect(self.message_sent.emit)
         self.chat_webview.command_executed.connect(self.command_executed.emit)
+        self.chat_webview.draft_changed.connect(self.draft_changed.emit)
 
     def _handle_settings(self):
         """处理设置按钮点击"""
@@ -0,0 +1,215 @@
+"""
+LLM用量与费用统计
+按调用场景（chat 对话、email_summary 邮件摘要、summary 对话摘要等）记录每天的
+请求数、输入/输出/缓存命中token数、费用与延迟，保存最近若干天，用于对照实际费用和延迟
+调整提示词长度与检索条数
+可配置每日token或费用预算：后台请求在用量达到预算的一定比例后停止，对话请求到达预算上限才停止
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+
+from perf_stats import STATS
+from priority_scheduler import BACKGROUND, INTERACTIVE, current_priority
+
+FEATURE_NAMES = {
+    "chat": "对话",
+    "email_summary": "邮件摘要",
+    "summary": "对话摘要",
+    "general": "其他",
+}
+
+_COUNTERS = ("calls", "errors", "prompt_tokens", "completion_tokens", "cached_tokens", "cost", "latency_ms_total")
+
+
+class BudgetExceededError(RuntimeError):
+    """今日用量已达到预算，本次请求未发出"""
+
+
+def usage_tokens(usage) -> tuple:
+    """从API返回的usage中读取 (输入, 输出, 缓存命中) token数"""
+    if usage is None:
+        return 0, 0, 0
+    prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+    completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+    # OpenAI: usage.prompt_tokens_details.cached_tokens
+    # DeepSeek: usage.prompt_cache_hit_tokens
+    cached_tokens = None
+    details = getattr(usage, 'prompt_tokens_details', None)
+    if details is not None:
+        cached_tokens = getattr(details, 'cached_tokens', None)
+    if cached_tokens is None:
+        cached_tokens = getattr(usage, 'prompt_cache_hit_tokens', None)
+    return prompt_tokens, completion_tokens, cached_tokens or 0
+
+
+class UsageTracker:
+    """按天、按场景累计的用量记录（线程安全）"""
+
+    def __init__(self, path: str = "usage.json", keep_days: int = 30):
+        """
+        Args:
+            path: 用量文件路径
+            keep_days: 保留最近多少天的记录
+        """
+        self.path = path
+        self.keep_days = keep_days
+        self._lock = threading.Lock()
+        self._days = {}     # "YYYY-MM-DD" -> {feature: {counter: value}}
+        self._loaded = False
+        self.dirty = False
+        self.rejected = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.configure({})
+
+    def configure(self, config: dict):
+        """从配置字典（usage_*、api_price_*、daily_*_budget 键）更新设置"""
+        with self._lock:
+            self.keep_days = config.get("usage_keep_days", self.keep_days)
+            # 价格单位：每百万token
+            self.price_input = config.get("api_price_input_per_mtok", 0)
+            self.price_output = config.get("api_price_output_per_mtok", 0)
+            cached = config.get("api_price_cached_per_mtok", "")
+            self.price_cached = self.price_input if cached in ("", None) else cached
+            self.token_budget = config.get("daily_token_budget", 0)
+            self.cost_budget = config.get("daily_cost_budget", 0)
+            self.background_ratio = config.get("budget_background_ratio", 0.8)
+
+    # ---------- 持久化 ----------
+
+    def _load_locked(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._days = json.load(f).get("days", {})
+        except Exception as e:
+            print(f"[warning]读取用量记录失败，重新开始统计: {e}")
+            self._days = {}
+
+    def _trim_locked(self):
+        for day in sorted(self._days)[:-max(1, self.keep_days)]:
+            del self._days[day]
+
+    def checkpoint(self) -> bool:
+        """有新记录时写入磁盘，返回是否执行了保存"""
+        with self._lock:
+            if not self.dirty:
+                return False
+            self._trim_locked()
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({"days": self._days}, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.path)
+                self.dirty = False
+                return True
+            except Exception as e:
+                print(f"[warning]保存用量记录失败: {e}")
+                return False
+
+    # ---------- 记录 ----------
+
+    def _bucket_locked(self, feature: str) -> dict:
+        self._load_locked()
+        today = self._days.setdefault(datetime.now().strftime("%Y-%m-%d"), {})
+        return today.setdefault(feature, {name: 0 for name in _COUNTERS})
+
+    def cost_of(self, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+        return ((prompt_tokens - cached_tokens) * self.price_input + cached_tokens * self.price_cached
+                + completion_tokens * self.price_output) / 1_000_000
+
+    def record(self, feature: str, usage, latency_ms: float):
+        """记录一次成功的请求（usage 为API返回的用量对象，可为None）"""
+        prompt_tokens, completion_tokens, cached_tokens = usage_tokens(usage)
+        with self._lock:
+            bucket = self._bucket_locked(feature)
+            bucket["calls"] += 1
+            bucket["prompt_tokens"] += prompt_tokens
+            bucket["completion_tokens"] += completion_tokens
+            bucket["cached_tokens"] += cached_tokens
+            bucket["cost"] += self.cost_of(prompt_tokens, completion_tokens, cached_tokens)
+            bucket["latency_ms_total"] += latency_ms
+            self.dirty = True
+        STATS.record(f"llm_{feature}", latency_ms)
+
+    def record_error(self, feature: str):
+        with self._lock:
+            self._bucket_locked(feature)["errors"] += 1
+            self.dirty = True
+
+    # ---------- 预算 ----------
+
+    def _today_locked(self) -> dict:
+        self._load_locked()
+        totals = {name: 0 for name in _COUNTERS}
+        for bucket in self._days.get(datetime.now().strftime("%Y-%m-%d"), {}).values():
+            for name in _COUNTERS:
+                totals[name] += bucket.get(name, 0)
+        return totals
+
+    def budget_used(self) -> float:
+        """今日用量占预算的比例（取token与费用中较高者），未设置预算时为0"""
+        with self._lock:
+            return self._budget_used_locked()
+
+    def _budget_used_locked(self) -> float:
+        totals = self._today_locked()
+        used = 0.0
+        if self.token_budget:
+            used = max(used, (totals["prompt_tokens"] + totals["completion_tokens"]) / self.token_budget)
+        if self.cost_budget:
+            used = max(used, totals["cost"] / self.cost_budget)
+        return used
+
+    def check_budget(self, level: int = None):
+        """
+        请求前检查今日预算（默认使用当前上下文的优先级）
+
+        后台请求在用量达到 budget_background_ratio 后被拒绝，对话请求在达到预算后被拒绝
+
+        Raises:
+            BudgetExceededError: 预算不足
+        """
+        level = current_priority() if level is None else level
+        with self._lock:
+            used = self._budget_used_locked()
+            limit = self.background_ratio if level == BACKGROUND else 1.0
+            if used < limit:
+                return
+            self.rejected[level] += 1
+        raise BudgetExceededError(f"今日API用量已达到预算的{used:.0%}，暂停{'后台' if level == BACKGROUND else ''}请求")
+
+    # ---------- 查询 ----------
+
+    def summary(self, days: int = 7) -> dict:
+        """最近 days 天的用量：每天按场景的明细，以及今日预算使用情况"""
+        with self._lock:
+            self._load_locked()
+            recent = {}
+            for day in sorted(self._days)[-days:]:
+                recent[day] = {}
+                for feature, bucket in self._days[day].items():
+                    item = dict(bucket)
+                    item["cost"] = round(item["cost"], 4)
+                    item["avg_latency_ms"] = round(item["latency_ms_total"] / item["calls"], 1) if item["calls"] else None
+                    del item["latency_ms_total"]
+                    recent[day][feature] = item
+            return {
+                "days": recent,
+                "budget": {
+                    "tokens": self.token_budget,
+                    "cost": self.cost_budget,
+                    "used": round(self._budget_used_locked(), 3),
+                    "background_ratio": self.background_ratio,
+                    "rejected": {"interactive": self.rejected[INTERACTIVE], "background": self.rejected[BACKGROUND]},
+                },
+            }
+
+
+# 进程内共享的用量统计
+USAGE = UsageTracker()
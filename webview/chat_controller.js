@@ -8,6 +8,11 @@ let messageCounter = 0;
 let isThinking = false;
 let currentThinkingElement = null;
 
+// 输入草稿防抖（用于后端预取记忆检索）
+const DRAFT_DEBOUNCE_MS = 400;
+let draftTimer = null;
+let lastDraft = '';
+
 // Markdown转换器（简易版）
 function convertMarkdown(text) {
     if (!text) return '';
@@ -108,6 +113,26 @@ function createMessageElement(content, isUser = false, isThinking = false) {
     return messageDiv;
 }
 
+// 输入停顿后把草稿发给后端，让其提前检索记忆
+function scheduleDraftUpdate(text) {
+    if (draftTimer) {
+        clearTimeout(draftTimer);
+        draftTimer = null;
+    }
+    const draft = text.trim();
+    // 命令和过短的草稿不需要预取
+    if (draft.length < 2 || draft.startsWith('--') || draft === '-s' || draft === lastDraft) {
+        return;
+    }
+    draftTimer = setTimeout(() => {
+        draftTimer = null;
+        if (window.bridge && typeof window.bridge.update_draft === 'function') {
+            lastDraft = draft;
+            window.bridge.update_draft(draft);
+        }
+    }, DRAFT_DEBOUNCE_MS);
+}
+
 // 滚动到底部
 function scrollToBottom() {
     const container = document.getElementById('chat-container');
@@ -240,6 +265,9 @@ function setupInputHandling() {
         } else {
             adjustInputHeight(this);
         }
+
+        // 草稿预取
+        scheduleDraftUpdate(this.value);
     });
     
     // propertychange事件 - IE兼容性（虽然不太需要，但确保兼容性）
@@ -436,6 +464,13 @@ function sendMessage() {
     // ================== UI更新阶段 ==================
     console.log('� [UI_UPDATE] 开始更新界面状态...');
     
+    // 取消尚未发出的草稿预取
+    if (draftTimer) {
+        clearTimeout(draftTimer);
+        draftTimer = null;
+    }
+    lastDraft = '';
+
     // 清空输入框
     messageInput.value = '';
     console.log('🧹 [INPUT_CLEAR] 输入框已清空');
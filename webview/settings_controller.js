@@ -21,6 +21,7 @@ class SettingsController {
                 this.bridge = channel.objects.bridge;
                 console.log('WebChannel连接成功');
                 this.loadSettings(); // 在连接成功后加载设置
+                this.loadUsageStats();
             });
         } else {
             console.log('WebChannel不可用，使用模拟数据');
@@ -126,6 +127,53 @@ class SettingsController {
         }
     }
 
+    /**
+     * 加载今日API用量统计
+     */
+    loadUsageStats() {
+        if (!this.bridge || !this.bridge.getUsageStats) {
+            return;
+        }
+        this.bridge.getUsageStats((result) => {
+            const summary = Array.isArray(result) ? result[0] : result;
+            if (summary && typeof summary === 'object') {
+                this.renderUsageStats(summary);
+            }
+        });
+    }
+
+    /**
+     * 渲染用量表格与预算使用情况
+     */
+    renderUsageStats(summary) {
+        // 按本地日期取今日记录，今天还没有请求时显示空表而不是最近一天的数据
+        const now = new Date();
+        const pad = (n) => String(n).padStart(2, '0');
+        const todayKey = `${now.getFullYear()}-${pad(now.getMonth() + 1)}-${pad(now.getDate())}`;
+        const today = (summary.days || {})[todayKey] || {};
+        const names = summary.feature_names || {};
+        const tbody = document.getElementById('usage-table-body');
+
+        const rows = Object.entries(today).map(([feature, item]) => {
+            const latency = item.avg_latency_ms !== null ? `${item.avg_latency_ms}ms` : '-';
+            return `<tr><td>${names[feature] || feature}</td><td>${item.calls}</td>` +
+                `<td>${item.prompt_tokens}</td><td>${item.completion_tokens}</td>` +
+                `<td>${item.cost}</td><td>${latency}</td></tr>`;
+        });
+        tbody.innerHTML = rows.length > 0
+            ? rows.join('')
+            : '<tr><td colspan="6" class="usage-empty">暂无记录</td></tr>';
+
+        const budget = summary.budget || {};
+        const budgetEl = document.getElementById('usage-budget');
+        if (budget.tokens || budget.cost) {
+            budgetEl.textContent = `今日预算已使用 ${Math.round((budget.used || 0) * 100)}%` +
+                `（后台任务在 ${Math.round(budget.background_ratio * 100)}% 时暂停）`;
+        } else {
+            budgetEl.textContent = '未设置每日预算';
+        }
+    }
+
     /**
      * 加载模拟数据（用于开发测试）
      */